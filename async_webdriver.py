@@ -0,0 +1,217 @@
+import asyncio
+import socket
+import time
+from collections import deque
+
+import aiohttp
+
+from driver_factory import FIREFOX_PREFERENCES, CHROME_EXCLUDE_SWITCHES, EDGE_EXCLUDE_SWITCHES, \
+    firefox_decode_preferences, chromium_decode_arguments
+from logger import logger
+from metrics import registry
+from utility_helpers import config
+
+ELEMENT_KEY = 'element-6066-11e4-a52e-4f735466cecf'  # W3C web element identifier
+WEBDRIVER_EXECUTABLES = {'firefox': 'geckodriver', 'chrome': 'chromedriver', 'edge': 'msedgedriver'}
+WEBDRIVER_START_TIMEOUT = config.get('WEBDRIVER_START_TIMEOUT', 20)
+WEBDRIVER_START_ATTEMPTS = 3  # Ports a WebDriver service is started on before giving up
+SPACE = '\ue00d'  # W3C key code, same as selenium's Keys.SPACE
+
+WEBDRIVER_COMMAND_SECONDS = registry.histogram('webdriver_command_seconds', 'Latency of async WebDriver commands',
+                                               ('command',))
+
+
+class WebDriverError(Exception):
+    def __init__(self, error, message=''):
+        super().__init__(f"{error}: {message}" if message else error)
+        self.error = error
+
+
+class AsyncElement:
+    def __init__(self, driver, element_id):
+        self.driver = driver
+        self.element_id = element_id
+
+    async def is_displayed(self):
+        return await self.driver.command('GET', f'element/{self.element_id}/displayed')
+
+    async def is_enabled(self):
+        return await self.driver.command('GET', f'element/{self.element_id}/enabled')
+
+    async def text(self):
+        return await self.driver.command('GET', f'element/{self.element_id}/text')
+
+    async def send_keys(self, *keys):
+        await self.driver.command('POST', f'element/{self.element_id}/value', {'text': ''.join(keys)})
+
+
+class AsyncWebDriver:
+    """One W3C WebDriver session driven over HTTP from the event loop.
+
+    Talks to geckodriver/chromedriver/msedgedriver (or any W3C endpoint) through its own keep-alive
+    connection pool. The window handle is tracked locally, since this session is its only controller.
+    """
+
+    def __init__(self, driver_url, process=None):
+        self.driver_url = driver_url.rstrip('/')
+        self.process = process  # Driver service started for this session, stopped again by quit()
+        self.session_id = None
+        self.current_window_handle = None
+        self._session = None
+
+    async def start(self, capabilities):
+        connector = aiohttp.TCPConnector(limit=4, keepalive_timeout=300)
+        self._session = aiohttp.ClientSession(connector=connector)
+        value = await self._request('POST', 'session', {'capabilities': {'alwaysMatch': capabilities}}, 'session')
+        self.session_id = value['sessionId']
+        self.current_window_handle = await self.command('GET', 'window')
+        return self
+
+    async def _request(self, method, path, payload, name):
+        started = time.perf_counter()
+        try:
+            async with self._session.request(method, f"{self.driver_url}/{path}", json=payload) as response:
+                body = await response.json(content_type=None)
+        finally:
+            WEBDRIVER_COMMAND_SECONDS.observe(time.perf_counter() - started, command=name)
+        value = body.get('value') if isinstance(body, dict) else None
+        if response.status >= 400:
+            error = value if isinstance(value, dict) else {}
+            raise WebDriverError(error.get('error', f'HTTP {response.status}'), error.get('message', ''))
+        return value
+
+    async def command(self, method, path, payload=None):
+        return await self._request(method, f"session/{self.session_id}/{path}", payload, path.split('/', 1)[0])
+
+    async def get(self, url):
+        await self.command('POST', 'url', {'url': url})
+
+    async def execute_script(self, script, *args):
+        return await self.command('POST', 'execute/sync', {'script': script, 'args': list(args)})
+
+    async def execute_async_script(self, script, *args):
+        return await self.command('POST', 'execute/async', {'script': script, 'args': list(args)})
+
+    async def find_elements(self, selector):
+        found = await self.command('POST', 'elements', {'using': 'css selector', 'value': selector})
+        return [AsyncElement(self, element[ELEMENT_KEY]) for element in found]
+
+    async def new_window(self, kind='tab'):
+        """Open a tab or a window and switch to it, like selenium's switch_to.new_window()."""
+        value = await self.command('POST', 'window/new', {'type': kind})
+        await self.switch_to_window(value['handle'])
+        return value['handle']
+
+    async def switch_to_window(self, handle):
+        await self.command('POST', 'window', {'handle': handle})
+        self.current_window_handle = handle
+
+    async def set_window_rect(self, x, y, width, height):
+        await self.command('POST', 'window/rect', {'x': x, 'y': y, 'width': width, 'height': height})
+
+    async def quit(self):
+        try:
+            if self.session_id is not None:
+                await self._request('DELETE', f"session/{self.session_id}", None, 'quit')
+        except (WebDriverError, aiohttp.ClientError) as e:
+            logger.debug(f"Error ending WebDriver session: {e}")
+        finally:
+            if self._session is not None:
+                await self._session.close()
+            if self.process is not None and self.process.returncode is None:
+                self.process.terminate()
+                await self.process.wait()
+
+
+def webdriver_capabilities(driver_name, profile_dir=None, kiosk=True, quality=None, script_timeout=None):
+    """W3C capabilities matching what create_driver sets up through selenium's option classes."""
+    args = ['--kiosk'] if kiosk else []
+    if driver_name == 'firefox':
+        if profile_dir:
+            args += ['-profile', profile_dir]
+        capabilities = {'browserName': 'firefox', 'moz:firefoxOptions': {
+            'args': args, 'prefs': {**FIREFOX_PREFERENCES, **firefox_decode_preferences(quality)}}}
+    elif driver_name in ('chrome', 'edge'):
+        if profile_dir:
+            args.append(f'--user-data-dir={profile_dir}')
+        options = {'args': args + chromium_decode_arguments(quality), 'useAutomationExtension': False,
+                   'excludeSwitches': CHROME_EXCLUDE_SWITCHES if driver_name == 'chrome' else EDGE_EXCLUDE_SWITCHES}
+        capabilities = ({'browserName': 'chrome', 'goog:chromeOptions': options} if driver_name == 'chrome'
+                        else {'browserName': 'MicrosoftEdge', 'ms:edgeOptions': options})
+    else:
+        raise ValueError(f"Unsupported driver: {driver_name}")
+    if script_timeout:
+        capabilities['timeouts'] = {'script': int(script_timeout * 1000)}
+    return capabilities
+
+
+_handed_out_ports = deque(maxlen=256)  # Recent free_port() results, not handed to a second service
+
+
+def free_port():
+    """A port nothing listens on right now and that this process did not hand out recently."""
+    while True:
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        if port not in _handed_out_ports:
+            _handed_out_ports.append(port)
+            return port
+
+
+async def start_driver_service(driver_name, attempts=WEBDRIVER_START_ATTEMPTS):
+    """Launch the browser's WebDriver service on a free port and wait until it accepts sessions.
+
+    The port is only known to be free until the probe socket closes, so another program can bind it before
+    the service does. The service then exits, and it is started again on another port.
+    """
+    executable = WEBDRIVER_EXECUTABLES[driver_name]
+    for attempt in range(attempts):
+        port = free_port()
+        process = await asyncio.create_subprocess_exec(executable, f'--port={port}',
+                                                       stdout=asyncio.subprocess.DEVNULL,
+                                                       stderr=asyncio.subprocess.DEVNULL)
+        url = f"http://127.0.0.1:{port}"
+        if await wait_for_service(url, process):
+            return url, process
+        if process.returncode is None:
+            process.terminate()
+            raise WebDriverError('session not created', f"{executable} did not start")
+        logger.warning(f"{executable} exited on port {port} (exit code {process.returncode}), "
+                       f"which is probably taken; retrying on another port")
+    raise WebDriverError('session not created', f"{executable} exited on {attempts} ports in a row")
+
+
+async def wait_for_service(url, process):
+    """True once the service at url reports ready; False if it exits first or WEBDRIVER_START_TIMEOUT passes.
+
+    A ready answer only counts while process is still running, since it may come from whatever holds the port.
+    """
+    deadline = time.monotonic() + WEBDRIVER_START_TIMEOUT
+    # A short timeout per check, so a port held by something that never answers does not stall the wait
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=1)) as session:
+        while time.monotonic() < deadline and process.returncode is None:
+            try:
+                async with session.get(f"{url}/status") as response:
+                    if (await response.json(content_type=None)).get('value', {}).get('ready'):
+                        await asyncio.sleep(0.1)  # Long enough for a service that lost the port to exit
+                        if process.returncode is None:
+                            return True
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                pass
+            await asyncio.sleep(0.1)
+    return False
+
+
+async def create_async_driver(driver_name, profile_dir=None, kiosk=True, quality=None, script_timeout=None):
+    """Start a WebDriver service and a browser session on it; geckodriver serves one session per process."""
+    logger.info(f"Creating async driver for: {driver_name}")
+    url, process = await start_driver_service(driver_name)
+    driver = AsyncWebDriver(url, process)
+    try:
+        await driver.start(webdriver_capabilities(driver_name, profile_dir, kiosk, quality, script_timeout))
+    except Exception:
+        await driver.quit()
+        raise
+    logger.info(f"Async driver for {driver_name} created.")
+    return driver
@@ -0,0 +1,573 @@
+import asyncio
+import contextlib
+import os
+import sys
+import tempfile
+import time
+
+from cacher import CacheManager
+
+
+@contextlib.contextmanager
+def temporary_cache(filename, initial_cache=None):
+    """A CacheManager installed as the shared cache for the block, then closed and replaced by the previous one.
+
+    Closing flushes it while its directory still exists and drops it from the exit-time flush. The shared
+    QuotaBudget persists itself to the cache, so the block gets a fresh one that is dropped with the cache.
+    """
+    import cacher
+    import refresh_scheduler
+
+    previous = cacher._cache_manager
+    cache_manager = CacheManager(initial_cache or {}, filename=filename)
+    cacher.set_cache_manager(cache_manager)
+    try:
+        with patched((refresh_scheduler, '_quota_budget', None)):
+            yield cache_manager
+    finally:
+        cache_manager.close()
+        cacher.set_cache_manager(previous)
+
+
+@contextlib.contextmanager
+def patched(*patches):
+    """Set (object, attribute, value) patches for the block and put the original values back after it."""
+    originals = [(target, name, getattr(target, name)) for target, name, _ in patches]
+    try:
+        for target, name, value in patches:
+            setattr(target, name, value)
+        yield
+    finally:
+        for target, name, value in reversed(originals):
+            setattr(target, name, value)
+
+
+def make_cache(size):
+    return {'viewCount': {
+        'last_updated': '2024-01-01',
+        'urls': [f"https://www.youtube.com/embed/video{i:08d}" for i in range(size)],
+        'last_page_token': 'TOKEN'
+    }}
+
+
+def bench_cache_save(sizes=(100, 1000, 10000, 100000), saves=200):
+    """Average cost of a CacheManager.save_to_cache call, for growing cache sizes."""
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            filename = os.path.join(directory, f"cache_{size}.json")
+            cache = CacheManager(make_cache(size), filename=filename, flush_interval=60)
+            started = time.perf_counter()
+            for i in range(saves):
+                cache.save_to_cache({'last_updated': '2024-01-01', 'urls': [f"live{i}"], 'last_page_token': None},
+                                    key='live')
+            elapsed = time.perf_counter() - started
+            flush_started = time.perf_counter()
+            cache.close()
+            results[size] = (elapsed / saves, time.perf_counter() - flush_started)
+    return results
+
+
+def report_cache_save():
+    print("cache size | save_to_cache (us/call) | flush (ms)")
+    for size, (per_save, flush) in bench_cache_save().items():
+        print(f"{size:>10} | {per_save * 1e6:>23.1f} | {flush * 1e3:>10.2f}")
+
+
+def bench_cache_pages(sizes=(1000, 10000, 100000), pages=20, page_size=50):
+    """Cost of adding one popular page with update_and_save_cache, JSON vs SQLite, for growing catalogues.
+
+    The JSON manager flushes on every save here so both backends pay for durability per page.
+    """
+    from cache_store import SqliteCacheManager
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            json_cache = CacheManager(make_cache(size), filename=os.path.join(directory, f"pages_{size}.json"),
+                                      flush_interval=0)
+            sqlite_cache = SqliteCacheManager(os.path.join(directory, f"pages_{size}.db"))
+            sqlite_cache.update_and_save_cache(make_cache(size)['viewCount']['urls'], 'TOKEN', 'viewCount')
+            timings = []
+            for cache in (json_cache, sqlite_cache):
+                started = time.perf_counter()
+                for page in range(pages):
+                    urls = [f"https://www.youtube.com/embed/new{page:04d}{i:04d}" for i in range(page_size)]
+                    cache.update_and_save_cache(urls, f'TOKEN{page}', 'viewCount')
+                timings.append((time.perf_counter() - started) / pages)
+            json_cache.close()
+            sqlite_cache.close()
+            results[size] = tuple(timings)
+    return results
+
+
+def report_cache_pages():
+    print("catalogue size | json (ms/page) | sqlite (ms/page)")
+    for size, (json_page, sqlite_page) in bench_cache_pages().items():
+        print(f"{size:>14} | {json_page * 1e3:>14.2f} | {sqlite_page * 1e3:>16.2f}")
+
+
+def bench_switch_latency(switches=5, preload=True):
+    """Seconds from play_video() being called until the new video's first frame, against a FakeBrowser."""
+    import monitor_manager
+    from fakes import FakeBrowser
+
+    browser = FakeBrowser()
+    urls = [f"https://www.youtube.com/embed/video{i}" for i in range(switches + 1)]
+    latencies = []
+    with patched((monitor_manager, 'PRELOAD_NEXT_VIDEO', preload)):
+        monitor = monitor_manager.Monitor(browser)
+        monitor.play_video(urls[0])
+        for url in urls[1:]:
+            monitor.preload(url)
+            time.sleep(browser.player_delay + browser.frame_delay)  # Let the previous video play for a while
+            started = time.monotonic()
+            monitor.play_video(url)
+            latencies.append(max(browser.first_frame_at(), time.monotonic()) - started)
+    return latencies
+
+
+def report_switch_latency():
+    print("mode      | mean switch latency (ms) | max (ms)")
+    for preload in (False, True):
+        latencies = bench_switch_latency(preload=preload)
+        mode = 'preload' if preload else 'reload'
+        print(f"{mode:<9} | {sum(latencies) / len(latencies) * 1e3:>24.1f} | {max(latencies) * 1e3:>8.1f}")
+
+
+def bench_scheduler(refreshes=10000, live=20, popular=500, screens=6):
+    """Push the same live list repeatedly while screens keep switching; report throughput and heap size."""
+    from scheduler import VideoScheduler
+
+    scheduler = VideoScheduler(cooldown=0)
+    for i in range(popular):
+        scheduler.push(f"https://www.youtube.com/embed/popular{i}", 1)
+    live_urls = [f"https://www.youtube.com/embed/live{i}" for i in range(live)]
+    heap_sizes = []
+    started = time.perf_counter()
+    for refresh in range(refreshes):
+        for url in live_urls:
+            scheduler.push(url, 0)
+        scheduler.pop_for(refresh % screens)
+        if refresh % (refreshes // 10) == 0:
+            heap_sizes.append(len(scheduler._heap))
+    elapsed = time.perf_counter() - started
+    return (refreshes * (live + 1)) / elapsed, heap_sizes
+
+
+def report_scheduler():
+    ops, heap_sizes = bench_scheduler()
+    print(f"scheduler: {ops:,.0f} ops/s, heap size over time: {heap_sizes}")
+
+
+def fake_api_patches(api):
+    """Patches pointing the API client and the live detector at a FakeYouTubeApi, for patched()."""
+    import monitor_manager
+    import youtube_api
+    import yt_scrape
+
+    return ((youtube_api, 'API_KEY', 'fake-key'), (youtube_api.api_client, 'base_url', api.search_url),
+            (yt_scrape, 'YOUTUBE_URL', api.url), (monitor_manager, 'REFRESH_INTERVAL', 1))
+
+
+def _metric_totals(name):
+    from metrics import registry
+
+    metric = registry.metrics.get(name)
+    return metric.snapshot() if metric else {}
+
+
+async def run_wall(duration=60, screens=6, video_duration=8.0, api_latency=0.05, api_error_rate=0.05,
+                   sample_interval=0.05, broken_videos=(), backend='selenium'):
+    """Drive MonitorManager end to end against FakeBrowsers, fake screens and a local fake YouTube API.
+
+    With backend='async' the screens are AsyncMonitors talking W3C WebDriver to a FakeWebDriverServer.
+    """
+    import monitor_manager
+    import warm_restart
+    import youtube_api
+    from async_webdriver import AsyncWebDriver
+    from fakes import FakeBrowser, FakeYouTubeApi, FakeWebDriverServer, fake_get_monitors
+
+    api = FakeYouTubeApi(latency=api_latency, error_rate=api_error_rate)
+    await api.start()
+    browsers = []
+
+    def create_fake_driver(driver_name, profile_dir=None, kiosk=True, quality=None):
+        browser = FakeBrowser(video_duration=video_duration, broken_videos=broken_videos)
+        browsers.append(browser)
+        return browser
+
+    server = FakeWebDriverServer(video_duration=video_duration, broken_videos=broken_videos)
+    await server.start()
+
+    async def create_fake_async_driver(driver_name, profile_dir=None, kiosk=True, quality=None, script_timeout=None):
+        return await AsyncWebDriver(server.url).start({})
+
+    if backend == 'async':
+        browsers = server.browsers
+    switches_before = _metric_totals('video_time_to_first_frame_seconds')
+    commands_before = _metric_totals('webdriver_command_seconds')
+    loop = asyncio.get_running_loop()
+
+    with tempfile.TemporaryDirectory() as directory, temporary_cache(os.path.join(directory, 'video_cache.json')), \
+            patched(*fake_api_patches(api), (monitor_manager, 'create_driver', create_fake_driver),
+                    (monitor_manager, 'create_async_driver', create_fake_async_driver),
+                    (monitor_manager, 'WEBDRIVER_BACKEND', backend), (monitor_manager, 'SCREEN_ISOLATION', 'thread'),
+                    (warm_restart, 'SNAPSHOT_FILE', os.path.join(directory, 'playback_snapshot.json'))):
+        if backend == 'async':
+            spawn = monitor_manager.spawn_async_monitors('firefox', fake_get_monitors(screens))
+        else:
+            spawn = loop.run_in_executor(None, monitor_manager.spawn_monitors, 'firefox', fake_get_monitors(screens))
+        (live_videos, top_videos), monitors = await asyncio.gather(
+            asyncio.gather(youtube_api.fetch_live_videos(), youtube_api.fetch_top_100_videos()), spawn)
+        manager = monitor_manager.MonitorManager(live_videos, top_videos)
+
+        # Ground truth for idle time: sample what every fake screen is showing
+        samples = {'showing': 0, 'total': 0}
+
+        async def sample_screens():
+            while not manager.is_stopped():
+                samples['showing'] += sum(browser.showing_video() for browser in browsers)
+                samples['total'] += len(browsers)
+                await asyncio.sleep(sample_interval)
+
+        sampler = asyncio.ensure_future(sample_screens())
+        stopped_at = []
+
+        def stop():
+            stopped_at.append(time.monotonic())
+            manager.stop()
+
+        loop.call_later(duration, stop)
+        started = time.monotonic()
+        await manager.monitor_all_screens(monitors)
+        finished = time.monotonic()
+        elapsed = finished - started
+        sampler.cancel()
+
+    await youtube_api.api_client.close()
+    await api.close()
+    await server.close()
+
+    def mean_deltas(name, before):
+        means = {}
+        for label, totals in _metric_totals(name).items():
+            previous = before.get(label, {'sum': 0.0, 'count': 0})
+            count = totals['count'] - previous['count']
+            if count:
+                means[label] = (count, (totals['sum'] - previous['sum']) / count)
+        return means
+
+    return {
+        'elapsed': elapsed,
+        'shutdown_seconds': finished - stopped_at[0],
+        'switches': mean_deltas('video_time_to_first_frame_seconds', switches_before),
+        'webdriver_commands': mean_deltas('webdriver_command_seconds', commands_before),
+        'idle_percent': 100.0 * (1 - samples['showing'] / samples['total']) if samples['total'] else 100.0,
+        'api_calls_per_hour': api.calls['search'] * 3600 / elapsed,
+        'api_calls': dict(api.calls),
+        'webdriver_commands_per_screen_minute': sum(b.commands for b in browsers) / len(browsers) / elapsed * 60,
+    }
+
+
+def report_wall(backend='selenium'):
+    result = asyncio.run(run_wall(backend=backend))
+    print(f"wall ({backend}): {result['elapsed']:.0f}s simulated run")
+    for mode, (count, mean) in result['switches'].items():
+        print(f"  switch latency ({mode}): {count} switches, mean {mean * 1e3:.0f} ms")
+    print(f"  screen idle: {result['idle_percent']:.1f}%")
+    print(f"  shutdown: {result['shutdown_seconds'] * 1e3:.0f} ms")
+    print(f"  API calls/hour: {result['api_calls_per_hour']:.0f} {result['api_calls']}")
+    print(f"  WebDriver commands per screen-minute: {result['webdriver_commands_per_screen_minute']:.0f}")
+    for command, (count, mean) in sorted(result['webdriver_commands'].items()):
+        print(f"  WebDriver {command}: {count} commands, mean {mean * 1e3:.1f} ms")
+
+
+def report_wall_async():
+    report_wall(backend='async')
+
+
+async def bench_recovery(scenario='kill', duration=40, screens=3, video_duration=8.0, fault_after=10.0,
+                         heartbeat_timeout=5):
+    """Mean time to recovery of screens running in worker processes.
+
+    fault_after seconds in, every screen is taken down: 'kill' SIGKILLs the worker, 'hang' SIGSTOPs it so only
+    the heartbeat watchdog can notice, and 'browser' lets the FakeBrowser inside die (again in every
+    replacement) so the worker has to detect the dead session itself.
+    """
+    import functools
+    import signal
+
+    import monitor_manager
+    import screen_worker
+    import warm_restart
+    import youtube_api
+    from fakes import FakeYouTubeApi, create_fake_driver, fake_get_monitors
+
+    api = FakeYouTubeApi(latency=0.05)
+    await api.start()
+    crash_after = fault_after if scenario == 'browser' else None
+    driver_factory = functools.partial(create_fake_driver, video_duration=video_duration, crash_after=crash_after)
+    loop = asyncio.get_running_loop()
+
+    with tempfile.TemporaryDirectory() as directory, temporary_cache(os.path.join(directory, 'video_cache.json')), \
+            patched(*fake_api_patches(api), (screen_worker, 'WORKER_HEARTBEAT_TIMEOUT', heartbeat_timeout),
+                    (warm_restart, 'SNAPSHOT_FILE', os.path.join(directory, 'playback_snapshot.json'))):
+        live_videos, top_videos = await asyncio.gather(youtube_api.fetch_live_videos(),
+                                                       youtube_api.fetch_top_100_videos())
+        manager = monitor_manager.MonitorManager(live_videos, top_videos)
+
+        def inject_fault():
+            for worker in manager.monitors:
+                if worker.process is not None and worker.process.is_alive():
+                    os.kill(worker.process.pid, signal.SIGSTOP if scenario == 'hang' else signal.SIGKILL)
+
+        if scenario in ('kill', 'hang'):
+            loop.call_later(fault_after, inject_fault)
+        loop.call_later(duration, manager.stop)
+        await manager.monitor_all_screens_isolated(fake_get_monitors(screens), driver_factory=driver_factory)
+
+    await youtube_api.api_client.close()
+    await api.close()
+    recoveries = [seconds for worker in manager.monitors for seconds in worker.recoveries]
+    return {
+        'respawns': sum(worker.respawns for worker in manager.monitors),
+        'recoveries': len(recoveries),
+        'mttr': sum(recoveries) / len(recoveries) if recoveries else None,
+        'max': max(recoveries, default=None),
+    }
+
+
+def report_recovery():
+    for scenario in ('kill', 'hang', 'browser'):
+        result = asyncio.run(bench_recovery(scenario))
+        mttr = f"{result['mttr']:.2f} s (max {result['max']:.2f} s)" if result['mttr'] is not None else 'n/a'
+        print(f"recovery ({scenario}): {result['respawns']} respawns, {result['recoveries']} recovered, MTTR {mttr}")
+
+
+async def bench_channel_fanout(counts=(1, 2, 4, 8), api_latency=0.1):
+    """Wall-clock time of the startup fetch for growing channel lists, against a fake API with fixed latency."""
+    import refresh_scheduler
+    import youtube_api
+    from fakes import FakeYouTubeApi
+
+    api = FakeYouTubeApi(latency=api_latency)
+    await api.start()
+    results = []
+    with tempfile.TemporaryDirectory() as directory, patched(*fake_api_patches(api)):
+        for count in counts:
+            # Start every round from an empty cache so each channel really goes to the API
+            with temporary_cache(os.path.join(directory, f'cache{count}.json')) as cache_manager, \
+                    patched((refresh_scheduler, '_quota_budget', refresh_scheduler.QuotaBudget(10 ** 9, cache_manager))):
+                channels = [youtube_api.Channel(f"UCfake{i:04d}", f"fake{i}", 1.0) for i in range(count)]
+                started = time.perf_counter()
+                await youtube_api.fetch_channel_videos(channels)
+                results.append((count, time.perf_counter() - started))
+    await youtube_api.api_client.close()
+    await api.close()
+    return results
+
+
+async def bench_revalidate(pages=3, channel_id='UCfakerevalidate'):
+    """Fetch a channel's popular list pages deep, let it go stale and revalidate it against the fake API.
+
+    Checks the 304 accounting: the revalidation sends the first page's ETag, gets a 304, hands back that
+    page alone, leaves the list and its deepest page token as they were and shows up in the counters.
+    """
+    import youtube_api
+    from fakes import FakeYouTubeApi
+
+    api = FakeYouTubeApi(videos=500)
+    await api.start()
+    key = youtube_api.cache_key_for('viewCount', channel_id)
+    with tempfile.TemporaryDirectory() as directory, patched(*fake_api_patches(api)), \
+            temporary_cache(os.path.join(directory, 'video_cache.json')) as cache_manager:
+        await youtube_api.fetch_top_100_videos(pages=pages, channel_id=channel_id)
+        before = cache_manager.load_from_cache(key)
+        cache_manager.expiry[key] = time.time() - 1  # As if its TTL had run out
+        not_modified, bytes_saved = youtube_api.NOT_MODIFIED.value(), youtube_api.BYTES_SAVED.value()
+
+        started = time.perf_counter()
+        await youtube_api.fetch_videos(order='viewCount', max_results=youtube_api.POPULAR_VIDEOS_LIMIT,
+                                       channel_id=channel_id)
+        urls, page_token = await youtube_api._revalidations[key]
+        elapsed = time.perf_counter() - started
+        after = cache_manager.load_from_cache(key)
+
+        assert api.calls['search_not_modified'] == 1, api.calls
+        assert youtube_api.NOT_MODIFIED.value() - not_modified == 1
+        assert youtube_api.BYTES_SAVED.value() - bytes_saved == before['response_bytes'] > 0
+        assert (urls, page_token) == (before['first_page']['urls'], before['first_page']['next_page_token'])
+        assert after['urls'] == before['urls'] and after['last_page_token'] == before['last_page_token']
+        assert cache_manager.cache_state(key) == 'fresh'
+    await youtube_api.api_client.close()
+    await api.close()
+    return {'pages': pages, 'list': len(before['urls']), 'first_page': len(urls),
+            'bytes_saved': before['response_bytes'], 'elapsed': elapsed}
+
+
+def report_revalidate():
+    result = asyncio.run(bench_revalidate())
+    print(f"revalidate: {result['pages']}-page list of {result['list']} URLs revalidated with a 304 in "
+          f"{result['elapsed'] * 1e3:.0f} ms; first page of {result['first_page']} URLs handed back, "
+          f"{result['bytes_saved']} bytes saved")
+
+
+def report_channel_fanout():
+    for count, elapsed in asyncio.run(bench_channel_fanout()):
+        print(f"fanout: {count} channels fetched in {elapsed * 1e3:.0f} ms")
+
+
+def bench_logging(records=2000, write_delay=0.0):
+    """Time a log call takes on the calling thread, synchronous file handlers against the queue pipeline.
+
+    write_delay stands in for slow storage, such as an SD card, by sleeping on every flush. The rotating
+    variants roll over every 256 KiB. Returns {variant: (mean, p99, max, drain)} in seconds, drain being
+    how long the listener took to catch up once the calls were done.
+    """
+    import logging
+    import logger as log_pipeline
+
+    rotating = {'LOG_MAX_BYTES': 256 * 1024, 'LOG_BACKUP_COUNT': 3}
+    variants = {
+        'file (sync)': (False, {}),
+        'rotating (sync)': (False, rotating),
+        'queue': (True, {}),
+        'queue json': (True, {'LOG_FORMAT': 'json'}),
+        'queue rotating': (True, rotating),
+    }
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for variant, (queued, log_config) in variants.items():
+            log_config = {**log_config, 'LOG_FILE': os.path.join(directory, f"{variant.split()[0]}{queued}.log")}
+            if log_config.get('LOG_MAX_BYTES') or queued:
+                file_handler = log_pipeline.create_handlers(log_config, argv=[])[0][1]  # Without the console
+            else:
+                file_handler = logging.FileHandler(log_config['LOG_FILE'])
+                file_handler.setFormatter(logging.Formatter(log_pipeline.TEXT_FORMAT))
+            if write_delay:
+                flush = file_handler.flush
+                file_handler.flush = lambda flush=flush: (time.sleep(write_delay), flush())
+            listener = None
+            handler = file_handler
+            if queued:
+                handler, listener = log_pipeline.start_listener([file_handler])
+            bench_logger = logging.getLogger(f'benchmark.{variant}')
+            bench_logger.propagate = False
+            bench_logger.setLevel(logging.INFO)
+            bench_logger.addHandler(handler)
+            timings = []
+            for i in range(records):
+                started = time.perf_counter()
+                bench_logger.info(f"screen{i % 6} playing https://www.youtube.com/embed/video{i:08d} " + 'x' * 200)
+                timings.append(time.perf_counter() - started)
+            drain_started = time.perf_counter()
+            if listener is not None:
+                listener.stop()
+            drained = time.perf_counter() - drain_started
+            bench_logger.removeHandler(handler)
+            file_handler.close()
+            timings.sort()
+            results[variant] = (sum(timings) / records, timings[int(records * 0.99)], timings[-1], drained)
+    return results
+
+
+def report_logging():
+    for storage, write_delay in (('fast disk', 0.0), ('slow disk, 1 ms/write', 0.001)):
+        print(f"logging ({storage})")
+        print("variant         | mean (us/call) | p99 (us) | max (ms) | drain (ms)")
+        for variant, (mean, p99, worst, drained) in bench_logging(write_delay=write_delay).items():
+            print(f"{variant:<15} | {mean * 1e6:>14.1f} | {p99 * 1e6:>8.1f} | {worst * 1e3:>8.2f} | "
+                  f"{drained * 1e3:>10.1f}")
+
+
+async def bench_restart(run_seconds=20, screens=6, video_duration=120.0, api_latency=0.3):
+    """Stop a wall of FakeBrowsers after run_seconds and bring it up again, warm and cold.
+
+    'warm' starts from the playback snapshot the stop wrote; 'cold' starts without one and with an empty
+    cache, as after the cache expired. Returns {mode: result} with the seconds from start until every
+    screen shows video, the API requests made before the manager was ready, how many screens came back
+    on the video they had and how far the recorded videos among them were from where they stopped.
+    """
+    import driver
+    import monitor_manager
+    import warm_restart
+    import youtube_api
+    from fakes import FakeBrowser, FakeYouTubeApi, fake_get_monitors
+    from scheduler import video_id
+    from utility_helpers import load_from_json
+
+    api = FakeYouTubeApi(latency=api_latency)
+    await api.start()
+    loop = asyncio.get_running_loop()
+    results = {}
+
+    with tempfile.TemporaryDirectory() as directory, patched(
+            *fake_api_patches(api),
+            (monitor_manager, 'create_driver', lambda *args, **kwargs: FakeBrowser(video_duration=video_duration)),
+            (monitor_manager, 'WEBDRIVER_BACKEND', 'selenium'), (monitor_manager, 'SCREEN_ISOLATION', 'thread'),
+            (warm_restart, 'SNAPSHOT_FILE', os.path.join(directory, 'playback_snapshot.json'))):
+        cache_file = os.path.join(directory, 'video_cache.json')
+        stopped_on = {}
+        for mode in ('first run', 'warm', 'cold'):
+            if mode == 'cold':
+                cache_file = os.path.join(directory, 'expired_cache.json')
+            with temporary_cache(cache_file, load_from_json(cache_file)):
+                api.calls.clear()
+                started = time.monotonic()
+                snapshot = warm_restart.read_snapshot() if mode == 'warm' else None
+                spawn = loop.run_in_executor(None, monitor_manager.spawn_monitors, 'firefox',
+                                             fake_get_monitors(screens))
+                channel_videos, monitors = await asyncio.gather(driver.fetch_api_videos(snapshot), spawn)
+                manager = monitor_manager.MonitorManager(channel_videos=channel_videos, snapshot=snapshot)
+                api_calls = sum(api.calls.values())  # Made before the manager could hand out the first video
+                wall = asyncio.ensure_future(manager.monitor_all_screens(monitors))
+                while not all(monitor.browser.showing_video() for monitor in monitors):
+                    await asyncio.sleep(0.02)
+                up_after = time.monotonic() - started
+                back, errors = 0, []
+                for monitor in monitors:
+                    previous = stopped_on.get(monitor.name)
+                    if previous and video_id(monitor.browser.tab.url) == previous[0]:
+                        back += 1
+                        if not previous[0].startswith('live'):  # Streams rejoin at the live edge instead
+                            errors.append(abs(monitor.browser.current_time() - previous[1]))
+                if mode == 'first run':
+                    await asyncio.sleep(run_seconds)
+                    stopped_on = {monitor.name: (video_id(monitor.browser.tab.url), monitor.browser.current_time())
+                                  for monitor in monitors}
+                manager.stop()
+                await wall
+            results[mode] = {'up_after': up_after, 'api_calls': api_calls, 'screens_back': back,
+                             'position_error': sum(errors) / len(errors) if errors else None}
+
+    await youtube_api.api_client.close()
+    await api.close()
+    return results
+
+
+def report_restart():
+    for mode, result in asyncio.run(bench_restart()).items():
+        error = f"{result['position_error']:.1f} s" if result['position_error'] is not None else 'n/a'
+        print(f"restart ({mode}): all screens up in {result['up_after']:.2f} s, {result['api_calls']} API requests "
+              f"first; {result['screens_back']} screens back on their video, position off by {error}")
+
+
+BENCHMARKS = {
+    'cache': report_cache_save,
+    'pages': report_cache_pages,
+    'switch': report_switch_latency,
+    'scheduler': report_scheduler,
+    'wall': report_wall,
+    'wall-async': report_wall_async,
+    'fanout': report_channel_fanout,
+    'revalidate': report_revalidate,
+    'recovery': report_recovery,
+    'logging': report_logging,
+    'restart': report_restart,
+}
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or BENCHMARKS:
+        BENCHMARKS[name]()
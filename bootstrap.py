@@ -0,0 +1,45 @@
+import asyncio
+import importlib
+import logging
+import os
+import sys
+
+from timing import startup_timer
+
+
+def bootstrap(config_file='config.json'):
+    """Load the config, logging and the video cache exactly once, before anything heavy is imported.
+
+    Returns (config, cache_manager). Exits if no API key is configured.
+    """
+    from utility_helpers import load_config
+
+    with startup_timer.phase('config_load'):
+        config = load_config(config_file, create_missing=True)
+
+    with startup_timer.phase('logging_setup'):
+        from logger import setup_logging
+        setup_logging(config)
+
+    with startup_timer.phase('cache_load'):
+        from cacher import create_cache_manager, set_cache_manager
+        cache_manager = create_cache_manager()
+        set_cache_manager(cache_manager)
+
+    if not (os.environ.get('API_KEY') or config.get('API_KEY')):
+        logging.error("API key not provided in config or environment variable.")
+        sys.exit(1)
+
+    if sys.platform == 'win32':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+    return config, cache_manager
+
+
+def import_timed(*module_names):
+    """Import modules in order, recording each as an 'import <name>' startup phase."""
+    modules = []
+    for name in module_names:
+        with startup_timer.phase(f'import {name}'):
+            modules.append(importlib.import_module(name))
+    return modules
@@ -0,0 +1,30 @@
+import sys
+import time
+
+from cacher import CacheManager
+from utility_helpers import load_from_json, get_json_file
+
+
+def describe_cache(cache_manager):
+    now = time.time()
+    lines = []
+    for key, entry in sorted(cache_manager.VIDEO_CACHE.items()):
+        if not isinstance(entry, dict):
+            lines.append(f"{key}: {type(entry).__name__}")
+            continue
+        expires_at = cache_manager.expiry.get(key)
+        expires = f"expires in {expires_at - now:.0f}s" if expires_at and expires_at > now else "expired"
+        lines.append(f"{key}: {len(entry.get('urls', []))} urls, {cache_manager.cache_state(key)}, {expires}, "
+                     f"last page token {entry.get('last_page_token')!r}, etag {entry.get('etag')!r}")
+    return "\n".join(lines) or "(empty cache)"
+
+
+if __name__ == "__main__":
+    # Only the cache and config modules are imported, so this starts in milliseconds
+    filename = sys.argv[1] if len(sys.argv) > 1 else get_json_file()
+    print(f"{filename}:")
+    if filename.endswith('.db'):
+        from cache_store import SqliteCacheManager
+        print(describe_cache(SqliteCacheManager(filename)))
+    else:
+        print(describe_cache(CacheManager(load_from_json(filename), filename=filename)))
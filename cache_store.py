@@ -0,0 +1,224 @@
+import datetime
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from cacher import CacheManager
+from scheduler import video_id
+from utility_helpers import config, load_from_json
+
+CACHE_DB = config.get('CACHE_DB', 'video_cache.db')
+LIST_KINDS = ('live', 'viewCount')  # Keys of these kinds (also 'live:<channel id>' etc.) are stored row by row
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    video_id TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS videos_last_seen ON videos (last_seen);
+CREATE TABLE IF NOT EXISTS lists (
+    list_key TEXT PRIMARY KEY,
+    updated_at REAL NOT NULL,
+    last_page_token TEXT,
+    etag TEXT,
+    response_bytes INTEGER NOT NULL DEFAULT 0,
+    first_page TEXT
+);
+CREATE TABLE IF NOT EXISTS rankings (
+    list_key TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    video_id TEXT NOT NULL,
+    PRIMARY KEY (list_key, position),
+    UNIQUE (list_key, video_id)
+);
+CREATE INDEX IF NOT EXISTS rankings_video_id ON rankings (video_id);
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def is_list_key(key):
+    return key.split(':', 1)[0] in LIST_KINDS
+
+
+class SqliteCacheManager(CacheManager):
+    """CacheManager backed by a SQLite database instead of one JSON file.
+
+    Video lists live in the videos/rankings/lists tables, so adding a page of popular videos is a handful
+    of indexed upserts whatever the size of the catalogue, and the ranking order is kept. Every other key
+    is a JSON blob in the entries table, mirrored in memory because keys like 'video_metadata' are read
+    once per queued video. Writes are committed as they happen, so there is nothing to flush.
+    """
+
+    def __init__(self, filename=None, migrate_from=None):
+        self.filename = filename or CACHE_DB
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.RLock()
+        self.dirty_keys = set()
+        self.expiry = {}  # key -> epoch second at which the entry goes stale
+        self._entries = {}  # Decoded JSON blobs of the entries table
+        self.connection = sqlite3.connect(self.filename, check_same_thread=False)
+        with self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.executescript(SCHEMA)
+            columns = {row[1] for row in self.connection.execute("PRAGMA table_info(lists)")}
+            if 'first_page' not in columns:  # Databases created before the first page was kept apart
+                self.connection.execute("ALTER TABLE lists ADD COLUMN first_page TEXT")
+        if migrate_from:
+            self.migrate_from_json(migrate_from)
+
+        for key, updated_at in self.connection.execute("SELECT list_key, updated_at FROM lists"):
+            self.expiry[key] = updated_at + self.ttl_for(key)
+        for key, data, updated_at in self.connection.execute("SELECT key, data, updated_at FROM entries"):
+            self._entries[key] = json.loads(data)
+            if updated_at is not None:
+                self.expiry[key] = updated_at + self.ttl_for(key)
+        self.logger.debug(f"SqliteCacheManager initialized from {self.filename}.")
+
+    @property
+    def VIDEO_CACHE(self):
+        """A snapshot of the whole cache as the JSON backend would hold it; for inspection only."""
+        with self._lock:
+            keys = [key for (key,) in self.connection.execute("SELECT list_key FROM lists")]
+            return {**{key: self.load_from_cache(key) for key in keys}, **self._entries}
+
+    def migrate_from_json(self, json_filename):
+        """Import a JSON cache file once; the 'migrated_from' marker makes later starts skip it."""
+        with self._lock:
+            if self.connection.execute("SELECT 1 FROM meta WHERE key = 'migrated_from'").fetchone():
+                return False
+            data = load_from_json(json_filename)
+            with self.connection:
+                for key, entry in data.items():
+                    if is_list_key(key) and isinstance(entry, dict) and 'urls' in entry:
+                        self._write_list(key, entry['urls'], self._updated_at(entry) or time.time(),
+                                         entry.get('last_page_token'), entry.get('etag'), entry.get('response_bytes'),
+                                         entry.get('first_page'))
+                    else:
+                        self._write_entry(key, entry)
+                self.connection.execute("INSERT INTO meta (key, value) VALUES ('migrated_from', ?)", (json_filename,))
+        self.logger.info(f"Migrated {len(data)} cache keys from {json_filename} to {self.filename}")
+        return True
+
+    def load_from_cache(self, key):
+        self.logger.debug(f"Loading data from cache for key: {key}")
+        if not is_list_key(key):
+            return self._entries.get(key)
+        with self._lock:
+            entry = self._list_fields(key)
+            if entry is None:
+                return None
+            return {**entry, 'urls': self.load_page(key)}
+
+    def _list_fields(self, key):
+        """A list entry as load_from_cache returns it, without its URLs; None if there is none."""
+        row = self.connection.execute(
+            "SELECT updated_at, last_page_token, etag, response_bytes, first_page FROM lists WHERE list_key = ?",
+            (key,)).fetchone()
+        if row is None:
+            return None
+        updated_at, last_page_token, etag, response_bytes, first_page = row
+        return {
+            'last_updated': datetime.datetime.fromtimestamp(updated_at).strftime('%Y-%m-%d'),
+            'updated_at': updated_at,
+            'last_page_token': json.loads(last_page_token) if last_page_token is not None else None,
+            'etag': etag,
+            'response_bytes': response_bytes,
+            'first_page': json.loads(first_page) if first_page is not None else None,
+        }
+
+    def load_page(self, key, offset=0, limit=None):
+        """URLs of a video list in ranking order, optionally just limit of them starting at offset."""
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT videos.url FROM rankings JOIN videos USING (video_id) WHERE rankings.list_key = ? "
+                "ORDER BY rankings.position LIMIT ? OFFSET ?", (key, -1 if limit is None else limit, offset))
+            return [url for (url,) in rows]
+
+    def save_to_cache(self, data, key):
+        with self._lock, self.connection:
+            if is_list_key(key) and isinstance(data, dict) and 'urls' in data:
+                self._write_list(key, data['urls'], self._updated_at(data) or time.time(),
+                                 data.get('last_page_token'), data.get('etag'), data.get('response_bytes'),
+                                 data.get('first_page'))
+            else:
+                self._write_entry(key, data)
+        self.logger.debug(f"Saved data to cache for key: {key}")
+
+    def update_and_save_cache(self, urls, page_token, cache_key, etag=None, response_bytes=None, first_page=False):
+        self.logger.debug(f"Updating and saving cache for key: {cache_key}")
+        now = time.time()
+        # Popular pages accumulate; live lists are replaced
+        append = cache_key.split(':', 1)[0] == 'viewCount'
+        with self._lock, self.connection:
+            fields = self._page_fields(self._list_fields(cache_key) or {}, urls, page_token, cache_key, etag,
+                                       response_bytes, first_page)
+            self._write_list(cache_key, urls, now, fields['last_page_token'], fields['etag'],
+                             fields['response_bytes'], fields['first_page'], append=append)
+        self.expiry[cache_key] = now + self.ttl_for(cache_key)
+
+    def _write_list(self, key, urls, updated_at, page_token, etag=None, response_bytes=None, first_page=None,
+                    append=False):
+        now = time.time()
+        rows = [(video_id(url), url) for url in urls]
+        self.connection.executemany(
+            "INSERT INTO videos (video_id, url, first_seen, last_seen) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (video_id) DO UPDATE SET last_seen = excluded.last_seen",
+            [(vid, url, now, now) for vid, url in rows])
+        if not append:
+            self.connection.execute("DELETE FROM rankings WHERE list_key = ?", (key,))
+        start, = self.connection.execute(
+            "SELECT COALESCE(MAX(position) + 1, 0) FROM rankings WHERE list_key = ?", (key,)).fetchone()
+        # Videos already in the list keep their rank
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO rankings (list_key, position, video_id) VALUES (?, ?, ?)",
+            [(key, start + i, vid) for i, (vid, _) in enumerate(rows)])
+        self.connection.execute(
+            "INSERT INTO lists (list_key, updated_at, last_page_token, etag, response_bytes, first_page) "
+            "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (list_key) DO UPDATE SET updated_at = excluded.updated_at, "
+            "last_page_token = excluded.last_page_token, etag = excluded.etag, "
+            "response_bytes = excluded.response_bytes, first_page = excluded.first_page",
+            (key, updated_at, json.dumps(page_token), etag, response_bytes or 0,
+             json.dumps(first_page) if first_page is not None else None))
+
+    def _write_entry(self, key, data):
+        updated_at = self._updated_at(data)
+        self.connection.execute(
+            "INSERT INTO entries (key, data, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+            (key, json.dumps(data), updated_at))
+        self._entries[key] = data
+
+    def mark_fresh(self, cache_key):
+        """Restart a key's TTL without touching its data, e.g. after a 304 Not Modified."""
+        now = time.time()
+        with self._lock, self.connection:
+            if is_list_key(cache_key):
+                updated = self.connection.execute("UPDATE lists SET updated_at = ? WHERE list_key = ?",
+                                                  (now, cache_key)).rowcount
+            else:
+                entry = self._entries.get(cache_key)
+                updated = isinstance(entry, dict)
+                if updated:
+                    self._write_entry(cache_key, {**entry, 'updated_at': now})
+        if updated:
+            self.expiry[cache_key] = now + self.ttl_for(cache_key)
+
+    def flush(self):
+        """Nothing to do: every write is committed when it is made."""
+
+    def close(self):
+        with self._lock:
+            self.connection.close()
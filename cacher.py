@@ -1,48 +1,205 @@
+import atexit
 import datetime
 import logging
+import threading
+import time
 
-from utility_helpers import save_to_json
+from metrics import registry
+from utility_helpers import config, write_json_atomic, load_from_json, get_json_file
+
+CACHE_FLUSH_INTERVAL = config.get('CACHE_FLUSH_INTERVAL', 2.0)
+# Seconds each cache key stays fresh; keys not listed fall back to DEFAULT_CACHE_TTL
+CACHE_TTLS = {'live': 3600, 'viewCount': 60 * 86400, 'video_metadata': 86400, **config.get('CACHE_TTLS', {})}
+DEFAULT_CACHE_TTL = config.get('DEFAULT_CACHE_TTL', 86400)
+CACHE_BACKEND = config.get('CACHE_BACKEND', 'json')  # 'json' or 'sqlite'
+
+FRESH, STALE, MISSING = 'fresh', 'stale', 'missing'
+
+CACHE_LOOKUPS = registry.counter('cache_lookups_total', 'Cache validity checks by key and result', ('key', 'state'))
 
 
 class CacheManager:
 
-    def __init__(self, initial_cache=None):
+    def __init__(self, initial_cache=None, filename=None, flush_interval=CACHE_FLUSH_INTERVAL):
         self.VIDEO_CACHE = initial_cache or {}
+        self.filename = filename or get_json_file()
+        self.flush_interval = flush_interval
+        self.dirty_keys = set()
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()  # Keeps flushes in order, without holding up saves while they write
+        self._flush_timer = None
         self.logger = logging.getLogger(__name__)
+        self.expiry = {}  # key -> epoch second at which the entry goes stale
+        for key, entry in self.VIDEO_CACHE.items():
+            updated_at = self._updated_at(entry)
+            if updated_at is not None:
+                self.expiry[key] = updated_at + self.ttl_for(key)
+        atexit.register(self.flush)
         self.logger.debug("CacheManager initialized.")
 
+    @staticmethod
+    def _updated_at(entry):
+        if not isinstance(entry, dict):
+            return None
+        if 'updated_at' in entry:
+            return entry['updated_at']
+        if 'last_updated' in entry:  # Entries written before epoch timestamps were stored
+            return datetime.datetime.strptime(entry['last_updated'], '%Y-%m-%d').timestamp()
+        return None
+
+    @staticmethod
+    def ttl_for(key):
+        # Per-channel keys ('live:<channel id>') share the TTL of their kind
+        return CACHE_TTLS.get(key.split(':', 1)[0], DEFAULT_CACHE_TTL)
+
     def load_from_cache(self, key):
         self.logger.debug(f"Loading data from cache for key: {key}")
         return self.VIDEO_CACHE.get(key)
 
     def save_to_cache(self, data, key):
-        self.VIDEO_CACHE[key] = data
-        save_to_json(data, key=key)
+        # The in-memory cache is authoritative; the file is brought up to date by a debounced flush
+        with self._lock:
+            self.VIDEO_CACHE[key] = data
+            self.dirty_keys.add(key)
+            self._schedule_flush()
+        if not self.flush_interval:
+            self.flush()
         self.logger.debug(f"Saved data to cache for key: {key}")
 
-    def is_cache_valid(self, cache_key, caching_time=None):
-        self.logger.debug(f"Checking cache validity for key: {cache_key}")
+    def _schedule_flush(self):
+        # Called with _lock held; without a flush interval the caller flushes once it has let go of the lock
+        if self.flush_interval and self._flush_timer is None:
+            self._flush_timer = threading.Timer(self.flush_interval, self._timed_flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def flush(self):
+        """Write pending changes to disk. Called by the debounce timer, at shutdown and at interpreter exit.
+
+        Only taking a shallow copy of the cache holds _lock; the file is serialised and written outside it,
+        so saves from the event loop do not wait on the disk. Entries are replaced rather than changed in
+        place, which keeps the copy consistent.
+        """
+        with self._write_lock:
+            with self._lock:
+                if self._flush_timer is not None:
+                    self._flush_timer.cancel()
+                    self._flush_timer = None
+                if not self.dirty_keys:
+                    return
+                keys = sorted(self.dirty_keys)
+                snapshot = dict(self.VIDEO_CACHE)
+                self.dirty_keys.clear()
+            try:
+                write_json_atomic(snapshot, self.filename)
+            except BaseException:
+                with self._lock:
+                    self.dirty_keys.update(keys)  # Written again by the next flush
+                raise
+        self.logger.debug(f"Flushed cache keys {keys} to {self.filename}")
+
+    def _timed_flush(self):
+        # Nobody is waiting on the timer thread; a failed write is retried by the next save or at exit
+        try:
+            self.flush()
+        except OSError as e:
+            self.logger.error(f"Error flushing cache to {self.filename}: {e}")
+
+    def close(self):
+        """Flush and stop tracking this manager for the exit-time flush."""
+        self.flush()
+        atexit.unregister(self.flush)
+
+    def cache_state(self, cache_key):
+        """Return FRESH, STALE (data present but past its TTL) or MISSING for a cache key."""
+        expires_at = self.expiry.get(cache_key)
+        if expires_at is None:
+            state = MISSING
+        else:
+            state = FRESH if time.time() < expires_at else STALE
+        CACHE_LOOKUPS.inc(key=cache_key, state=state)
+        return state
 
-        if cache_key in self.VIDEO_CACHE and 'last_updated' in self.VIDEO_CACHE[cache_key]:
-            last_updated = datetime.datetime.strptime(self.VIDEO_CACHE[cache_key]['last_updated'], '%Y-%m-%d')
-            caching_time = caching_time or (1 if cache_key == 'live' else 60)
-            if (datetime.datetime.now() - last_updated).days < caching_time:
-                self.logger.debug(f"Cache for key: {cache_key} is valid.")
-                return True
+    def is_cache_valid(self, cache_key):
+        self.logger.debug(f"Checking cache validity for key: {cache_key}")
+        return self.cache_state(cache_key) == FRESH
 
-        return False
+    def mark_fresh(self, cache_key):
+        """Restart a key's TTL without touching its data, e.g. after a 304 Not Modified."""
+        now = time.time()
+        with self._lock:
+            entry = self.VIDEO_CACHE.get(cache_key)
+            if entry is None:
+                return
+            # A new dict, so a flush serialising the old one outside the lock never sees it change
+            self.VIDEO_CACHE[cache_key] = {**entry, 'updated_at': now,
+                                           'last_updated': datetime.datetime.fromtimestamp(now).strftime('%Y-%m-%d')}
+            self.dirty_keys.add(cache_key)
+            self._schedule_flush()
+        if not self.flush_interval:
+            self.flush()
+        self.expiry[cache_key] = now + self.ttl_for(cache_key)
 
-    def update_and_save_cache(self, urls, page_token, cache_key):
+    def update_and_save_cache(self, urls, page_token, cache_key, etag=None, response_bytes=None, first_page=False):
         self.logger.debug(f"Updating and saving cache for key: {cache_key}")
-        if cache_key == "viewCount":
-            existing_cache = self.load_from_cache('viewCount')
-            existing_urls = existing_cache.get('urls', []) if existing_cache else []
-            urls = list(set(existing_urls + urls))
+        existing_cache = self.load_from_cache(cache_key) or {}
+        page_fields = self._page_fields(existing_cache, urls, page_token, cache_key, etag, response_bytes, first_page)
+        if cache_key.split(':', 1)[0] == "viewCount":  # Also the per-channel 'viewCount:<channel id>' keys
+            existing_urls = existing_cache.get('urls', [])
+            urls = list(dict.fromkeys(existing_urls + urls))  # Keeps ranking order
 
+        now = time.time()
         data_to_save = {
-            'last_updated': datetime.datetime.now().strftime('%Y-%m-%d'),
+            'last_updated': datetime.datetime.fromtimestamp(now).strftime('%Y-%m-%d'),
+            'updated_at': now,
             'urls': urls,
-            'last_page_token': page_token  # Save the last page token
+            **page_fields,
         }
 
         self.save_to_cache(data_to_save, key=cache_key)
+        self.expiry[cache_key] = now + self.ttl_for(cache_key)
+
+    @staticmethod
+    def _page_fields(existing, urls, page_token, cache_key, etag, response_bytes, first_page):
+        """The token and first-page fields of a list entry after storing a fetched page over existing.
+
+        last_page_token is where the accumulated list ends. The first page's own URLs and next token are
+        kept apart under 'first_page' with the ETag that validates them, so a 304 on the next refresh can
+        hand back that page. Fetching the first page of a 'viewCount' list again leaves last_page_token
+        where the deeper pages took it.
+        """
+        if not first_page:
+            return {'last_page_token': page_token, 'etag': existing.get('etag'),
+                    'response_bytes': existing.get('response_bytes', 0), 'first_page': existing.get('first_page')}
+        last_page_token = page_token
+        if cache_key.split(':', 1)[0] == 'viewCount' and existing.get('last_page_token') is not None:
+            last_page_token = existing['last_page_token']
+        return {'last_page_token': last_page_token, 'etag': etag, 'response_bytes': response_bytes or 0,
+                'first_page': {'urls': urls, 'next_page_token': page_token}}
+
+
+_cache_manager = None
+
+
+def get_cache_manager():
+    """Return the shared CacheManager, reading the cache file the first time it is needed."""
+    global _cache_manager
+    if _cache_manager is None:
+        _cache_manager = create_cache_manager()
+    return _cache_manager
+
+
+def create_cache_manager(backend=None):
+    """Build a CacheManager for CACHE_BACKEND; the SQLite store imports the JSON cache on its first start."""
+    backend = backend or CACHE_BACKEND
+    if backend == 'json':
+        return CacheManager(load_from_json())
+    if backend == 'sqlite':
+        from cache_store import SqliteCacheManager
+        return SqliteCacheManager(migrate_from=get_json_file())
+    raise ValueError(f"Unsupported cache backend: {backend}")
+
+
+def set_cache_manager(cache_manager):
+    global _cache_manager
+    _cache_manager = cache_manager
@@ -1,30 +1,70 @@
 import threading
 import asyncio
 import sys
-from monitor_manager import MonitorManager
-from youtube_api import fetch_top_100_videos, fetch_live_videos
+from bootstrap import bootstrap, import_timed
+from timing import startup_timer
 
 
+async def fetch_api_videos(snapshot=None):
+    from youtube_api import fetch_channel_videos
 
-async def fetch_videos_and_initialize_manager():
-    live_videos, top_videos = await asyncio.gather(
-        fetch_live_videos(),
-        fetch_top_100_videos()
-    )
-    return MonitorManager(live_videos, top_videos)
+    if snapshot is not None:
+        return {}  # The manager restores its queue from the snapshot; the lists are refreshed in the background
+    # Video metadata is looked up once the screens play, so videos.list stays off the way to the first frame
+    with startup_timer.phase('api'):
+        return await fetch_channel_videos()
+
+
+async def fetch_videos_and_initialize_manager(config, cache_manager):
+    from monitor_manager import MonitorManager, spawn_monitors, spawn_async_monitors, WEBDRIVER_BACKEND, \
+        SCREEN_ISOLATION
+    from warm_restart import read_snapshot
+    from youtube_api import CHANNELS
+
+    # A recent snapshot of the last run puts every screen back where it was, before any network call
+    with startup_timer.phase('snapshot_load'):
+        snapshot = read_snapshot([channel.id for channel in CHANNELS])
+
+    # Start the browsers while the API calls are in flight instead of after them
+    driver_name = config.get('WEB_DRIVER', 'firefox').lower()
+    if SCREEN_ISOLATION == 'process':
+        return MonitorManager(cache_manager=cache_manager, channel_videos=await fetch_api_videos(snapshot),
+                              snapshot=snapshot), None
+    if WEBDRIVER_BACKEND == 'async':
+        browsers = spawn_async_monitors(driver_name)
+    else:
+        browsers = asyncio.get_running_loop().run_in_executor(None, spawn_monitors, driver_name)
+    channel_videos, monitors = await asyncio.gather(fetch_api_videos(snapshot), browsers)
+    return MonitorManager(cache_manager=cache_manager, channel_videos=channel_videos, snapshot=snapshot), monitors
 
 if __name__ == "__main__":
-    if sys.platform == 'win32':
-        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    config, cache_manager = bootstrap()
+
+    if "--warm-profile" in sys.argv:
+        from driver_factory import warm_profile_template
+        warm_profile_template(config.get('WEB_DRIVER', 'firefox').lower())
+        sys.exit(0)
+
+    import_timed('youtube_api', 'monitor_manager')
+    import metrics
+    from youtube_api import api_client
+
+    if config.get('METRICS_PORT', 9108):
+        metrics.start_http_server(config.get('METRICS_PORT', 9108))
 
     loop = asyncio.get_event_loop()
-    manager = loop.run_until_complete(fetch_videos_and_initialize_manager())
+    manager, monitors = loop.run_until_complete(fetch_videos_and_initialize_manager(config, cache_manager))
+
+    if "--profile-startup" in sys.argv:
+        print(startup_timer.report())
 
     # Start the key listener thread first
     key_thread = threading.Thread(target=manager.key_listener)
     key_thread.start()
 
     try:
-        loop.run_until_complete(manager.monitor_all_screens())
+        loop.run_until_complete(manager.monitor_all_screens(monitors))
     finally:
         key_thread.join()
+        loop.run_until_complete(api_client.close())
+        metrics.dump(config.get('METRICS_FILE', 'metrics.prom'))
@@ -0,0 +1,116 @@
+import os
+import shutil
+import tempfile
+
+from logger import logger
+from playback_quality import prefers_h264
+from utility_helpers import config
+
+PROFILE_TEMPLATE = config.get('PROFILE_TEMPLATE')  # Pre-warmed browser profile cloned for every screen
+# Hardware decoding even on GPUs and drivers the browser blocklists; only for machines known to decode reliably
+FORCE_HARDWARE_DECODE = config.get('FORCE_HARDWARE_DECODE', False)
+# Files that pin a profile to a running browser and must not be copied into a clone
+PROFILE_LOCK_FILES = ('lock', '.parentlock', 'parent.lock', 'SingletonLock', 'SingletonCookie', 'SingletonSocket')
+FIREFOX_PREFERENCES = {
+    'permissions.default.image': 2,  # Disable images
+    'permissions.default.stylesheet': 2,  # Disable CSS
+    'dom.disable_open_during_load': True,  # Suppress pop-ups
+    'identity.fxaccounts.enabled': False,
+}
+CHROME_EXCLUDE_SWITCHES = ['disable-sync', 'disable-signin-promo', 'disable-infobars']
+EDGE_EXCLUDE_SWITCHES = ['disable-sync', 'disable-signin-promo', 'enable-automation', 'disable-infobars']
+
+
+def clone_profile(template_dir):
+    """Copy a pre-warmed profile into a throwaway directory so each browser gets its own writable copy."""
+    profile_dir = tempfile.mkdtemp(prefix='streambackground-profile-')
+    shutil.copytree(template_dir, profile_dir, dirs_exist_ok=True, ignore=shutil.ignore_patterns(*PROFILE_LOCK_FILES))
+    return profile_dir
+
+
+def create_driver(driver_name, profile_dir=None, kiosk=True, quality=None):
+    """Start a browser. With a playback quality cap that H.264 covers, the browser is steered away from the
+    VP9/AV1 streams YouTube prefers, whose software decode saturates a modest CPU with several screens."""
+    # Selenium is only needed once a browser is actually started, so it is imported here
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options as ChromeOptions
+    from selenium.webdriver.edge.options import Options as EdgeOptions
+    from selenium.webdriver.firefox.options import Options as FirefoxOptions
+
+    logger.info(f"Creating driver for: {driver_name}")
+    if driver_name == 'chrome':  # doesnt work
+        options = ChromeOptions()
+        if kiosk:
+            options.add_argument('--kiosk')
+        if profile_dir:
+            options.add_argument(f'--user-data-dir={profile_dir}')
+        for argument in chromium_decode_arguments(quality):
+            options.add_argument(argument)
+        options.add_experimental_option("useAutomationExtension", False)
+        options.add_experimental_option('excludeSwitches', CHROME_EXCLUDE_SWITCHES)
+        browser = webdriver.Chrome(options=options)
+
+    elif driver_name == 'firefox':
+        options = FirefoxOptions()
+        for name, value in {**FIREFOX_PREFERENCES, **firefox_decode_preferences(quality)}.items():
+            options.set_preference(name, value)
+        if kiosk:
+            options.add_argument('--kiosk')
+        if profile_dir:
+            options.add_argument('-profile')
+            options.add_argument(profile_dir)
+        browser = webdriver.Firefox(options=options)
+
+    elif driver_name == 'edge':
+        options = EdgeOptions()
+        options.use_chromium = True
+        if kiosk:
+            options.add_argument('--kiosk')
+        if profile_dir:
+            options.add_argument(f'--user-data-dir={profile_dir}')
+        for argument in chromium_decode_arguments(quality):
+            options.add_argument(argument)
+        options.add_experimental_option("useAutomationExtension", False)
+        options.add_experimental_option('excludeSwitches', EDGE_EXCLUDE_SWITCHES)
+        browser = webdriver.Edge(options=options)
+
+    else:
+        logger.error(f"Unsupported driver: {driver_name}")
+        raise ValueError(f"Unsupported driver: {driver_name}")
+
+    logger.info(f"Driver for {driver_name} created.")
+    return browser
+
+
+def firefox_decode_preferences(quality):
+    prefs = {
+        'media.hardware-video-decoding.enabled': True,
+        'media.autoplay.default': 0,  # Allow autoplay, which preloading relies on
+    }
+    if FORCE_HARDWARE_DECODE:
+        prefs['media.hardware-video-decoding.force-enabled'] = True
+    if prefers_h264(quality):
+        prefs.update({'media.av1.enabled': False, 'media.mediasource.vp9.enabled': False})
+    return prefs
+
+
+def chromium_decode_arguments(quality):
+    arguments = ['--enable-gpu-rasterization', '--autoplay-policy=no-user-gesture-required']
+    if FORCE_HARDWARE_DECODE:
+        arguments.append('--ignore-gpu-blocklist')
+    if prefers_h264(quality):
+        arguments.append('--disable-features=Dav1dVideoDecoder')  # No software AV1 decoding
+    return arguments
+
+
+def warm_profile_template(driver_name, template_dir=PROFILE_TEMPLATE):
+    """Open a normal browser window on the template profile so consent and cookies can be set up by hand."""
+    if not template_dir:
+        raise ValueError("PROFILE_TEMPLATE is not set in config.json")
+    os.makedirs(template_dir, exist_ok=True)
+    browser = create_driver(driver_name, profile_dir=template_dir, kiosk=False)
+    try:
+        browser.get('https://www.youtube.com')
+        input(f"Accept YouTube's consent dialog and play a video, then press Enter to save {template_dir}...")
+    finally:
+        browser.quit()
@@ -0,0 +1,494 @@
+import asyncio
+import hashlib
+import itertools
+import json
+import random
+import threading
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from scheduler import video_id
+from warm_restart import start_offset
+from player_scripts import HEALTH_PROBE_SCRIPT, PRELOAD_SCRIPT, PAUSE_SCRIPT, START_PRELOADED_SCRIPT, \
+    WAIT_FOR_EVENT_SCRIPT
+
+# Same attributes as screeninfo.Monitor, which is all spawn_monitors needs
+FakeScreen = namedtuple('FakeScreen', ['x', 'y', 'width', 'height', 'name'])
+
+SPACE = '\ue00d'  # W3C key code selenium sends for Keys.SPACE
+ELEMENT_KEY = 'element-6066-11e4-a52e-4f735466cecf'
+
+
+def fake_get_monitors(count=6, width=1920, height=1080):
+    """A row of count side-by-side screens, in place of screeninfo.get_monitors()."""
+    return [FakeScreen(i * width, 0, width, height, f"FAKE{i}") for i in range(count)]
+
+
+class FakeTab:
+    def __init__(self, handle):
+        self.handle = handle
+        self.url = 'about:blank'
+        self.loaded_at = time.monotonic()
+        self.play_requested_at = None
+        self.paused = True
+        self.muted = False
+        self.position = 0.0  # Playback position when last paused
+        self.resumed_at = None
+
+    def load(self, url):
+        self.url = url
+        self.loaded_at = time.monotonic()
+        self.play_requested_at = None
+        self.paused = True
+        self.muted = 'mute=1' in url
+        self.position = float(start_offset(url))  # The embed player honours start=
+        self.resumed_at = None
+        if 'autoplay=1' in url:
+            self.play(self.loaded_at)
+
+    def showing_video(self, now, player_delay, frame_delay, duration):
+        """True while a frame of a playing, unfinished video is on screen."""
+        first_frame = self.first_frame_at(player_delay, frame_delay)
+        return (not self.paused and first_frame is not None and first_frame <= now
+                and self.current_time(now, player_delay, frame_delay) < duration)
+
+    def player_ready_at(self, player_delay):
+        return self.loaded_at + player_delay
+
+    def first_frame_at(self, player_delay, frame_delay):
+        """When the first frame is on screen: the player must exist and frame_delay of buffering must have passed."""
+        if self.play_requested_at is None:
+            return None
+        buffered_at = self.player_ready_at(player_delay) + frame_delay
+        return max(self.play_requested_at, buffered_at)
+
+    def play(self, now):
+        if self.paused:
+            self.paused = False
+            self.resumed_at = now
+            if self.play_requested_at is None:
+                self.play_requested_at = now
+
+    def pause(self, now, player_delay, frame_delay):
+        if not self.paused:
+            self.position = self.current_time(now, player_delay, frame_delay)
+            self.paused = True
+
+    def current_time(self, now, player_delay, frame_delay):
+        if self.paused or self.resumed_at is None:
+            return self.position
+        started = max(self.resumed_at, self.player_ready_at(player_delay) + frame_delay)
+        return self.position + max(0.0, now - started)
+
+
+class FakeElement:
+    def __init__(self, browser, tab, text=''):
+        self.browser = browser
+        self.tab = tab
+        self.text = text
+
+    def is_displayed(self):
+        return True
+
+    def is_enabled(self):
+        return True
+
+    def send_keys(self, *keys):
+        if SPACE in keys:
+            now = time.monotonic()
+            if self.tab.paused:
+                self.tab.play(now)
+            else:
+                self.tab.pause(now, self.browser.player_delay, self.browser.frame_delay)
+
+
+class FakeSwitchTo:
+    def __init__(self, browser):
+        self.browser = browser
+
+    def window(self, handle):
+        self.browser.command()
+        self.browser.current_window_handle = handle
+
+    def new_window(self, kind='tab'):
+        self.browser.command()
+        handle = self.browser.open_tab()
+        self.browser.current_window_handle = handle
+
+
+class FakeBrowser:
+    """In-process stand-in for a selenium WebDriver playing YouTube embeds.
+
+    get() blocks for load_time, the player element appears player_delay after load and the first frame
+    needs another frame_delay of buffering. A preloaded (muted, held) tab keeps buffering in the background,
+    so starting it later shows a frame immediately. Every video ends video_duration seconds after its first
+    frame, which fires the 'ended' event the supervision loop waits for. Videos in broken_videos never get a
+    player and show the embed's error overlay instead. After quit() every command raises, like a dead
+    WebDriver session; with crash_after the browser dies that many seconds after it was opened.
+    """
+
+    def __init__(self, load_time=0.5, player_delay=0.3, frame_delay=0.4, video_duration=30.0, broken_videos=(),
+                 crash_after=None):
+        self.load_time = load_time
+        self.player_delay = player_delay
+        self.frame_delay = frame_delay
+        self.video_duration = video_duration
+        self.broken_videos = set(broken_videos)
+        self.tabs = {}
+        self._handles = itertools.count()
+        self.current_window_handle = self.open_tab()
+        self.switch_to = FakeSwitchTo(self)
+        self.commands = 0
+        self.window_rect = None
+        self.crash_after = crash_after
+        self.created_at = time.monotonic()
+        self._quit = threading.Event()
+
+    @property
+    def closed(self):
+        return self._quit.is_set()
+
+    def command(self):
+        if self.crash_after is not None and time.monotonic() - self.created_at >= self.crash_after:
+            self._quit.set()
+        if self._quit.is_set():
+            raise RuntimeError("WebDriver session is closed")
+        self.commands += 1
+
+    def open_tab(self):
+        handle = f"handle-{next(self._handles)}"
+        self.tabs[handle] = FakeTab(handle)
+        return handle
+
+    @property
+    def tab(self):
+        return self.tabs[self.current_window_handle]
+
+    def player_error(self, tab=None):
+        tab = tab or self.tab
+        return tab.url != 'about:blank' and video_id(tab.url) in self.broken_videos
+
+    def player_present(self, tab=None):
+        tab = tab or self.tab
+        return (tab.url != 'about:blank' and not self.player_error(tab)
+                and time.monotonic() >= tab.player_ready_at(self.player_delay))
+
+    def current_time(self, tab=None):
+        return (tab or self.tab).current_time(time.monotonic(), self.player_delay, self.frame_delay)
+
+    def get(self, url):
+        self.command()
+        self._quit.wait(self.load_time)
+        self.tab.load(url)
+
+    def find_element(self, by, selector):
+        from selenium.common.exceptions import NoSuchElementException
+        self.command()
+        if not self.player_present():
+            raise NoSuchElementException(selector)
+        return FakeElement(self, self.tab)
+
+    def find_elements(self, by, selector):
+        self.command()
+        if 'ytp-error' in selector:
+            return [FakeElement(self, self.tab, 'Video unavailable')] if self.player_error() else []
+        return [FakeElement(self, self.tab)] if self.player_present() else []
+
+    def execute_script(self, script, *args):
+        self.command()
+        tab = self.tab
+        now = time.monotonic()
+        if script == HEALTH_PROBE_SCRIPT:
+            return self.probe_state(tab)
+        if script in (PRELOAD_SCRIPT, PAUSE_SCRIPT):
+            tab.pause(now, self.player_delay, self.frame_delay)
+            return None
+        if script == START_PRELOADED_SCRIPT:
+            if tab.url == 'about:blank':
+                return False
+            tab.muted = False
+            tab.play(now)
+            tab.play_requested_at = now
+            return True
+        if 'document.readyState' in script:
+            return 'complete'
+        if 'paused' in script:
+            return tab.paused
+        return None
+
+    def execute_async_script(self, script, *args):
+        self.command()
+        if script != WAIT_FOR_EVENT_SCRIPT:
+            return None
+        timeout = args[0] / 1000 if args else 0
+        if not self.player_present():
+            self._quit.wait(min(timeout, 0.05))
+            return {'events': ['missing']}
+        tab = self.tab
+        if not tab.paused:
+            remaining = self.video_duration - self.current_time(tab)
+            if remaining <= timeout:
+                self._quit.wait(max(0.0, remaining))
+                self.command()
+                return {'events': ['ended'], 'paused': False, 'ended': True}
+        self._quit.wait(timeout)
+        self.command()
+        return {'events': [], 'paused': tab.paused, 'ended': False}
+
+    def probe_state(self, tab):
+        state = {'readyState': 'complete', 'present': self.player_present(tab)}
+        if self.player_error(tab):
+            state['playerError'] = 'Video unavailable'
+        if not state['present']:
+            return state
+        position = min(self.current_time(tab), self.video_duration)
+        state.update({
+            'paused': tab.paused,
+            'ended': position >= self.video_duration,
+            'currentTime': position,
+            'buffered': [[0, position + 10]],
+            'networkState': 1,
+            'mediaReadyState': 4,
+            'droppedFrames': 0,
+            'totalFrames': int(position * 30),
+        })
+        return state
+
+    def first_frame_at(self):
+        return self.tab.first_frame_at(self.player_delay, self.frame_delay)
+
+    def showing_video(self):
+        return self.tab.showing_video(time.monotonic(), self.player_delay, self.frame_delay, self.video_duration)
+
+    def set_script_timeout(self, timeout):
+        pass
+
+    def set_window_size(self, width, height):
+        self.command()
+        self.window_rect = (self.window_rect or (0, 0, 0, 0))[:2] + (width, height)
+
+    def set_window_position(self, x, y):
+        self.command()
+        self.window_rect = (x, y) + (self.window_rect or (0, 0, 0, 0))[2:]
+
+    def quit(self):
+        self._quit.set()
+
+
+def create_fake_driver(driver_name, profile_dir=None, kiosk=True, quality=None, **browser_options):
+    """create_driver stand-in returning a FakeBrowser; a partial of it can be handed to screen worker processes."""
+    return FakeBrowser(**browser_options)
+
+
+class FakeWebDriverServer:
+    """Local aiohttp server speaking the subset of the W3C WebDriver protocol AsyncWebDriver uses.
+
+    Each new session gets its own FakeBrowser (collected in `browsers`), so the async backend can be
+    benchmarked against the same simulated pages as the selenium one. The FakeBrowser calls block, so they
+    run on a private thread pool large enough for every session to wait for a playback event at once.
+    """
+
+    def __init__(self, workers=64, **browser_options):
+        self.browser_options = browser_options
+        self.browsers = []
+        self.sessions = {}
+        self.elements = {}
+        self.url = None
+        self._ids = itertools.count()
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._runner = None
+
+    async def start(self, host='127.0.0.1', port=0):
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_get('/status', self.handle_status)
+        app.router.add_post('/session', self.handle_new_session)
+        app.router.add_route('*', '/session/{session}', self.handle_delete_session)
+        app.router.add_route('*', '/session/{session}/{command:.+}', self.handle_command)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def close(self):
+        for browser in self.browsers:
+            browser.quit()
+        if self._runner is not None:
+            await self._runner.cleanup()
+        self._executor.shutdown(wait=False)
+
+    async def handle_status(self, request):
+        from aiohttp import web
+        return web.json_response({'value': {'ready': True}})
+
+    async def handle_new_session(self, request):
+        from aiohttp import web
+
+        session_id = f"session-{next(self._ids)}"
+        browser = FakeBrowser(**self.browser_options)
+        self.browsers.append(browser)
+        self.sessions[session_id] = browser
+        return web.json_response({'value': {'sessionId': session_id, 'capabilities': {}}})
+
+    async def handle_delete_session(self, request):
+        from aiohttp import web
+
+        browser = self.sessions.pop(request.match_info['session'], None)
+        if browser is not None:
+            browser.quit()
+        return web.json_response({'value': None})
+
+    async def handle_command(self, request):
+        from aiohttp import web
+
+        browser = self.sessions.get(request.match_info['session'])
+        if browser is None:
+            return web.json_response({'value': {'error': 'invalid session id', 'message': ''}}, status=404)
+        payload = await request.json() if request.can_read_body else {}
+        command = request.match_info['command']
+        try:
+            value = await asyncio.get_running_loop().run_in_executor(
+                self._executor, self.run_command, browser, request.method, command, payload)
+        except Exception as e:
+            return web.json_response({'value': {'error': 'unknown error', 'message': str(e)}}, status=500)
+        return web.json_response({'value': value})
+
+    def run_command(self, browser, method, command, payload):
+        if command == 'url':
+            return browser.get(payload['url'])
+        if command == 'window' and method == 'GET':
+            return browser.current_window_handle
+        if command == 'window':
+            return browser.switch_to.window(payload['handle'])
+        if command == 'window/new':
+            browser.command()
+            return {'handle': browser.open_tab(), 'type': payload.get('type', 'tab')}
+        if command == 'window/rect':
+            browser.set_window_position(payload['x'], payload['y'])
+            return browser.set_window_size(payload['width'], payload['height'])
+        if command == 'timeouts':
+            return None
+        if command == 'execute/sync':
+            return browser.execute_script(payload['script'], *payload['args'])
+        if command == 'execute/async':
+            return browser.execute_async_script(payload['script'], *payload['args'])
+        if command == 'elements':
+            found = []
+            for element in browser.find_elements('css selector', payload['value']):
+                element_id = f"element-{next(self._ids)}"
+                self.elements[element_id] = element
+                found.append({ELEMENT_KEY: element_id})
+            return found
+        _, element_id, action = command.split('/')
+        element = self.elements[element_id]
+        browser.command()
+        if action == 'value':
+            return element.send_keys(*payload['text'])
+        if action == 'text':
+            return element.text
+        return element.is_displayed() if action == 'displayed' else element.is_enabled()
+
+
+class FakeYouTubeApi:
+    """Local aiohttp server standing in for the YouTube search endpoint and a channel's /streams page.
+
+    Serves `videos` popular and `live` live results in pages, honours If-None-Match with 304s, answers
+    videos.list lookups (every `unembeddable`-th popular video blocks embedding), and can add latency or
+    fail a fraction of requests with 503s. Counts requests by kind in `calls`.
+    """
+
+    def __init__(self, videos=200, live=3, latency=0.0, error_rate=0.0, seed=0, unembeddable=0):
+        self.videos = [f"popular{i:05d}" for i in range(videos)]
+        self.live = [f"live{i:03d}" for i in range(live)]
+        self.latency = latency
+        self.error_rate = error_rate
+        self.unembeddable = unembeddable
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.url = None
+        self._runner = None
+
+    @property
+    def search_url(self):
+        return f"{self.url}/youtube/v3/search"
+
+    async def start(self, host='127.0.0.1', port=0):
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_get('/youtube/v3/search', self.handle_search)
+        app.router.add_get('/youtube/v3/videos', self.handle_videos)
+        app.router.add_get('/@{channel}/streams', self.handle_streams)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def _delay_or_fail(self, kind):
+        from aiohttp import web
+
+        self.calls[kind] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.calls[f'{kind}_error'] += 1
+            raise web.HTTPServiceUnavailable()
+
+    async def handle_search(self, request):
+        from aiohttp import web
+
+        await self._delay_or_fail('search')
+        query = request.query
+        ids = self.live if query.get('eventType') == 'live' else self.videos
+        offset = int(query.get('pageToken') or 0)
+        limit = int(query.get('maxResults') or 5)
+        page = ids[offset:offset + limit]
+        body = {'items': [{'id': {'kind': 'youtube#video', 'videoId': vid}} for vid in page]}
+        if offset + limit < len(ids):
+            body['nextPageToken'] = str(offset + limit)
+        etag = '"' + hashlib.sha1(json.dumps(body).encode()).hexdigest() + '"'
+        if request.headers.get('If-None-Match') == etag:
+            self.calls['search_not_modified'] += 1
+            return web.Response(status=304, headers={'ETag': etag})
+        body['etag'] = etag
+        return web.json_response(body, headers={'ETag': etag})
+
+    async def handle_videos(self, request):
+        from aiohttp import web
+
+        await self._delay_or_fail('videos')
+        items = []
+        for vid in request.query.get('id', '').split(','):
+            live = vid in self.live
+            if not live and vid not in self.videos:
+                continue  # Unknown IDs are left out, like deleted videos
+            index = 0 if live else self.videos.index(vid)
+            items.append({
+                'id': vid,
+                'snippet': {'liveBroadcastContent': 'live' if live else 'none'},
+                'contentDetails': {'duration': 'P0D' if live else f"PT{60 + index % 600}S"},
+                'status': {'embeddable': live or not self.unembeddable or index % self.unembeddable != 0,
+                           'privacyStatus': 'public', 'uploadStatus': 'processed'},
+            })
+        return web.json_response({'items': items})
+
+    async def handle_streams(self, request):
+        from aiohttp import web
+
+        await self._delay_or_fail('streams')
+        items = [{'richItemRenderer': {'content': {'videoRenderer': {'videoId': vid}}}} for vid in self.live]
+        initial_data = {'contents': {'richGridRenderer': {'contents': items}}}
+        html = f"<html><script>var ytInitialData = {json.dumps(initial_data)};</script></html>"
+        return web.Response(text=html, content_type='text/html')
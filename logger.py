@@ -1,40 +1,142 @@
+import atexit
+import json
 import logging
-from datetime import datetime
+import logging.handlers
+import os
+import queue
 import sys
+import time
+from datetime import datetime
 
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LOG_FILE = 'stream_background.log'
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_ROTATE_SECONDS = 86400
+LOG_BACKUP_COUNT = 7
+
+
+class RotatingLogHandler(logging.handlers.RotatingFileHandler):
+    """RotatingFileHandler that also rolls over at every max_age boundary (UTC midnight by default).
+
+    Backups are numbered like RotatingFileHandler's (.1 is the newest), whichever limit triggered them.
+    """
+
+    def __init__(self, filename, max_bytes=LOG_MAX_BYTES, max_age=LOG_ROTATE_SECONDS, backup_count=LOG_BACKUP_COUNT):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True)
+        self.max_age = max_age
+        self.rollover_at = self.next_boundary(time.time())
+        if max_age and os.path.exists(self.baseFilename):
+            if os.path.getmtime(self.baseFilename) < self.rollover_at - max_age:
+                self.rollover_at = 0  # Left over from before the last boundary; roll it over with the first record
+
+    def next_boundary(self, now):
+        if not self.max_age:
+            return float('inf')
+        return (now // self.max_age + 1) * self.max_age
+
+    def shouldRollover(self, record):
+        now = time.time()
+        if now >= self.rollover_at:
+            if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename) > 0:
+                return True
+            self.rollover_at = self.next_boundary(now)  # Nothing to roll over yet
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self.rollover_at = self.next_boundary(time.time())
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, for log shippers."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'module': record.module,
+            'process': record.processName,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
 
-def setup_logging():
-    # Determine the logging level based on command-line arguments
-    if "--debug-error" in sys.argv:
-        logging_level = logging.ERROR
-    elif "--debug-warning" in sys.argv:
-        logging_level = logging.WARNING
-    else:
-        logging_level = logging.INFO  # Default to INFO if no flags are provided
 
-    # Create a logger object
-    logger = logging.getLogger(__name__)
-    logger.setLevel(logging_level)  # Set the logging level for the logger object
+class ModuleLevelFilter(logging.Filter):
+    """Apply the level configured for the module a record was logged from, or the default level."""
+
+    def __init__(self, default_level, module_levels=None):
+        super().__init__()
+        self.default_level = default_level
+        self.module_levels = module_levels or {}
+
+    def filter(self, record):
+        return record.levelno >= self.module_levels.get(record.module, self.default_level)
+
+
+def level_number(level):
+    return level if isinstance(level, int) else logging.getLevelName(str(level).upper())
+
+
+def create_handlers(log_config=None, argv=None):
+    """The console and file handlers of the pipeline, each filtered by the configured levels.
+
+    LOG_LEVEL sets the default level and LOG_LEVELS maps module names to their own level; the
+    --debug-error and --debug-warning flags override LOG_LEVEL. LOG_FORMAT 'json' writes the file as
+    JSON lines, and an empty LOG_FILE disables it.
+    """
+    log_config = log_config or {}
+    argv = sys.argv if argv is None else argv
+    if "--debug-error" in argv:
+        default_level = logging.ERROR
+    elif "--debug-warning" in argv:
+        default_level = logging.WARNING
+    else:
+        default_level = level_number(log_config.get('LOG_LEVEL', 'INFO'))
+    module_levels = {module: level_number(level) for module, level in log_config.get('LOG_LEVELS', {}).items()}
+    level_filter = ModuleLevelFilter(default_level, module_levels)
 
-    # Setup logging to console
     console_handler = logging.StreamHandler()
-    console_handler.setLevel(logging_level)
-    console_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    console_handler.setFormatter(console_formatter)
-    logger.addHandler(console_handler)
-
-    # Setup logging to a file
-    current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"{current_time}.log"
-    file_handler = logging.FileHandler(filename)
-    file_handler.setLevel(logging_level)
-    file_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    file_handler.setFormatter(file_formatter)
-    logger.addHandler(file_handler)
+    console_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    handlers = [console_handler]
+    filename = log_config.get('LOG_FILE', LOG_FILE)
+    if filename:
+        file_handler = RotatingLogHandler(filename, log_config.get('LOG_MAX_BYTES', LOG_MAX_BYTES),
+                                          log_config.get('LOG_ROTATE_SECONDS', LOG_ROTATE_SECONDS),
+                                          log_config.get('LOG_BACKUP_COUNT', LOG_BACKUP_COUNT))
+        json_output = log_config.get('LOG_FORMAT', 'text') == 'json'
+        file_handler.setFormatter(JsonFormatter() if json_output else logging.Formatter(TEXT_FORMAT))
+        handlers.append(file_handler)
+    for handler in handlers:
+        handler.addFilter(level_filter)
+    return handlers, min([default_level, *module_levels.values()])
 
-    return logger
 
+def start_listener(handlers, log_queue=None):
+    """Start a QueueListener thread writing to handlers; returns (QueueHandler, listener)."""
+    log_queue = log_queue if log_queue is not None else queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return logging.handlers.QueueHandler(log_queue), listener
+
+
+def setup_logging(log_config=None, argv=None):
+    """Attach the queue pipeline to the root logger; called once by bootstrap.
+
+    Logging calls on the playback threads and the event loop only put the record on a queue. A listener
+    thread does the formatting and the file I/O, and is stopped (draining the queue) at exit.
+    """
+    handlers, level = create_handlers(log_config, argv)
+    queue_handler, listener = start_listener(handlers)
+    root = logging.getLogger()
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    atexit.register(listener.stop)
+    return logger
 
 
-# Global Logging Var
-logger = setup_logging()
+# Global Logging Var; handlers are attached by setup_logging() so importing this module creates no files
+logger = logging.getLogger(__name__)
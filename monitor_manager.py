@@ -1,254 +1,1207 @@
 import asyncio
-import random
+import shutil
 import threading
-import keyboard
 import time
-import queue
-from screeninfo import get_monitors
-from selenium import webdriver
-from selenium.webdriver import Keys
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options as ChromeOptions
-from selenium.webdriver.edge.options import Options as EdgeOptions
-from selenium.webdriver.firefox.options import Options as FirefoxOptions
-from selenium.webdriver.support import expected_conditions as ec
-from selenium.webdriver.support.ui import WebDriverWait
+from collections import Counter, deque
 from concurrent.futures import ThreadPoolExecutor
 
 
-from utility_helpers import config
-from youtube_api import cache_manager, fetch_live_videos, fetch_top_100_videos, BROWSER_WINDOW_SIZE, \
-    fetch_videos, CHANNEL, POPULAR_VIDEOS_LIMIT, LIVE_VIDEOS_LIMIT
-from yt_scrape import monitor_youtube_streams
+from cacher import MISSING, get_cache_manager
+from driver_factory import create_driver, clone_profile, PROFILE_TEMPLATE
+from utility_helpers import config, config_mtime, reload_config
+from youtube_api import BROWSER_WINDOW_SIZE, fetch_videos, paginate_videos, api_client, POPULAR_VIDEOS_LIMIT, \
+    LIVE_VIDEOS_LIMIT, CHANNELS, cache_key_for, fetch_channel_videos, rank_channel_videos, load_channels
+from scheduler import VideoScheduler
+from negative_cache import NegativeCache, NEGATIVE_CACHE_SKIPS
+from video_metadata import MetadataCache, enrich_videos, planned_seconds, unplayable_reason, UNPLAYABLE
+from refresh_scheduler import RefreshScheduler, get_quota_budget
+from player_scripts import WAIT_FOR_EVENT_SCRIPT, HEALTH_PROBE_SCRIPT, PRELOAD_SCRIPT, PAUSE_SCRIPT, \
+    START_PRELOADED_SCRIPT, SET_QUALITY_SCRIPT
+from playback_quality import quality_for_size, quality_url, step_down, step_up, quality_height, \
+    PLAYBACK_QUALITY, QUALITY_STEPS, QUALITY_RECOVERY_SECONDS
 from logger import logger
+from metrics import registry
+from timing import startup_timer
+from async_webdriver import create_async_driver, WebDriverError, SPACE
+from warm_restart import SNAPSHOT_INTERVAL, with_start, start_offset, write_snapshot
 
+QUEUE_LOW_WATER = config.get('QUEUE_LOW_WATER', 2)
+QUEUE_LOW_WATER_SECONDS = config.get('QUEUE_LOW_WATER_SECONDS', 900)  # Planned playing time per screen
+REFRESH_INTERVAL = config.get('REFRESH_INTERVAL', 5)  # Seconds between live/popular refresh checks
+POLL_INTERVAL = config.get('POLL_INTERVAL', 5)  # Seconds between health checks in 'poll' supervision
+PLAYBACK_SUPERVISION = config.get('PLAYBACK_SUPERVISION', 'events')  # 'events' or 'poll'
+EVENT_WAIT_TIMEOUT = config.get('EVENT_WAIT_TIMEOUT', 5)
+SWITCH_EVENTS = {'ended', 'pause', 'error', 'stalled'}
+HEALTH_HISTORY = config.get('HEALTH_HISTORY', 12)
+STALL_SECONDS = config.get('STALL_SECONDS', 10)
+DROPPED_FRAME_RATIO = config.get('DROPPED_FRAME_RATIO', 0.3)
+MIN_FRAMES_FOR_DROP_CHECK = 60
+PLAYER_GRACE_SECONDS = 4
+FIRST_FRAME_TIMEOUT = config.get('FIRST_FRAME_TIMEOUT', 10)  # Seconds a new video gets to start advancing
+PRELOAD_NEXT_VIDEO = config.get('PRELOAD_NEXT_VIDEO', True)
+# The spare window is parked here while it preloads: WebDriver only loads into the selected tab, which is shown
+SPARE_WINDOW_POSITION = (-32000, -32000)
+# 'selenium': blocking drivers, one thread per screen; 'async': W3C WebDriver over aiohttp, all screens on the loop
+WEBDRIVER_BACKEND = config.get('WEBDRIVER_BACKEND', 'selenium')
+# 'thread': every screen in this process; 'process': one worker process per screen, respawned when it dies or hangs
+SCREEN_ISOLATION = config.get('SCREEN_ISOLATION', 'thread')
+CONFIG_WATCH_INTERVAL = config.get('CONFIG_WATCH_INTERVAL', 2)  # Seconds between config file checks; 0 disables
+# Config keys a reload puts into effect without a restart; the module globals among them are simply replaced,
+# except the CHANNEL_SETTINGS, which only switch_channels applies, through load_channels
+LIVE_SETTINGS = {'QUEUE_LOW_WATER', 'QUEUE_LOW_WATER_SECONDS', 'REFRESH_INTERVAL', 'POLL_INTERVAL', 'STALL_SECONDS',
+                 'DROPPED_FRAME_RATIO', 'PRELOAD_NEXT_VIDEO', 'CONFIG_WATCH_INTERVAL', 'BROWSER_WINDOW_SIZE',
+                 'LIVE_VIDEOS_LIMIT', 'POPULAR_VIDEOS_LIMIT', 'CHANNELS', 'CHANNEL_ID', 'CHANNEL'}
+CHANNEL_SETTINGS = {'CHANNELS', 'CHANNEL_ID', 'CHANNEL'}
+PLAYER_WAIT_SECONDS = 4
+MAX_PLAY_ATTEMPTS = 3  # Videos tried in a row before a screen waits for the next rotation
+# Failures that say something about the video rather than the browser, and so go into the negative cache;
+# 'error' is the media element's error event
+VIDEO_FAILURES = {'player_error', 'error'}
+# Failures a slow network or browser causes as well; the negative cache only takes them once they repeat
+TRANSIENT_VIDEO_FAILURES = {'timeout', 'no_player'}
 
-def create_driver(driver_name):
-    logger.info(f"Creating driver for: {driver_name}")
-    if driver_name == 'chrome':  # doesnt work
-        options = ChromeOptions()
-        options.add_argument('--kiosk')
-        options.add_experimental_option("useAutomationExtension", False)
-        options.add_experimental_option(
-            'excludeSwitches',
-            ['disable-sync',
-             'disable-signin-promo',
-             'disable-infobars'])
-        browser = webdriver.Chrome(options=options)
-
-    elif driver_name == 'firefox':
-        options = FirefoxOptions()
-        # Disable images
-        options.set_preference('permissions.default.image', 2)
-        # Disable CSS
-        options.set_preference('permissions.default.stylesheet', 2)
-        # Suppress pop-ups
-        options.set_preference('dom.disable_open_during_load', True)
-        options.set_preference("identity.fxaccounts.enabled", False)
-        options.add_argument('--kiosk')
-        browser = webdriver.Firefox(options=options)
-
-    elif driver_name == 'edge':
-        options = EdgeOptions()
-        options.use_chromium = True
-        options.add_argument('--kiosk')
-        options.add_experimental_option("useAutomationExtension", False)
-        options.add_experimental_option(
-            'excludeSwitches',
-            ['disable-sync',
-             'disable-signin-promo',
-             'enable-automation',
-             'disable-infobars'])
-        browser = webdriver.Edge(options=options)
-
-    else:
-        logger.error(f"Unsupported driver: {driver_name}")
-        raise ValueError(f"Unsupported driver: {driver_name}")
-
-    logger.info(f"Driver for {driver_name} created.")
-    return browser
+
+QUEUE_DEPTH = registry.gauge('video_queue_depth', 'Videos waiting in the scheduler')
+TIME_TO_FIRST_FRAME = registry.histogram('video_time_to_first_frame_seconds',
+                                         "Time from starting a switch until the new video's currentTime advances",
+                                         ('mode',))
+DEAD_SCREEN_SECONDS = registry.counter('screen_dead_seconds_total',
+                                       'Seconds a screen spent without a playing video, from the first sign of '
+                                       "trouble until a video's currentTime advances again", ('screen',))
+ROTATIONS = registry.counter('video_rotations_total', 'Video switches forced by supervision', ('reason',))
+PROBE_SECONDS = registry.histogram('monitor_probe_seconds', 'Latency of the single-call health probe')
+
+
+class PlayerError(Exception):
+    """The embed is showing its error overlay instead of a player."""
+
+
+def apply_live_settings(changes):
+    """Install reloaded LIVE_SETTINGS values in the module globals that hold them. CHANNEL_SETTINGS are left
+    alone: the channel list is parsed by load_channels, and only the manager switches channels.
+
+    Returns the changed keys that only take effect after a restart, including removed keys, whose
+    defaults are not known here.
+    """
+    import youtube_api
+
+    module = globals()
+    for key, value in changes.items():
+        if key not in LIVE_SETTINGS or key in CHANNEL_SETTINGS or value is None:
+            continue
+        if key == 'BROWSER_WINDOW_SIZE':
+            value = tuple(value)
+        if key in module:
+            module[key] = value
+        if key in ('BROWSER_WINDOW_SIZE', 'LIVE_VIDEOS_LIMIT', 'POPULAR_VIDEOS_LIMIT'):
+            setattr(youtube_api, key, value)
+    return {key for key, value in changes.items() if key not in LIVE_SETTINGS or value is None}
+
+
+def close_monitor(monitor):
+    try:
+        monitor.close()
+    except Exception as e:
+        logger.error(f"Failed to close browser: {e}")
+
+
+def preload_url(url):
+    return url + ('&' if '?' in url else '?') + 'autoplay=1&mute=1'
+
+
+def window_position(screen):
+    """Top-left corner that centres a BROWSER_WINDOW_SIZE window on screen."""
+    window_width, window_height = BROWSER_WINDOW_SIZE
+    return (screen.width - window_width) // 2 + screen.x, (screen.height - window_height) // 2 + screen.y
+
+
+def init_monitor(driver_name, screen, name=None):
+    """Start a browser, place it centred on screen and wrap it in a Monitor."""
+    # Kiosk windows fill the screen, so its pixel size decides how much video quality is worth decoding
+    quality = quality_for_size(screen.width, screen.height)
+    with startup_timer.phase('driver_spawn'):
+        profile_dir = clone_profile(PROFILE_TEMPLATE) if PROFILE_TEMPLATE else None
+        browser = create_driver(driver_name, profile_dir, quality=quality)
+
+    logger.info('Browser window opened')
+    with startup_timer.phase('window_placement'):
+        position_x, position_y = window_position(screen)
+        browser.set_window_size(*BROWSER_WINDOW_SIZE)
+        browser.set_window_position(position_x, position_y)
+
+    logger.info(f'Browser initialized on monitor with position: x={position_x}, y={position_y}')
+    return Monitor(browser, screen=screen, profile_dir=profile_dir, name=name, quality=quality)
+
+
+def get_screens():
+    from screeninfo import get_monitors
+    return get_monitors()
+
+
+async def init_async_monitor(driver_name, screen, name=None):
+    """init_monitor for the async backend: the session is started and placed without blocking the loop."""
+    quality = quality_for_size(screen.width, screen.height)
+    with startup_timer.phase('driver_spawn'):
+        profile_dir = clone_profile(PROFILE_TEMPLATE) if PROFILE_TEMPLATE else None
+        browser = await create_async_driver(driver_name, profile_dir, quality=quality,
+                                            script_timeout=EVENT_WAIT_TIMEOUT + 5)
+    with startup_timer.phase('window_placement'):
+        position_x, position_y = window_position(screen)
+        await browser.set_window_rect(position_x, position_y, *BROWSER_WINDOW_SIZE)
+    logger.info(f'Browser initialized on monitor with position: x={position_x}, y={position_y}')
+    return AsyncMonitor(browser, screen=screen, profile_dir=profile_dir, name=name, quality=quality)
+
+
+async def spawn_async_monitors(driver_name, screens=None):
+    """Bring up one browser session per screen concurrently on the event loop."""
+    screens = get_screens() if screens is None else screens
+    return list(await asyncio.gather(*(init_async_monitor(driver_name, screen, f"screen{i}")
+                                       for i, screen in enumerate(screens))))
+
+
+def spawn_monitors(driver_name, screens=None):
+    """Bring up one browser per screen in parallel."""
+    if screens is None:
+        screens = get_screens()
+    with ThreadPoolExecutor(max_workers=len(screens)) as executor:
+        return list(executor.map(lambda args: init_monitor(driver_name, args[1], f"screen{args[0]}"),
+                                 enumerate(screens)))
 
 
 class Monitor:
-    def __init__(self, browser, url=None):
+    """One screen's browser.
+
+    Every method that talks to the browser is written once, as a generator of steps: it yields browser
+    commands such as ('get', url) or ('execute_script', script) and gets each result sent back, or the
+    command's exception raised where it yielded. run() carries the steps out with blocking WebDriver calls;
+    AsyncMonitor overrides run() and execute() to await them instead, so the public methods return
+    coroutines there and everything else is shared.
+    """
+
+    def __init__(self, browser, url=None, screen=None, profile_dir=None, name=None, quality=None):
         self.browser = browser
+        self.name = name or f"screen{id(self):x}"
         self.current_url = url
+        self.screen = screen  # screeninfo geometry the window was placed on
+        self.profile_dir = profile_dir  # Cloned profile removed again on close
+        self.loaded_at = time.monotonic()
+        self.start_offset = 0  # Embed start= of the current video, when it resumed where a previous run left off
+        self.health_history = deque(maxlen=HEALTH_HISTORY)  # (monotonic time, probe state) samples
+        self.probe_stats = {'probes': 0, 'failures': 0, 'latency_total': 0.0, 'latency_max': 0.0}
+        self.browser_errors = 0  # Failed browser commands; a ScreenWorker then checks the session is still alive
+        self.dead_since = time.monotonic()  # Since when the screen has shown no playing video; None while it does
+        self.first_frame_seconds = None  # How long the current video took to start advancing, if it was seen
+        self.spare_handle = None  # Off-screen window the next video is preloaded into
+        self.preloaded_url = None
+        self.max_quality = quality  # Cap chosen from the screen size; None leaves quality to YouTube
+        self.quality = quality  # Current cap, lowered while the screen drops frames
+        self.quality_changed_at = time.monotonic()
+        self.stop_event = None  # The supervisor's cancellation event, set while a playback loop runs this screen
+        if quality:
+            PLAYBACK_QUALITY.set(quality_height(quality), screen=self.name)
+        self.configure_browser()
+
+    def configure_browser(self):
+        try:
+            self.browser.set_script_timeout(EVENT_WAIT_TIMEOUT + 5)
+        except Exception as e:
+            logger.error(f"Error setting script timeout: {e}")
+
+    def cancelled(self):
+        return self.stop_event is not None and self.stop_event.is_set()
+
+    def run(self, steps):
+        """Carry out steps and return what they return."""
+        send, value = steps.send, None
+        while True:
+            try:
+                command = send(value)
+            except StopIteration as stop:
+                return stop.value
+            try:
+                send, value = steps.send, self.execute(*command)
+            except BaseException as e:
+                send, value = steps.throw, e
+
+    def execute(self, command, *args):
+        """One browser command of a step generator, as a blocking selenium call."""
+        if command == 'sleep':  # Returns early once the supervisor stops
+            if self.stop_event is not None:
+                self.stop_event.wait(*args)
+            else:
+                time.sleep(*args)
+            return None
+        if command == 'handle':
+            return self.browser.current_window_handle
+        if command == 'new_window':
+            self.browser.switch_to.new_window('window')
+            return self.browser.current_window_handle
+        if command == 'switch':
+            return self.browser.switch_to.window(*args)
+        if command == 'rect':
+            x, y, width, height = args
+            self.browser.set_window_size(width, height)
+            return self.browser.set_window_position(x, y)
+        if command == 'keys':  # To the player
+            return self.browser.find_element('css selector', "video.video-stream").send_keys(*args)
+        return getattr(self.browser, command)(*args)  # get, execute_script, execute_async_script, quit
+
+    def place_window(self):
+        """Resize and re-centre the window on its screen, e.g. after BROWSER_WINDOW_SIZE changed."""
+        return self.run(self.place_window_steps())
+
+    def place_window_steps(self):
+        if self.screen is not None:
+            yield ('rect', *window_position(self.screen), *BROWSER_WINDOW_SIZE)
 
     def play_video(self, url):
+        """Start url on this screen. Returns None once playback was started, otherwise the failure reason."""
+        return self.run(self.play_video_steps(url))
+
+    def play_video_steps(self, url):
+        self.first_frame_seconds = None
         if self.current_url == url:  # Prevent replaying the same video
-            return
+            return None
+        started = time.perf_counter()
+        if url == self.preloaded_url and (yield from self.swap_to_preloaded_steps(url)):
+            yield from self.wait_for_first_frame_steps(started, 'preloaded')
+            return None
         try:
             logger.info(f'Video Started: {url}')
-            self.browser.get(url)
-            self.current_url = url
-            player = WebDriverWait(self.browser, 4).until(  # can probably be lower
-                ec.element_to_be_clickable((By.CSS_SELECTOR, "video.video-stream"))
-            )
-            player.send_keys('f', Keys.SPACE)
+            yield 'get', quality_url(url, self.quality)
+            self.mark_started(url)
+            if not (yield from self.wait_for_player_steps()):
+                return 'cancelled'
+            yield 'keys', 'f', SPACE
+            yield from self.apply_quality_steps()
+        except PlayerError as e:
+            logger.error(f"Player error for {url}: {e}")
+            return 'player_error'
+        except TimeoutError:
+            logger.error(f"Error playing video: no player appeared for {url}")
+            return 'timeout'
         except Exception as e:
+            self.browser_errors += 1
             logger.error(f"Error playing video: {e}")
+            return 'browser_error'
+        yield from self.wait_for_first_frame_steps(started, 'reload')
+        return None
+
+    def wait_for_first_frame_steps(self, started, mode, timeout=FIRST_FRAME_TIMEOUT, poll=0.1):
+        """Probe until the player's currentTime advances, then record the time since started (perf_counter)
+        and stop the dead-screen clock. False if it did not within timeout; the health check takes over then."""
+        deadline = time.monotonic() + timeout
+        baseline = None
+        while not self.cancelled() and time.monotonic() < deadline:
+            state = yield from self.probe_steps()
+            position = state.get('currentTime') if state else None
+            if position is not None:
+                if baseline is not None and position > baseline:
+                    self.first_frame_seconds = time.perf_counter() - started
+                    TIME_TO_FIRST_FRAME.observe(self.first_frame_seconds, mode=mode)
+                    self.mark_playing()
+                    return True
+                baseline = position if baseline is None else min(baseline, position)
+            yield 'sleep', poll
+        return False
+
+    def mark_dead(self, since=None):
+        """Start the dead-screen clock, at since if the trouble began before it was noticed."""
+        if self.dead_since is None:
+            self.dead_since = time.monotonic() if since is None else since
+
+    def mark_playing(self):
+        """Stop the dead-screen clock and count the time it ran."""
+        if self.dead_since is not None:
+            DEAD_SCREEN_SECONDS.inc(time.monotonic() - self.dead_since, screen=self.name)
+            self.dead_since = None
+
+    def wait_for_player_steps(self, timeout=PLAYER_WAIT_SECONDS, poll=0.2):
+        """Poll with the one-call health probe until the player is present, so a broken video fails as soon as
+        the error overlay shows. False if the supervisor stopped first; raises PlayerError or TimeoutError."""
+        deadline = time.monotonic() + timeout
+        while not self.cancelled():
+            state = yield 'execute_script', HEALTH_PROBE_SCRIPT
+            if state.get('playerError'):
+                raise PlayerError(state['playerError'])
+            if state.get('present'):
+                return True
+            if time.monotonic() >= deadline:
+                raise TimeoutError()
+            yield 'sleep', poll
+        return False
+
+    def mark_started(self, url):
+        self.current_url = url
+        self.loaded_at = time.monotonic()
+        self.start_offset = start_offset(url)
+        self.health_history.clear()
+
+    def playback_position(self):
+        """Seconds into the current video: from the last health probe, or else counted from when it started.
+
+        Bookkeeping only, so it can be read from any thread without a browser call.
+        """
+        if self.current_url is None:
+            return None
+        now = time.monotonic()
+        if self.health_history:
+            probed_at, state = self.health_history[-1]
+            return state['currentTime'] + now - probed_at
+        return self.start_offset + now - self.loaded_at
+
+    def preload(self, url):
+        """Load url muted and paused in the spare window so the next play_video only has to swap to it."""
+        return self.run(self.preload_steps(url))
+
+    def preload_steps(self, url):
+        if not PRELOAD_NEXT_VIDEO or url is None or url in (self.current_url, self.preloaded_url):
+            return
+        visible_handle = yield ('handle',)
+        try:
+            if self.spare_handle is None:
+                self.spare_handle = yield ('new_window',)
+                if self.screen is not None:
+                    yield ('rect', *SPARE_WINDOW_POSITION, *BROWSER_WINDOW_SIZE)
+            else:
+                yield 'switch', self.spare_handle
+            yield 'get', preload_url(quality_url(url, self.quality))
+            yield 'execute_script', PRELOAD_SCRIPT
+            self.preloaded_url = url
+            logger.debug(f'Preloaded {url}')
+        except Exception as e:
+            self.preloaded_url = None
+            logger.error(f"Error preloading video: {e}")
+        finally:
+            try:
+                yield 'switch', visible_handle
+            except Exception as e:
+                self.browser_errors += 1
+                logger.error(f"Error switching back from the preload window: {e}")
+
+    def swap_to_preloaded_steps(self, url):
+        """Bring the preloaded window on screen and start it; the old window becomes the next spare."""
+        visible_handle = yield ('handle',)
+        try:
+            yield 'execute_script', PAUSE_SCRIPT
+            yield 'switch', self.spare_handle
+            if not (yield 'execute_script', START_PRELOADED_SCRIPT):
+                yield 'switch', visible_handle
+                return False
+            if self.screen is not None:
+                # Bring the spare window on screen and park the old one in its place
+                yield from self.place_window_steps()
+                yield 'switch', visible_handle
+                yield ('rect', *SPARE_WINDOW_POSITION, *BROWSER_WINDOW_SIZE)
+                yield 'switch', self.spare_handle
+            self.spare_handle, self.preloaded_url = visible_handle, None
+            logger.info(f'Video Started (preloaded): {url}')
+            self.mark_started(url)
+            yield 'keys', 'f'
+            yield from self.apply_quality_steps()  # The cap may have been lowered since this window was preloaded
+            return True
+        except Exception as e:
+            logger.error(f"Error switching to preloaded video: {e}")
+            self.preloaded_url = None
+            return self.current_url == url
+
+    def apply_quality_steps(self):
+        """Pin the visible player to the current quality cap."""
+        if not self.quality:
+            return
+        try:
+            yield 'execute_script', SET_QUALITY_SCRIPT, self.quality
+        except Exception as e:
+            logger.debug(f"Failed to set playback quality: {e}\nWindow: {self.current_url}")
+
+    def set_quality(self, quality, direction):
+        logger.info(f"{self.name}: playback quality {self.quality} -> {quality}")
+        self.quality = quality
+        self.quality_changed_at = time.monotonic()
+        self.health_history.clear()  # Judge the new quality on its own frames
+        PLAYBACK_QUALITY.set(quality_height(quality), screen=self.name)
+        QUALITY_STEPS.inc(direction=direction)
+
+    def step_quality_down_steps(self):
+        """Lower the cap one level after dropped frames; False once it is already at the floor."""
+        lower = step_down(self.quality) if self.quality else None
+        if lower is None:
+            return False
+        self.set_quality(lower, 'down')
+        yield from self.apply_quality_steps()
+        return True
+
+    def restore_quality_steps(self):
+        """Raise the cap one level once QUALITY_RECOVERY_SECONDS passed without trouble."""
+        if not self.quality or time.monotonic() - self.quality_changed_at < QUALITY_RECOVERY_SECONDS:
+            return
+        higher = step_up(self.quality, self.max_quality)
+        if higher is not None:
+            self.set_quality(higher, 'up')
+            yield from self.apply_quality_steps()
 
     def close(self):
-        self.browser.quit()
+        return self.run(self.close_steps())
+
+    def close_steps(self):
+        try:
+            yield ('quit',)
+        finally:
+            if self.profile_dir:
+                shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+    def is_responsive(self):
+        """False once the WebDriver session or the browser behind it is gone."""
+        return self.run(self.is_responsive_steps())
+
+    def is_responsive_steps(self):
+        try:
+            yield 'execute_script', 'return 1;'
+            return True
+        except Exception:
+            return False
 
     def is_page_loaded(self):
+        return self.run(self.is_page_loaded_steps())
+
+    def is_page_loaded_steps(self):
         try:
-            return self.browser.execute_script("return document.readyState") == "complete"
+            return (yield 'execute_script', "return document.readyState") == "complete"
         except Exception as e:
             logger.error(f"Error checking page load status: {e}")
             return False
 
     def is_playing_video(self):
+        """Whether the player is present within PLAYER_WAIT_SECONDS and not paused."""
+        return self.run(self.is_playing_video_steps())
+
+    def is_playing_video_steps(self):
         try:
-            # Wait for the video player element to be present on the page
-            WebDriverWait(self.browser, 4).until(  # can probably be lower
-                ec.presence_of_element_located((By.CSS_SELECTOR, "video.video-stream"))
-            )
-            player = self.browser.find_element(By.CSS_SELECTOR, "video.video-stream")
-            return not self.browser.execute_script("return arguments[0].paused", player)
+            if not (yield from self.wait_for_player_steps()):
+                return False
+            state = yield 'execute_script', HEALTH_PROBE_SCRIPT
+            return not state.get('paused', True)
         except Exception as e:
-            logger.debug(f"Failed to check page status\nWindow: {self.current_url}")
+            logger.debug(f"Failed to check page status: {e}\nWindow: {self.current_url}")
             return False
 
+    def probe_steps(self):
+        """Fetch document and player state in one execute_script call; None if the browser is unreachable."""
+        started = time.perf_counter()
+        try:
+            state = yield 'execute_script', HEALTH_PROBE_SCRIPT
+        except Exception as e:
+            self.probe_stats['failures'] += 1
+            self.browser_errors += 1
+            logger.debug(f"Health probe failed: {e}\nWindow: {self.current_url}")
+            return None
+        latency = time.perf_counter() - started
+        PROBE_SECONDS.observe(latency)
+        self.probe_stats['probes'] += 1
+        self.probe_stats['latency_total'] += latency
+        self.probe_stats['latency_max'] = max(self.probe_stats['latency_max'], latency)
+        return state
+
+    def check_health_steps(self):
+        """Probe the player and return why it should be rotated ('player_error', 'no_player', 'ended', 'paused',
+        'stalled', 'dropped_frames'), or None while it is healthy or still loading."""
+        return self.assess_health((yield from self.probe_steps()))
+
+    def assess_health(self, state):
+        if state is None or state.get('readyState') != 'complete':
+            return None
+        now = time.monotonic()
+        if state.get('playerError'):
+            self.mark_dead()
+            return 'player_error'
+        if not state.get('present'):
+            if now - self.loaded_at <= PLAYER_GRACE_SECONDS:
+                return None
+            self.mark_dead()
+            return 'no_player'
+        if state.get('ended') or state.get('paused'):
+            self.mark_dead()
+            return 'ended' if state.get('ended') else 'paused'
+
+        if self.health_history and state['currentTime'] > self.health_history[-1][1]['currentTime']:
+            self.mark_playing()
+        self.health_history.append((now, state))
+        # The newest sample at least STALL_SECONDS old, so a frozen player is caught soon after STALL_SECONDS
+        stall_time, stall_reference = next(((sample_time, sample) for sample_time, sample
+                                            in reversed(self.health_history) if now - sample_time >= STALL_SECONDS),
+                                           (None, None))
+        if stall_reference is not None and state['currentTime'] - stall_reference['currentTime'] < 0.1:
+            self.mark_dead(since=stall_time)  # Frozen since that sample at the latest
+            return 'stalled'
+        oldest = self.health_history[0][1]
+        total = state['totalFrames'] - oldest['totalFrames']
+        dropped = state['droppedFrames'] - oldest['droppedFrames']
+        if total >= MIN_FRAMES_FOR_DROP_CHECK and dropped / total > DROPPED_FRAME_RATIO:
+            return 'dropped_frames'
+        return None
+
+    def wait_for_playback_event_steps(self, timeout=EVENT_WAIT_TIMEOUT):
+        """Block until the player reports ended/pause/error/stalled or timeout seconds pass.
+
+        Returns the script's {events, paused, ended} report, or None if the browser could not be queried.
+        """
+        try:
+            return (yield 'execute_async_script', WAIT_FOR_EVENT_SCRIPT, int(timeout * 1000))
+        except Exception as e:
+            self.browser_errors += 1
+            logger.debug(f"Failed to wait for playback event: {e}\nWindow: {self.current_url}")
+            return None
+
+
+class AsyncMonitor(Monitor):
+    """Monitor driven through an AsyncWebDriver: the same steps, with every browser command awaited on the
+    event loop, so play_video(), preload(), place_window(), close() and the is_* checks return coroutines."""
+
+    def configure_browser(self):
+        pass  # The script timeout is part of the session capabilities
+
+    async def run(self, steps):
+        send, value = steps.send, None
+        while True:
+            try:
+                command = send(value)
+            except StopIteration as stop:
+                return stop.value
+            try:
+                send, value = steps.send, await self.execute(*command)
+            except BaseException as e:
+                send, value = steps.throw, e
+
+    async def execute(self, command, *args):
+        if command == 'sleep':  # A stopped supervisor's task is cancelled, which ends the sleep
+            return await asyncio.sleep(*args)
+        if command == 'handle':
+            return self.browser.current_window_handle
+        if command == 'new_window':
+            return await self.browser.new_window('window')
+        if command == 'switch':
+            return await self.browser.switch_to_window(*args)
+        if command == 'rect':
+            return await self.browser.set_window_rect(*args)
+        if command == 'keys':
+            players = await self.browser.find_elements("video.video-stream")
+            if not players:
+                raise WebDriverError('no such element', 'video.video-stream')
+            return await players[0].send_keys(*args)
+        return await getattr(self.browser, command)(*args)
+
+
+class ScreenSupervisor:
+    """The playback loop of one screen: start videos, watch the player and rotate when it needs to.
+
+    The loop is written once as Monitor steps: a thread runs it with monitor.run() and an AsyncMonitor
+    as a task on the event loop. Subclasses supply stop_event, the shared cancellation event every wait
+    returns on, and the queue side: claim_next_video, give_back_video, peek_next_video, record_attempt and
+    record_rotation.
+    MonitorManager answers them from its own scheduler; a ScreenWorker in a separate process forwards them
+    to the manager over a pipe.
+    """
+
+    def is_stopped(self):
+        return self.stop_event.is_set()
+
+    def play_video_in_monitor(self, monitor):
+        monitor.stop_event = self.stop_event
+        monitor.run(self.supervise_steps(monitor))
+
+    def play_next_video_steps(self, monitor):
+        for _ in range(MAX_PLAY_ATTEMPTS):
+            video_url = None if self.is_stopped() else self.claim_next_video(monitor)
+            if video_url is None:
+                return
+            failure = yield from monitor.play_video_steps(video_url)
+            if failure == 'browser_error':
+                # The browser, not the video, is at fault: hand the video back uncooled rather than burn
+                # more of the queue, and leave the screen idle until its session is checked
+                monitor.current_url = None
+                self.give_back_video(monitor)
+                return
+            if self.record_attempt(video_url, failure, monitor.first_frame_seconds):
+                yield from monitor.preload_steps(self.peek_next_video(monitor))
+                return
+
+    def rotate_steps(self, monitor, reason):
+        self.record_rotation(monitor, reason)
+        monitor.mark_dead()  # Unless the probe that found the trouble dated it earlier
+        yield from self.play_next_video_steps(monitor)
 
-class MonitorManager:
-    def __init__(self, live_videos=None, top_videos=None):
-        # Loading the tokens from the cache
-        view_count_cache = cache_manager.load_from_cache('viewCount')
-        live_video_cache = cache_manager.load_from_cache('live')
+    def check_monitor_steps(self, monitor):
+        """Health-check monitor. Dropped frames first cost quality and only rotate the video at the lowest cap."""
+        reason = yield from monitor.check_health_steps()
+        if reason == 'dropped_frames' and (yield from monitor.step_quality_down_steps()):
+            return None
+        if reason is None:
+            yield from monitor.restore_quality_steps()
+        return reason
 
-        self.next_popular_page_token = view_count_cache.get('last_page_token', None) if view_count_cache else None
-        self.live_next_page_token = live_video_cache.get('last_page_token', None) if live_video_cache else None
-        self.prev_count = len(live_video_cache.get('urls', []) if live_video_cache else [])
+    @staticmethod
+    def event_switch_reason(report):
+        """The rotation reason a playback event report calls for, or None."""
+        events = report.get('events', [])
+        if SWITCH_EVENTS.intersection(events) or report.get('paused') or report.get('ended'):
+            return next(iter(SWITCH_EVENTS.intersection(events)), 'paused')
+        return None
+
+    def supervise_steps(self, monitor):
+        """Until stopped: with 'events' supervision wait for player events and health-check the quiet intervals
+        for stalls and frame drops that fire none; with 'poll' health-check every POLL_INTERVAL."""
+        while not self.is_stopped():
+            if monitor.current_url is None:
+                yield from self.play_next_video_steps(monitor)
+                if monitor.current_url is None:
+                    yield 'sleep', 1  # Nothing queued yet; the dead-screen clock keeps running
+                continue
+
+            if PLAYBACK_SUPERVISION == 'events':
+                report = yield from monitor.wait_for_playback_event_steps()
+            else:
+                report = {}
+                yield 'sleep', POLL_INTERVAL
+            if self.is_stopped():
+                break
+            if report is None:
+                yield 'sleep', 1  # Browser busy navigating or unreachable, try again shortly
+                continue
+
+            events = report.get('events', [])
+            reason = self.event_switch_reason(report)
+            if reason:
+                logger.debug(f"Player events {events} on {monitor.current_url}, switching video")
+                yield from self.rotate_steps(monitor, reason)
+                continue
+
+            reason = yield from self.check_monitor_steps(monitor)
+            if reason:
+                yield from self.rotate_steps(monitor, reason)
+            elif 'missing' in events:
+                yield 'sleep', 1
+
+
+class MonitorManager(ScreenSupervisor):
+    def __init__(self, live_videos=None, top_videos=None, cache_manager=None, channel_videos=None, channels=None,
+                 snapshot=None):
+        """live_videos/top_videos are the first channel's lists; channel_videos maps channel IDs to
+        (live, popular) pairs for the others. Whatever is not passed comes from the cache or the API.
+
+        A warm-restart snapshot (see save_snapshot) replaces all of that: its queue is restored as it was
+        and every screen resumes its video, without an API call."""
+        self.cache_manager = cache_manager or get_cache_manager()
+        self.channels = channels or CHANNELS
+        # Per-channel state, keyed by channel ID
+        self.live_videos = {}
+        self.top_videos = {}
+        self.next_popular_page_tokens = {}
+        self.prev_counts = {}
+        self.popular_pages = {}  # Paginators over each channel's remaining viewCount pages, created on first use
         self.driver_name = config.get('WEB_DRIVER', 'firefox').lower()
         self.monitors = []
-        self.STOP_THREADS = False
-        self.video_queue = queue.PriorityQueue()
-        self.active_videos = set()  # Create a set of active videos
-
-        # If live_videos is not provided, fetch it from the cache or API
-        if live_videos is None:
-            if cache_manager.is_cache_valid('live'):
-                self.live_videos = live_video_cache.get('urls', [])
-            else:
-                self.live_videos = asyncio.run(fetch_live_videos())
+        self.stop_event = threading.Event()  # Shared cancellation: set once by stop(), wakes every waiting loop
+        self._stopped = None  # asyncio mirror of stop_event for the coroutines, made on first use
+        self._loop = None
+        self.scheduler = VideoScheduler()
+        self.popular_prefetch = None  # In-flight background fetch of the next popular pages
+        self.resume = {}  # Screen name -> video URL with start= to play first, from the snapshot
+        self.rotations = Counter()  # Video switches forced by the health check, by reason
+        self.refresh_scheduler = RefreshScheduler(get_quota_budget(), self.cache_manager)
+        self.metadata = MetadataCache(self.cache_manager)
+        self.failures = NegativeCache(self.cache_manager)
+        from yt_scrape import create_live_detector
+        self.live_detector = create_live_detector(config.get('LIVE_DETECTOR', 'http'), self.driver_name,
+                                                  api_client.get_session,
+                                                  config.get('LIVE_COUNT_ADJUSTMENTS', {}))
 
-        # If top_videos is not provided, fetch it from the cache or API
-        if top_videos is None:
-            if cache_manager.is_cache_valid('viewCount'):
-                self.top_videos = view_count_cache.get('urls', [])
-            else:
-                self.top_videos = asyncio.run(fetch_top_100_videos())
+        channel_videos = dict(channel_videos or {})
+        if live_videos is not None or top_videos is not None:
+            channel_videos.setdefault(self.channels[0].id, (live_videos, top_videos))
 
-        self.enqueue_videos(live_videos, top_videos)
+        # Channels the cache cannot serve are fetched together
+        missing = self.load_cached_channels(self.channels, channel_videos)
+        if snapshot is not None and self.restore_snapshot(snapshot):
+            # Lists the cache lacks are refreshed in the background like any other
+            self.store_fetched_channels({channel.id: ([], []) for channel in missing})
+            return
+        if missing:
+            self.store_fetched_channels(asyncio.run(fetch_channel_videos(missing)))
 
-    def is_stopped(self):
-        return self.STOP_THREADS
+        self.enqueue_videos(self.live_videos, self.top_videos)
+
+    def load_cached_channels(self, channels, channel_videos=None):
+        """Set up the per-channel state from channel_videos or the cache; returns the channels neither covers."""
+        channel_videos = channel_videos or {}
+        missing = []
+        for channel in channels:
+            # Loading the tokens from the cache
+            live_key, popular_key = cache_key_for('live', channel.id), cache_key_for('viewCount', channel.id)
+            live_video_cache = self.cache_manager.load_from_cache(live_key) or {}
+            view_count_cache = self.cache_manager.load_from_cache(popular_key) or {}
+            self.next_popular_page_tokens[channel.id] = view_count_cache.get('last_page_token')
+            self.prev_counts[channel.id] = len(live_video_cache.get('urls', []))
+
+            live, top = channel_videos.get(channel.id, (None, None))
+            if live is None and self.cache_manager.cache_state(live_key) != MISSING:
+                live = live_video_cache.get('urls', [])
+            if top is None and self.cache_manager.cache_state(popular_key) != MISSING:
+                top = view_count_cache.get('urls', [])
+            self.live_videos[channel.id], self.top_videos[channel.id] = live, top
+            if live is None or top is None:
+                missing.append(channel)
+        return missing
+
+    def store_fetched_channels(self, fetched):
+        for channel_id, (live, top) in fetched.items():
+            if self.live_videos[channel_id] is None:
+                self.live_videos[channel_id] = live
+            if self.top_videos[channel_id] is None:
+                self.top_videos[channel_id] = top
+            # Where the fetch got to; still None if its first page failed
+            view_count_cache = self.cache_manager.load_from_cache(cache_key_for('viewCount', channel_id)) or {}
+            self.next_popular_page_tokens[channel_id] = view_count_cache.get('last_page_token')
+
+    def restore_snapshot(self, snapshot):
+        """Take over the queue, cooldowns, page tokens and screens of a snapshot; False if it does not fit."""
+        if snapshot.get('channels') != [channel.id for channel in self.channels]:
+            logger.info("Playback snapshot is for other channels; starting afresh")
+            return False
+        downtime = max(0.0, time.time() - snapshot['saved_at'])
+        self.scheduler.restore(snapshot['scheduler'], downtime)
+        self.next_popular_page_tokens.update(snapshot['page_tokens'])
+        self.prev_counts.update(snapshot['live_counts'])
+        for name, screen in snapshot['screens'].items():
+            # Queued at the top too, so the video still plays if its screen does not come back
+            self.scheduler.push(screen['url'], -1)
+            self.resume[name] = with_start(screen['url'], screen['position'])
+        QUEUE_DEPTH.set(len(self.scheduler))
+        logger.info(f"Restored {len(self.scheduler)} queued videos and {len(self.resume)} screens from the "
+                    f"playback snapshot of {downtime:.0f} s ago")
+        return True
+
+    def snapshot(self):
+        """What a restart needs to carry on where this run is: screens, queue, cooldowns and page tokens."""
+        screens = {}
+        for monitor in self.monitors:
+            if monitor.current_url is None:
+                continue
+            info = self.metadata.get(monitor.current_url)
+            position = None if info and info.get('live') == 'live' else monitor.playback_position()
+            screens[monitor.name] = {'url': with_start(monitor.current_url, None),
+                                     'position': round(position, 1) if position else None}
+        return {
+            'channels': [channel.id for channel in self.channels],
+            'screens': screens,
+            'scheduler': self.scheduler.snapshot(),
+            'page_tokens': dict(self.next_popular_page_tokens),
+            'live_counts': dict(self.prev_counts),
+        }
+
+    def save_snapshot(self):
+        try:
+            write_snapshot(self.snapshot())
+        except Exception as e:
+            logger.error(f"Error saving playback snapshot: {e}")
+
+    async def save_snapshots(self):
+        """Write a snapshot every SNAPSHOT_INTERVAL seconds, so even a power cut loses only that much."""
+        if not SNAPSHOT_INTERVAL:
+            return
+        loop = asyncio.get_running_loop()
+        while not await self.wait_stopped(SNAPSHOT_INTERVAL):
+            await loop.run_in_executor(None, self.save_snapshot)  # fsync stays off the loop
 
     def stop(self):
-        self.STOP_THREADS = True
+        self.save_snapshot()  # While every screen still shows its video
+        self.stop_event.set()
+        loop = self._loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self._stopped.set)
+            except RuntimeError:
+                pass  # The loop has already closed
         self.cleanup_browsers()
-        self.active_videos.clear()
+        self.scheduler.clear_playing()
+        self.cache_manager.flush()
+
+    async def wait_stopped(self, timeout):
+        """Wait up to timeout seconds on the event loop; returns True once the manager is stopped."""
+        if self._stopped is None:
+            self._stopped = asyncio.Event()
+            self._loop = asyncio.get_running_loop()
+            if self.is_stopped():
+                self._stopped.set()
+        try:
+            await asyncio.wait_for(self._stopped.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.is_stopped()
 
     def cleanup_browsers(self):
-        """Close all browser windows."""
-        for monitor in self.monitors:
-            try:
-                monitor.close()
-            except Exception as e:
-                logger.error(f"Failed to close browser: {e}")
+        """Close all browser windows at once; a quit also fails any command a playback thread is blocked in."""
+        closable = [monitor for monitor in self.monitors if not isinstance(monitor, AsyncMonitor)]
+        if not closable:
+            return  # Async sessions are closed on the loop once their supervisors return
+        with ThreadPoolExecutor(max_workers=len(closable)) as executor:
+            list(executor.map(close_monitor, closable))
 
-    def play_video_in_monitor(self, monitor):
-        while not self.is_stopped():
-            if monitor.is_page_loaded():
-                if not monitor.is_playing_video():
-                    priority, video_url = self.video_queue.get() if not self.video_queue.empty() else (None, None)
-                    if priority is not None and video_url != monitor.current_url:
-                        self.active_videos.add(video_url)  # Add the video to active_videos
-                        monitor.play_video(video_url)
-                        if monitor.current_url:  # Remove the previously playing video from active_videos
-                            self.active_videos.discard(monitor.current_url)
-            time.sleep(5)
+    def claim_next_video(self, monitor):
+        resume = self.resume.pop(monitor.name, None)
+        if resume is not None and self.scheduler.assign(monitor, resume):
+            video_url = resume  # Where this screen was when the snapshot was taken
+        else:
+            # What the screen actually holds in its spare window; a failed preload gives up the reservation
+            self.scheduler.reserve(monitor, monitor.preloaded_url)
+            # pop_for claims the video for this screen atomically, so no other screen can pick it up
+            video_url = self.scheduler.pop_for(monitor)
+        QUEUE_DEPTH.set(len(self.scheduler))
+        return video_url
+
+    def record_attempt(self, video_url, failure, first_frame=None):
+        """Bookkeeping after trying to play video_url; True if it plays. first_frame is how long the video
+        took to start advancing, None if that was not seen."""
+        if failure is None:
+            self.failures.record_success(video_url)
+            if first_frame is not None and startup_timer.mark('first_frame'):
+                logger.info(startup_timer.report())
+            return True
+        self.record_video_failure(video_url, failure)  # Then go straight on to the next video
+        return False
+
+    def record_video_failure(self, video_url, reason):
+        if reason in VIDEO_FAILURES:
+            self.failures.record_failure(video_url, reason)
+        elif reason in TRANSIENT_VIDEO_FAILURES:
+            self.failures.record_transient_failure(video_url, reason)
+
+    def give_back_video(self, monitor):
+        self.scheduler.give_back(monitor)
+        QUEUE_DEPTH.set(len(self.scheduler))
+
+    def peek_next_video(self, monitor):
+        # Skip what the other screens have preloaded so each spare window holds a different video
+        video_url = self.scheduler.peek(exclude=[m.preloaded_url for m in self.monitors if m is not monitor],
+                                        screen=monitor)
+        if PRELOAD_NEXT_VIDEO and video_url is not None:
+            self.scheduler.reserve(monitor, video_url)  # Kept for this screen, which preloads it next
+        return video_url
+
+    def record_rotation(self, monitor, reason):
+        logger.info(f"Rotating {monitor.current_url}: {reason}")
+        if monitor.current_url:
+            self.record_video_failure(monitor.current_url, reason)
+        self.rotations[reason] += 1
+        ROTATIONS.inc(reason=reason)
+
+    async def supervise_async(self, monitor):
+        """The playback loop of an AsyncMonitor, as one task on the event loop."""
+        monitor.stop_event = self.stop_event
+        await monitor.run(self.supervise_steps(monitor))
+
+    def health_metrics(self):
+        probes = sum(m.probe_stats['probes'] for m in self.monitors)
+        latency = sum(m.probe_stats['latency_total'] for m in self.monitors)
+        return {
+            'probes': probes,
+            'probe_latency_avg': latency / probes if probes else 0.0,
+            'probe_latency_max': max((m.probe_stats['latency_max'] for m in self.monitors), default=0.0),
+            'rotations': dict(self.rotations),
+        }
 
     def enqueue_videos(self, live_videos, top_videos):
-        logger.info(f"Enqueuing {len(live_videos)} live videos and {len(top_videos)} top videos.")
-        random.shuffle(top_videos)
-        for video, priority in zip(live_videos + top_videos, [0] * len(live_videos) + [1] * len(top_videos)):
-            if video not in self.active_videos:
-                self.video_queue.put((priority, video))
-
-    def init_browser_and_return_monitor(self, monitor):
-        """This method initializes the browser and returns the monitor instance."""
-        browser = create_driver(self.driver_name)
-
-        logger.info('Browser window opened')
-        screen_width, screen_height = monitor.width, monitor.height
-        window_width, window_height = BROWSER_WINDOW_SIZE
-        position_x = (screen_width - window_width) // 2 + monitor.x
-        position_y = (screen_height - window_height) // 2 + monitor.y
+        """Queue {channel ID: urls} live and popular lists, merged across channels by rank_channel_videos."""
+        logger.info(f"Enqueuing {sum(map(len, live_videos.values()))} live videos and "
+                    f"{sum(map(len, top_videos.values()))} top videos from {len(set(live_videos) | set(top_videos))} "
+                    f"channels.")
+        ranked = rank_channel_videos(live_videos, self.channels, live=True) + rank_channel_videos(top_videos,
+                                                                                                  self.channels)
+        for video, priority in ranked:
+            if self.failures.failure(video) is not None:
+                NEGATIVE_CACHE_SKIPS.inc()
+                continue  # Failed to play recently; it is offered again once its retry time passes
+            info = self.metadata.get(video)
+            if info is not None:
+                reason = unplayable_reason(info)
+                if reason:
+                    UNPLAYABLE.inc(reason=reason)
+                    continue
+                if priority < 1 and info['live'] != 'live':
+                    priority += 1  # The search results still list a stream that has ended; rank it as a video
+            self.scheduler.push(video, priority)
+        QUEUE_DEPTH.set(len(self.scheduler))
 
-        browser.set_window_size(*BROWSER_WINDOW_SIZE)
-        browser.set_window_position(position_x, position_y)
+    async def enrich_videos(self, urls):
+        """Fetch metadata the cache lacks for urls and apply it to those already queued: unplayable videos are
+        taken off the queue and ended streams move to the popular band, as enqueue_videos would have ranked them."""
+        try:
+            await enrich_videos(urls, self.metadata)
+        except Exception as e:
+            logger.error(f"Error fetching video metadata: {e}")
+            return
+        for url in urls:
+            info = self.metadata.get(url)
+            if info is None:
+                continue
+            reason = unplayable_reason(info)
+            if reason and self.scheduler.remove(url):
+                UNPLAYABLE.inc(reason=reason)
+                logger.info(f"Dropped {url} from the queue: {reason}")
+                continue
+            priority = self.scheduler.priority(url)
+            if priority is not None and 0 <= priority < 1 and info['live'] != 'live' and self.scheduler.remove(url):
+                self.scheduler.push(url, priority + 1)
 
-        monitor_instance = Monitor(browser)
-        self.monitors.append(monitor_instance)
-        logger.info(f'Browser initialized on monitor with position: x={position_x}, y={position_y}')
-        return monitor_instance
+    def queued_seconds(self):
+        """Planned playing time waiting in the queue, per screen."""
+        seconds = sum(planned_seconds(self.metadata.get(url)) for url in self.scheduler.queued())
+        return seconds / max(len(self.monitors), 1)
 
-    async def fetch_next_live_videos(self):
-        # Check if the live video cache is valid
-        if cache_manager.is_cache_valid('live'):
-            self.live_videos = cache_manager.load_from_cache('live').get('urls', [])
-        else:
-            # Fetch from the API if cache is not valid
-            self.live_videos, _ = await fetch_videos(event_type='live', max_results=LIVE_VIDEOS_LIMIT, page_token=None)
+    def is_configured(self, channel):
+        """False once a config reload dropped channel, e.g. while a lookup for it was awaited."""
+        return any(configured.id == channel.id for configured in self.channels)
 
-        for next_live_video in self.live_videos:
-            self.video_queue.put((0, next_live_video))
+    async def fetch_next_live_videos(self, channel):
+        # Only called after the live count changed, so the cached list is known to be out of date
+        live_videos, _ = await fetch_videos(event_type='live', max_results=LIVE_VIDEOS_LIMIT, page_token=None,
+                                            bypass_cache=True, channel_id=channel.id)
+        if not self.is_configured(channel):
+            return
+        self.live_videos[channel.id] = live_videos
 
         # Update this line to get the 'live' video count from the cache
-        self.prev_count = len(cache_manager.load_from_cache('live').get('urls', []))
+        cached = self.cache_manager.load_from_cache(cache_key_for('live', channel.id)) or {}
+        self.prev_counts[channel.id] = len(cached.get('urls', []))
 
     async def fetch_and_enqueue_next_videos(self):
+        # The start-up queue is looked up while the screens already play; the refreshes need not wait for it
+        startup_enrichment = asyncio.ensure_future(self.enrich_videos(self.scheduler.queued()))
         while not self.is_stopped():
-            # Check for new live videos
-            result = await asyncio.get_running_loop().run_in_executor(None, monitor_youtube_streams, CHANNEL,
-                                                                      self.driver_name)
-            if result > self.prev_count:
-                await self.fetch_next_live_videos()  # Fetch next set of live videos
-                self.enqueue_videos(self.live_videos, [])  # Enqueue only the live videos
-                self.prev_count = len(self.live_videos)  # Update the previous count
-
-            # Check if the video queue is empty and fetch more popular videos
-            if self.video_queue.empty() and self.next_popular_page_token and self.next_popular_page_token != -1:
-                self.top_videos, self.next_popular_page_token = await fetch_videos(
-                    order='viewCount',
-                    max_results=POPULAR_VIDEOS_LIMIT,
-                    page_token=self.next_popular_page_token,
-                    bypass_cache=True)
-                self.enqueue_videos([], self.top_videos)  # Enqueue only the top videos
-            await asyncio.sleep(5)
-
-    async def monitor_all_screens(self):
-        detected_monitors = get_monitors()
-        with ThreadPoolExecutor(max_workers=len(detected_monitors)) as executor:
-            initialized_monitors = list(executor.map(self.init_browser_and_return_monitor, detected_monitors))
+            # Check for new live videos when the adaptive refresh scheduler says so
+            if self.refresh_scheduler.live_check_due():
+                await self.check_live_videos()
+
+            # Start fetching the next popular page before the queue runs dry
+            self.maybe_prefetch_popular()
+            await self.wait_stopped(REFRESH_INTERVAL)
+
+        startup_enrichment.cancel()
+        if self.popular_prefetch is not None:
+            self.popular_prefetch.cancel()
+        self.live_detector.close()
+
+    async def check_live_videos(self):
+        # Live detection scrapes the channel page, so it needs the channel's handle
+        channels = [channel for channel in self.channels if channel.name]
+        results = await asyncio.gather(*(self.live_detector.count_live(channel.name) for channel in channels),
+                                       return_exceptions=True)
+        # A config reload during the lookups may have dropped some of the channels
+        checked = [(channel, result) for channel, result in zip(channels, results) if self.is_configured(channel)]
+        previous_total = sum(self.prev_counts.get(channel.id, 0) for channel, _ in checked)
+        total = 0
+        went_live = []
+        for channel, result in checked:
+            previous = self.prev_counts.get(channel.id, 0)
+            if isinstance(result, Exception):
+                logger.error(f"Error checking live streams of {channel.name}: {result}")
+                result = previous
+            total += result
+            if result > previous:
+                went_live.append(channel)
+            elif result < previous:
+                self.prev_counts[channel.id] = result  # A stream ended; the next one must register as an increase
+
+        if went_live:
+            # Fetch the new live lists of every channel that changed at once, then enqueue only those
+            await asyncio.gather(*(self.fetch_next_live_videos(channel) for channel in went_live))
+            went_live = [channel for channel in went_live if self.is_configured(channel)]
+            await self.enrich_videos([url for channel in went_live for url in self.live_videos[channel.id]])
+            self.enqueue_videos({channel.id: self.live_videos[channel.id] for channel in went_live
+                                 if self.is_configured(channel)}, {})
+        self.refresh_scheduler.record_live_count(total, previous_total)
+        if total != previous_total:
+            logger.info(self.refresh_scheduler.report())
+
+    def maybe_prefetch_popular(self):
+        if self.popular_prefetch is not None or not self.popular_channels():
+            return
+        if len(self.scheduler) > QUEUE_LOW_WATER and self.queued_seconds() > QUEUE_LOW_WATER_SECONDS:
+            return
+        self.popular_prefetch = asyncio.ensure_future(self.fetch_next_popular_pages())
+
+    def popular_channels(self):
+        """Channels that still have popular pages left to fetch; a None token means the first page is still due,
+        e.g. after it failed, and the channel's paginator retries it with backoff."""
+        return [channel for channel in self.channels if self.next_popular_page_tokens.get(channel.id) != -1]
+
+    async def fetch_next_popular_page(self, channel):
+        paginator = self.popular_pages.get(channel.id)
+        if paginator is None:
+            paginator = self.popular_pages[channel.id] = paginate_videos(
+                order='viewCount', max_results=POPULAR_VIDEOS_LIMIT,
+                page_token=self.next_popular_page_tokens[channel.id], channel_id=channel.id)
+        try:
+            top_videos, page_token = await paginator.__anext__()
+        except StopAsyncIteration:
+            if self.is_configured(channel):
+                self.next_popular_page_tokens[channel.id] = -1
+            return []
+        if not self.is_configured(channel):
+            return []  # Dropped by a config reload while the page was fetched
+        self.top_videos[channel.id], self.next_popular_page_tokens[channel.id] = top_videos, page_token
+        return top_videos
+
+    async def fetch_next_popular_pages(self):
+        try:
+            channels = self.popular_channels()
+            pages = await asyncio.gather(*(self.fetch_next_popular_page(channel) for channel in channels))
+            await self.enrich_videos([url for urls in pages for url in urls])
+            self.enqueue_videos({}, {channel.id: urls for channel, urls in zip(channels, pages)
+                                     if self.is_configured(channel)})  # Only top videos
+        finally:
+            self.popular_prefetch = None
+
+    async def monitor_all_screens(self, initialized_monitors=None):
+        if WEBDRIVER_BACKEND == 'async':
+            return await self.monitor_all_screens_async(initialized_monitors)
+        if SCREEN_ISOLATION == 'process':
+            return await self.monitor_all_screens_isolated()
+        # Browsers may already have been started alongside the initial API fetch
+        if initialized_monitors is None:
+            initialized_monitors = await asyncio.get_running_loop().run_in_executor(None, spawn_monitors,
+                                                                                    self.driver_name)
+        self.monitors.extend(initialized_monitors)
 
         monitor_threads = [threading.Thread(target=self.play_video_in_monitor, args=(monitor,)) for monitor in
                            initialized_monitors]
         for t in monitor_threads:
             t.start()
 
-        await self.fetch_and_enqueue_next_videos()  # Simply await the coroutine
+        await self.run_background_loops()
 
         for t in monitor_threads:
             t.join()
 
+    async def monitor_all_screens_async(self, initialized_monitors=None):
+        """Supervise every screen as a task on this loop, next to the API refreshes; no thread per screen."""
+        if initialized_monitors is None:
+            initialized_monitors = await spawn_async_monitors(self.driver_name)
+        self.monitors.extend(initialized_monitors)
+        supervisors = [asyncio.ensure_future(self.supervise_async(monitor)) for monitor in initialized_monitors]
+        try:
+            await self.run_background_loops()
+        finally:
+            # A supervisor may be inside a wait for playback events; there is nothing left to wait for
+            for task in supervisors:
+                task.cancel()
+            await asyncio.gather(*supervisors, return_exceptions=True)
+            results = await asyncio.gather(*(monitor.close() for monitor in initialized_monitors),
+                                           return_exceptions=True)
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.error(f"Failed to close browser: {result}")
+
+    async def monitor_all_screens_isolated(self, screens=None, driver_factory=None):
+        """Give every screen a worker process running its browser and playback loop.
+
+        A thread per screen serves the worker's queue requests and respawns it if it dies or hangs; the
+        scheduler and the API refreshes stay in this process.
+        """
+        from screen_worker import ScreenProcess
+
+        screens = get_screens() if screens is None else screens
+        workers = [ScreenProcess(self, self.driver_name, screen, f"screen{i}", driver_factory)
+                   for i, screen in enumerate(screens)]
+        self.monitors.extend(workers)
+        threads = [threading.Thread(target=worker.supervise) for worker in workers]
+        for t in threads:
+            t.start()
+
+        try:
+            await self.run_background_loops()
+        finally:
+            self.stop_event.set()
+            for t in threads:
+                t.join()
+            self.cleanup_browsers()  # Again if stop() already did: close() is safe to repeat
+
+    async def run_background_loops(self):
+        """The event loop's share of the work while the screens play: API refreshes, the config watcher and
+        the playback snapshots."""
+        await asyncio.gather(self.fetch_and_enqueue_next_videos(), self.watch_config(), self.save_snapshots())
+
+    async def watch_config(self):
+        """Check the config file every CONFIG_WATCH_INTERVAL seconds and put changes into effect on the fly."""
+        if not CONFIG_WATCH_INTERVAL:
+            return
+        mtime = config_mtime()
+        while not await self.wait_stopped(CONFIG_WATCH_INTERVAL):
+            current = config_mtime()
+            if current == mtime:
+                continue
+            mtime = current
+            changes = reload_config()
+            if not changes:
+                continue
+            logger.info(f"Config changed: {', '.join(sorted(changes))}")
+            try:
+                await self.apply_config(changes)
+            except Exception as e:
+                logger.error(f"Error applying config changes: {e}")
+
+    async def apply_config(self, changes):
+        """Apply reloaded config values to the running wall: no browser is restarted."""
+        restart = apply_live_settings(changes)
+        live_changes = {key: value for key, value in changes.items() if key not in restart}
+        if 'BROWSER_WINDOW_SIZE' in live_changes:
+            await self.place_windows()
+        for monitor in self.monitors:
+            if not isinstance(monitor, Monitor):
+                monitor.send_config(live_changes)  # Screen workers run their own copy of the settings
+        if 'POPULAR_VIDEOS_LIMIT' in live_changes:
+            self.popular_pages.clear()  # Paginators keep their page size; the next page starts a new one
+        if CHANNEL_SETTINGS & live_changes.keys():
+            await self.switch_channels(load_channels())
+        if restart:
+            logger.warning(f"Restart to apply: {', '.join(sorted(restart))}")
+
+    async def place_windows(self):
+        loop = asyncio.get_running_loop()
+        placements = [monitor.place_window() if isinstance(monitor, AsyncMonitor)
+                      else loop.run_in_executor(None, monitor.place_window)
+                      for monitor in self.monitors if isinstance(monitor, Monitor)]
+        for result in await asyncio.gather(*placements, return_exceptions=True):
+            if isinstance(result, Exception):
+                logger.error(f"Error placing window: {result}")
+
+    async def switch_channels(self, channels):
+        """Play from channels instead: the new ones are loaded, and videos only removed ones had are unqueued."""
+        kept_ids = {channel.id for channel in channels}
+        for channel in self.channels:
+            if channel.id in kept_ids:
+                continue
+            for url in (self.live_videos.pop(channel.id, None) or []) + (self.top_videos.pop(channel.id, None) or []):
+                self.scheduler.remove(url)
+            for state in (self.next_popular_page_tokens, self.prev_counts, self.popular_pages):
+                state.pop(channel.id, None)
+
+        added = [channel for channel in channels if channel.id not in self.live_videos]
+        self.channels = channels
+        missing = self.load_cached_channels(added)
+        if missing:
+            self.store_fetched_channels(await fetch_channel_videos(missing))
+        await self.enrich_videos([url for channel in added
+                                  for url in (self.live_videos[channel.id] or []) + (self.top_videos[channel.id] or [])])
+        # Everything again, since changed weights reorder the channels already playing too
+        self.enqueue_videos(self.live_videos, self.top_videos)
+        logger.info(f"Now playing from {len(channels)} channels ({len(added)} new).")
+
     async def monitor_video_statuses_on_all_monitors(self, initialized_monitors):
         monitor_tasks = [self.play_video_in_monitor(monitor) for monitor in initialized_monitors]
         await asyncio.gather(*monitor_tasks)
 
     def key_listener(self):
+        import keyboard
         keyboard.wait('esc')
         logger.info('Escape key hit')
         self.stop()
@@ -0,0 +1,106 @@
+import time
+
+from cacher import get_cache_manager
+from logger import logger
+from metrics import registry
+from scheduler import video_id
+from utility_helpers import config
+
+NEGATIVE_CACHE_KEY = 'failed_videos'
+NEGATIVE_CACHE_TTL = config.get('NEGATIVE_CACHE_TTL', 3600)  # Seconds before the first retry of a failed video
+NEGATIVE_CACHE_MAX_TTL = config.get('NEGATIVE_CACHE_MAX_TTL', 7 * 86400)
+TRANSIENT_FAILURE_LIMIT = config.get('TRANSIENT_FAILURE_LIMIT', 3)  # Timeouts in a row before a video is cached
+
+PLAYBACK_FAILURES = registry.counter('video_playback_failures_total', 'Videos that failed to play, by reason',
+                                     ('reason',))
+NEGATIVE_CACHE_SKIPS = registry.counter('negative_cache_skips_total', 'Videos skipped because they failed before')
+
+
+class NegativeCache:
+    """Videos that failed to play, kept in the shared cache under 'failed_videos'.
+
+    Each entry holds the last failure reason, the failure count and the time the video may be tried
+    again. The retry delay doubles with every failure, from NEGATIVE_CACHE_TTL up to NEGATIVE_CACHE_MAX_TTL,
+    and a successful playback forgets the video. Failures that may be the network's or the browser's
+    rather than the video's, like a player that is slow to appear, are only counted in memory until
+    TRANSIENT_FAILURE_LIMIT of them happen in a row.
+    """
+
+    def __init__(self, cache_manager=None, ttl=NEGATIVE_CACHE_TTL, max_ttl=NEGATIVE_CACHE_MAX_TTL,
+                 transient_limit=TRANSIENT_FAILURE_LIMIT):
+        self._cache_manager = cache_manager
+        self.ttl = ttl
+        self.max_ttl = max_ttl
+        self.transient_limit = transient_limit
+        self._transient = {}  # video_id -> transient failures in a row
+
+    @property
+    def cache_manager(self):
+        # Without an explicit manager, follow whichever one is installed as the shared cache
+        return self._cache_manager or get_cache_manager()
+
+    def _entries(self):
+        return (self.cache_manager.load_from_cache(NEGATIVE_CACHE_KEY) or {}).get('videos', {})
+
+    def _save(self, entries):
+        # Always a new dict, so a flush serialising the old one never sees it change
+        self.cache_manager.save_to_cache({'videos': entries, 'updated_at': time.time()}, key=NEGATIVE_CACHE_KEY)
+
+    def record_failure(self, url, reason):
+        now = time.time()
+        vid = video_id(url)
+        entries = dict(self._entries())
+        if now < entries.get(vid, {}).get('retry_at', 0):
+            return  # Already waiting out a delay, e.g. the health check noticing the same broken page again
+        count = entries.get(vid, {}).get('count', 0) + 1
+        delay = min(self.ttl * 2 ** (count - 1), self.max_ttl)
+        entries[vid] = {'reason': reason, 'count': count, 'failed_at': now, 'retry_at': now + delay}
+        self._save(entries)
+        PLAYBACK_FAILURES.inc(reason=reason)
+        logger.warning(f"{url} failed to play ({reason}, {count} times); retrying in {delay / 60:.0f} min")
+
+    def record_transient_failure(self, url, reason):
+        vid = video_id(url)
+        count = self._transient.get(vid, 0) + 1
+        if count < self.transient_limit:
+            self._transient[vid] = count
+            logger.info(f"{url} failed to play ({reason}, {count} times in a row); not cached yet")
+            return
+        self._transient.pop(vid, None)
+        self.record_failure(url, reason)
+
+    def record_success(self, url):
+        vid = video_id(url)
+        self._transient.pop(vid, None)
+        entries = self._entries()
+        if vid in entries:
+            self._save({key: entry for key, entry in entries.items() if key != vid})
+
+    def failure(self, url):
+        """The failure entry that currently blocks url, or None if it may be played."""
+        entry = self._entries().get(video_id(url))
+        if entry is None or time.time() >= entry['retry_at']:
+            return None
+        return entry
+
+    def filter(self, urls):
+        """urls without the videos that are still waiting out their retry delay."""
+        entries = self._entries()
+        if not entries:
+            return urls
+        now = time.time()
+        kept = [url for url in urls if now >= entries.get(video_id(url), {}).get('retry_at', 0)]
+        if len(kept) < len(urls):
+            NEGATIVE_CACHE_SKIPS.inc(len(urls) - len(kept))
+        return kept
+
+
+_negative_cache = None
+
+
+def get_negative_cache():
+    """Return the shared NegativeCache."""
+    global _negative_cache
+    if _negative_cache is None:
+        _negative_cache = NegativeCache()
+    return _negative_cache
@@ -0,0 +1,53 @@
+from metrics import registry
+from utility_helpers import config
+
+# YouTube's quality names from lowest to highest, with the video height each one stands for
+QUALITY_LEVELS = [('tiny', 144), ('small', 240), ('medium', 360), ('large', 480), ('hd720', 720),
+                  ('hd1080', 1080), ('hd1440', 1440), ('hd2160', 2160)]
+QUALITY_NAMES = [name for name, _ in QUALITY_LEVELS]
+MAX_PLAYBACK_QUALITY = config.get('MAX_PLAYBACK_QUALITY', 'hd1080')
+MIN_PLAYBACK_QUALITY = config.get('MIN_PLAYBACK_QUALITY', 'small')
+QUALITY_RECOVERY_SECONDS = config.get('QUALITY_RECOVERY_SECONDS', 900)  # Healthy time before stepping back up
+# At or below this cap every video is available as H.264, the codec cheapest to decode on modest hardware
+H264_QUALITY_LIMIT = 'hd1080'
+
+PLAYBACK_QUALITY = registry.gauge('screen_playback_quality_height', 'Video height the screen is capped at',
+                                  ('screen',))
+QUALITY_STEPS = registry.counter('playback_quality_steps_total', 'Adaptive quality changes', ('direction',))
+
+
+def quality_for_size(width, height, max_quality=MAX_PLAYBACK_QUALITY, min_quality=MIN_PLAYBACK_QUALITY):
+    """The lowest quality that still fills a width x height area with 16:9 video, within the configured bounds."""
+    video_height = min(height, width * 9 / 16)
+    low, high = QUALITY_NAMES.index(min_quality), QUALITY_NAMES.index(max_quality)
+    for index in range(low, high + 1):
+        if QUALITY_LEVELS[index][1] >= video_height:
+            return QUALITY_NAMES[index]
+    return QUALITY_NAMES[high]
+
+
+def quality_url(url, quality):
+    """Embed URL carrying the vq hint, so the player starts at the cap rather than switching after a load."""
+    if not quality:
+        return url
+    return url + ('&' if '?' in url else '?') + f'vq={quality}'
+
+
+def prefers_h264(quality):
+    return quality is not None and QUALITY_NAMES.index(quality) <= QUALITY_NAMES.index(H264_QUALITY_LIMIT)
+
+
+def step_down(quality, min_quality=MIN_PLAYBACK_QUALITY):
+    """The next lower quality, or None at min_quality."""
+    index = QUALITY_NAMES.index(quality)
+    return QUALITY_NAMES[index - 1] if index > QUALITY_NAMES.index(min_quality) else None
+
+
+def step_up(quality, max_quality):
+    """The next higher quality, or None at max_quality."""
+    index = QUALITY_NAMES.index(quality)
+    return QUALITY_NAMES[index + 1] if index < QUALITY_NAMES.index(max_quality) else None
+
+
+def quality_height(quality):
+    return QUALITY_LEVELS[QUALITY_NAMES.index(quality)][1]
@@ -0,0 +1,125 @@
+# Long-polls the player: resolves as soon as ended, pause, error or stalled fires or after arguments[0] ms.
+# Listeners are attached once per video element and buffer events that fire between polls.
+WAIT_FOR_EVENT_SCRIPT = """
+var timeout = arguments[0];
+var done = arguments[arguments.length - 1];
+var video = document.querySelector('video.video-stream');
+if (!video) {
+    done({events: ['missing']});
+    return;
+}
+if (!video.__sbEvents) {
+    video.__sbEvents = [];
+    ['ended', 'pause', 'error', 'stalled'].forEach(function (name) {
+        video.addEventListener(name, function () {
+            video.__sbEvents.push(name);
+            if (video.__sbWake) {
+                video.__sbWake();
+            }
+        });
+    });
+}
+function report() {
+    video.__sbWake = null;
+    done({events: video.__sbEvents.splice(0), paused: video.paused, ended: video.ended});
+}
+if (video.__sbEvents.length) {
+    report();
+    return;
+}
+var timer = setTimeout(report, timeout);
+video.__sbWake = function () {
+    clearTimeout(timer);
+    report();
+};
+"""
+
+# Everything the health check needs from the page in a single round trip.
+HEALTH_PROBE_SCRIPT = """
+var video = document.querySelector('video.video-stream');
+var error = document.querySelector('.ytp-error');
+var state = {readyState: document.readyState, present: !!video};
+if (error && error.offsetParent !== null) {
+    state.playerError = (error.innerText || 'player error').trim();
+}
+if (!video) {
+    return state;
+}
+var buffered = [];
+for (var i = 0; i < video.buffered.length; i++) {
+    buffered.push([video.buffered.start(i), video.buffered.end(i)]);
+}
+var quality = video.getVideoPlaybackQuality ? video.getVideoPlaybackQuality() : null;
+state.paused = video.paused;
+state.ended = video.ended;
+state.currentTime = video.currentTime;
+state.buffered = buffered;
+state.networkState = video.networkState;
+state.mediaReadyState = video.readyState;
+state.droppedFrames = quality ? quality.droppedVideoFrames : 0;
+state.totalFrames = quality ? quality.totalVideoFrames : 0;
+return state;
+"""
+
+# Runs in the spare window right after it loads the next video: keep it muted and hold it paused
+# once it starts buffering, until START_PRELOADED_SCRIPT releases it.
+PRELOAD_SCRIPT = """
+function hold(video) {
+    video.muted = true;
+    video.__sbHold = true;
+    video.addEventListener('playing', function () {
+        if (video.__sbHold) {
+            video.pause();
+        }
+    });
+    if (!video.paused) {
+        video.pause();
+    }
+}
+var video = document.querySelector('video.video-stream');
+if (video) {
+    hold(video);
+    return;
+}
+var attempts = 0;
+var timer = setInterval(function () {
+    var found = document.querySelector('video.video-stream');
+    if (found || ++attempts > 50) {
+        clearInterval(timer);
+        if (found) {
+            hold(found);
+        }
+    }
+}, 200);
+"""
+
+PAUSE_SCRIPT = """
+var video = document.querySelector('video.video-stream');
+if (video) {
+    video.pause();
+}
+"""
+
+# Returns false if the preloaded player never appeared, so the caller can fall back to a normal load.
+START_PRELOADED_SCRIPT = """
+var video = document.querySelector('video.video-stream');
+if (!video) {
+    return false;
+}
+video.__sbHold = false;
+video.muted = false;
+video.play();
+return true;
+"""
+
+# Caps the embed at quality arguments[0] (e.g. 'hd720') through the player element's API. Returns the
+# quality now in effect, or null while the player is not ready.
+SET_QUALITY_SCRIPT = """
+var player = document.getElementById('movie_player');
+if (!player || !player.setPlaybackQualityRange) {
+    return null;
+}
+var quality = arguments[0];
+player.setPlaybackQualityRange(quality, quality);
+return player.getPlaybackQuality ? player.getPlaybackQuality() : quality;
+"""
@@ -0,0 +1,176 @@
+import datetime
+import time
+import zoneinfo
+
+from cacher import get_cache_manager
+from logger import logger
+from metrics import registry
+from utility_helpers import config
+
+DAILY_QUOTA = config.get('DAILY_QUOTA', 10000)
+MIN_REFRESH_INTERVAL = config.get('MIN_REFRESH_INTERVAL', 5)
+MAX_REFRESH_INTERVAL = config.get('MAX_REFRESH_INTERVAL', 300)
+HOT_REFRESH_INTERVAL = config.get('HOT_REFRESH_INTERVAL', 30)  # Longest interval during usual go-live hours
+HOT_HOUR_SHARE = 0.1  # An hour is "hot" once it holds this share of the observed go-live events
+SPEND_RATE_WINDOW = 3600  # Seconds of spending history used to project quota exhaustion
+QUOTA_RESET_TIMEZONE = config.get('QUOTA_RESET_TIMEZONE', 'America/Los_Angeles')  # The API quota resets at its midnight
+
+QUOTA_REMAINING = registry.gauge('youtube_quota_remaining_units', 'Units left in the daily quota token bucket')
+QUOTA_EXHAUSTION = registry.gauge('youtube_quota_exhaustion_seconds',
+                                  'Projected seconds until the quota runs out at the current spend rate (-1: never)')
+QUOTA_DENIED = registry.counter('youtube_quota_denied_total', 'API calls skipped because the budget was empty')
+REFRESH_DELAY = registry.gauge('live_refresh_interval_seconds', 'Current delay between live-stream checks')
+
+
+class QuotaBudget:
+    """The day's API quota: capacity units, handed out until the next reset at midnight QUOTA_RESET_TIMEZONE,
+    when the bucket is full again, as the API's own quota is.
+
+    The units left and the reset time are persisted in the cache under 'quota_budget', so a restart
+    neither hands out a fresh day early nor keeps an empty one past the reset.
+    """
+
+    def __init__(self, capacity=DAILY_QUOTA, cache_manager=None):
+        self.capacity = capacity
+        self.cache_manager = cache_manager or get_cache_manager()
+        saved = self.cache_manager.load_from_cache('quota_budget') or {}
+        self.tokens = min(saved.get('tokens', capacity), capacity)
+        self.reset_at = saved.get('reset_at') or self.next_reset(time.time())
+        self.spends = []  # (time, units) within SPEND_RATE_WINDOW
+
+    @staticmethod
+    def next_reset(now):
+        """Timestamp of the first midnight in QUOTA_RESET_TIMEZONE after now."""
+        try:
+            zone = zoneinfo.ZoneInfo(QUOTA_RESET_TIMEZONE)
+        except zoneinfo.ZoneInfoNotFoundError:
+            zone = datetime.timezone.utc
+        local = datetime.datetime.fromtimestamp(now, zone)
+        return datetime.datetime.combine(local.date() + datetime.timedelta(days=1), datetime.time(), zone).timestamp()
+
+    def _roll_over(self, now):
+        if now >= self.reset_at:
+            logger.info(f"Daily quota reset: {self.tokens:.0f} units were left, {self.capacity} available again.")
+            self.tokens = self.capacity
+            self.reset_at = self.next_reset(now)
+            self._save()
+
+    def _save(self):
+        self.cache_manager.save_to_cache({'tokens': self.tokens, 'reset_at': self.reset_at}, key='quota_budget')
+
+    def remaining(self):
+        self._roll_over(time.time())
+        return self.tokens
+
+    def try_consume(self, units):
+        now = time.time()
+        self._roll_over(now)
+        if self.tokens < units:
+            QUOTA_DENIED.inc()
+            logger.warning(f"Quota budget exhausted ({self.tokens:.0f} units left), skipping API call.")
+            return False
+        self.tokens -= units
+        self.spends.append((now, units))
+        self._save()
+        self._update_gauges(now)
+        return True
+
+    def seconds_until_reset(self, now=None):
+        now = now or time.time()
+        self._roll_over(now)
+        return self.reset_at - now
+
+    def pace(self, now=None):
+        """How many times slower than usual refreshes must run for the units left to last until the reset.
+
+        1.0 while the share of the quota left is at least the share of the day left.
+        """
+        now = now or time.time()
+        seconds_left = self.seconds_until_reset(now)
+        if self.tokens <= 0:
+            return float('inf')
+        return max(1.0, (seconds_left / 86400) / (self.tokens / self.capacity))
+
+    def spend_rate(self, now=None):
+        now = now or time.time()
+        self.spends = [(t, units) for t, units in self.spends if now - t < SPEND_RATE_WINDOW]
+        if not self.spends:
+            return 0.0
+        window = max(now - self.spends[0][0], 60)
+        return sum(units for _, units in self.spends) / window
+
+    def projected_exhaustion(self):
+        """Seconds until the bucket is empty at the recent spend rate, or None if it lasts until the reset."""
+        now = time.time()
+        rate = self.spend_rate(now)
+        if rate <= 0 or self.tokens / rate >= self.seconds_until_reset(now):
+            return None
+        return self.tokens / rate
+
+    def _update_gauges(self, now):
+        QUOTA_REMAINING.set(self.tokens)
+        exhaustion = self.projected_exhaustion()
+        QUOTA_EXHAUSTION.set(-1 if exhaustion is None else exhaustion)
+
+
+class RefreshScheduler:
+    """Decides when to check for live streams next.
+
+    The interval doubles for every check that finds the live count unchanged, up to MAX_REFRESH_INTERVAL,
+    and drops back to MIN_REFRESH_INTERVAL as soon as it changes. Hours of the day in which the channel has
+    gone live before, kept in the cache under 'live_history', cap the interval at HOT_REFRESH_INTERVAL.
+    The result is stretched by the budget's pace, so checks slow down as the quota left runs short of
+    the time left until it resets.
+    """
+
+    def __init__(self, budget, cache_manager=None, min_interval=MIN_REFRESH_INTERVAL,
+                 max_interval=MAX_REFRESH_INTERVAL, hot_interval=HOT_REFRESH_INTERVAL):
+        self.budget = budget
+        self.cache_manager = cache_manager or get_cache_manager()
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.hot_interval = hot_interval
+        self.interval = min_interval
+        self.next_check_at = 0.0
+        history = self.cache_manager.load_from_cache('live_history') or {}
+        self.go_live_hours = history.get('hours', [0] * 24)
+
+    def live_check_due(self, now=None):
+        return (now or time.monotonic()) >= self.next_check_at
+
+    def is_hot_hour(self, hour=None):
+        hour = datetime.datetime.now().hour if hour is None else hour
+        total = sum(self.go_live_hours)
+        return total > 0 and self.go_live_hours[hour] / total >= HOT_HOUR_SHARE
+
+    def record_live_count(self, count, previous):
+        if count > previous:
+            self.go_live_hours[datetime.datetime.now().hour] += 1
+            # A copy, since the list keeps changing while a flush may be serialising the saved one
+            self.cache_manager.save_to_cache({'hours': list(self.go_live_hours)}, key='live_history')
+        if count != previous:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * 2, self.max_interval)
+        if self.is_hot_hour():
+            self.interval = min(self.interval, self.hot_interval)
+        self.interval = min(self.interval * self.budget.pace(), self.budget.seconds_until_reset())
+        self.next_check_at = time.monotonic() + self.interval
+        REFRESH_DELAY.set(self.interval)
+
+    def report(self):
+        exhaustion = self.budget.projected_exhaustion()
+        projection = "not projected to run out" if exhaustion is None else f"runs out in {exhaustion / 3600:.1f} h"
+        return (f"Quota: {self.budget.remaining():.0f}/{self.budget.capacity} units left, {projection}; "
+                f"next live check in {self.interval:.0f}s")
+
+
+_quota_budget = None
+
+
+def get_quota_budget():
+    """Return the shared QuotaBudget that every API call draws from."""
+    global _quota_budget
+    if _quota_budget is None:
+        _quota_budget = QuotaBudget()
+    return _quota_budget
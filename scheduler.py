@@ -0,0 +1,255 @@
+import heapq
+import itertools
+import math
+import threading
+import time
+
+from utility_helpers import config
+
+RECENT_COOLDOWN = config.get('RECENT_COOLDOWN', 1800)  # Seconds before a video may play again
+PRELOAD_HOLD = config.get('PRELOAD_HOLD', 900)  # Seconds a video preloaded by a screen is kept for that screen
+
+
+def video_id(url):
+    return url.rstrip('/').rsplit('/', 1)[-1].split('?', 1)[0]
+
+
+class VideoScheduler:
+    """Priority queue of video URLs indexed by video ID.
+
+    Lower priority values play first; ties play in insertion order. Pushing a queued video again only
+    reprioritises it, a video that is on a screen is never handed to a second one, and a video that
+    just stopped sits out the cooldown before it can be scheduled again. A screen that preloaded a queued
+    video reserves it, so pop_for hands it to that screen rather than another. Every method holds a lock
+    only briefly, so the scheduler can be shared by the playback threads and the asyncio loop.
+    """
+
+    def __init__(self, cooldown=RECENT_COOLDOWN, hold=PRELOAD_HOLD):
+        self.cooldown = cooldown
+        self.hold = hold
+        self._heap = []  # [priority, sequence, video_id, url, valid] entries
+        self._entries = {}  # video_id -> valid heap entry
+        self._playing = {}  # screen -> video_id
+        self._claimed = {}  # screen -> (url, priority) of the video pop_for handed it
+        self._on_screen = set()
+        self._recent = {}  # video_id -> time it stopped playing, oldest first
+        self._deferred = {}  # video_id -> (url, priority) pushed while cooling down
+        self._reserved = {}  # screen -> (video_id, time reserved) of the video it preloaded
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries) + len(self._deferred)
+
+    def empty(self):
+        return len(self) == 0
+
+    def push(self, url, priority):
+        """Queue url, or raise it to priority if that is more urgent. Returns False if it is on a screen."""
+        vid = video_id(url)
+        with self._lock:
+            if vid in self._on_screen:
+                return False
+            if vid in self._recent:
+                _, deferred_priority = self._deferred.get(vid, (None, priority))
+                self._deferred[vid] = (url, min(priority, deferred_priority))
+                return True
+            entry = self._entries.get(vid)
+            if entry is not None:
+                if entry[0] <= priority:
+                    return True
+                entry[-1] = False
+            self._add(vid, url, priority)
+            return True
+
+    def _add(self, vid, url, priority):
+        entry = [priority, next(self._sequence), vid, url, True]
+        self._entries[vid] = entry
+        heapq.heappush(self._heap, entry)
+        # Reprioritising leaves dead entries behind; rebuild once they outnumber the valid ones
+        if len(self._heap) > 2 * len(self._entries) + 16:
+            self._heap = [e for e in self._heap if e[-1]]
+            heapq.heapify(self._heap)
+
+    def remove(self, url):
+        vid = video_id(url)
+        with self._lock:
+            entry = self._entries.pop(vid, None)
+            if entry is not None:
+                entry[-1] = False
+            return entry is not None or self._deferred.pop(vid, None) is not None
+
+    def _expire_cooldowns(self, now):
+        while self._recent:
+            vid, stopped_at = next(iter(self._recent.items()))
+            if now - stopped_at < self.cooldown:
+                break
+            del self._recent[vid]
+            if vid in self._deferred:
+                url, priority = self._deferred.pop(vid)
+                self._add(vid, url, priority)
+
+    def _head(self):
+        while self._heap and not self._heap[0][-1]:
+            heapq.heappop(self._heap)
+        return self._heap[0] if self._heap else None
+
+    def _held(self, now):
+        """video_id -> screen of the reservations that are still queued and not older than hold."""
+        held = {}
+        for screen, (vid, reserved_at) in list(self._reserved.items()):
+            if vid in self._entries and now - reserved_at < self.hold:
+                held[vid] = screen
+            else:
+                del self._reserved[screen]
+        return held
+
+    def _first(self, excluded):
+        """The most urgent valid entry whose video is not in excluded."""
+        head = self._head()
+        if head is None or head[2] not in excluded:
+            return head
+        return next((entry for entry in heapq.nsmallest(len(excluded) + 1, (e for e in self._heap if e[-1]))
+                     if entry[2] not in excluded), None)
+
+    def reserve(self, screen, url):
+        """Keep queued url, which screen preloaded, for screen; None drops its reservation."""
+        with self._lock:
+            if url is None:
+                self._reserved.pop(screen, None)
+            else:
+                self._reserved[screen] = (video_id(url), time.monotonic())
+
+    def pop_for(self, screen):
+        """Take the most urgent video for screen, put its previous video into cooldown and mark the new one playing.
+
+        A video screen reserved is taken unless one in a more urgent priority band (live before popular)
+        is waiting; videos other screens reserved are skipped.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._expire_cooldowns(now)
+            held = self._held(now)
+            entry = self._first({vid for vid, holder in held.items() if holder != screen})
+            reserved = self._reserved.get(screen)
+            if reserved is not None:
+                own = self._entries[reserved[0]]
+                if entry is None or math.floor(entry[0]) >= math.floor(own[0]):
+                    entry = own
+            if entry is None:
+                return None
+            entry[-1] = False
+            del self._entries[entry[2]]
+            if reserved is not None and reserved[0] == entry[2]:
+                del self._reserved[screen]
+            self._release(screen, now)
+            self._playing[screen] = entry[2]
+            self._claimed[screen] = (entry[3], entry[0])
+            self._on_screen.add(entry[2])
+            return entry[3]
+
+    def peek(self, exclude=(), screen=None):
+        """Return the URL pop_for would hand out next, skipping any URL in exclude and those reserved by
+        screens other than screen."""
+        excluded = {video_id(url) for url in exclude if url}
+        now = time.monotonic()
+        with self._lock:
+            self._expire_cooldowns(now)
+            excluded.update(vid for vid, holder in self._held(now).items() if holder != screen)
+            entry = self._first(excluded)
+            return entry[3] if entry else None
+
+    def assign(self, screen, url):
+        """Put url on screen as pop_for would, wherever it is queued; False if another screen is playing it."""
+        vid = video_id(url)
+        now = time.monotonic()
+        with self._lock:
+            if vid in self._on_screen:
+                return False
+            entry = self._entries.pop(vid, None)
+            if entry is not None:
+                entry[-1] = False
+            self._deferred.pop(vid, None)
+            self._recent.pop(vid, None)
+            self._release(screen, now)
+            self._playing[screen] = vid
+            self._on_screen.add(vid)
+            return True
+
+    def release(self, screen):
+        with self._lock:
+            self._reserved.pop(screen, None)
+            self._release(screen, time.monotonic())
+
+    def give_back(self, screen):
+        """Undo pop_for for a video screen never got to play: queue it again at its priority, without a cooldown."""
+        with self._lock:
+            self._reserved.pop(screen, None)
+            vid = self._playing.pop(screen, None)
+            claimed = self._claimed.pop(screen, None)
+            if vid is None:
+                return
+            self._on_screen.discard(vid)
+            if claimed is not None and vid not in self._entries:
+                self._add(vid, *claimed)
+
+    def _release(self, screen, now):
+        self._claimed.pop(screen, None)
+        vid = self._playing.pop(screen, None)
+        if vid is not None:
+            self._on_screen.discard(vid)
+            self._recent.pop(vid, None)  # Re-insert so _recent stays ordered by time
+            self._recent[vid] = now
+
+    def priority(self, url):
+        """Priority url is queued at, or None if it is not in the queue."""
+        with self._lock:
+            entry = self._entries.get(video_id(url))
+            return entry[0] if entry is not None else None
+
+    def queued(self):
+        """URLs waiting to play, including those still cooling down, in no particular order."""
+        with self._lock:
+            return [entry[3] for entry in self._entries.values()] + [url for url, _ in self._deferred.values()]
+
+    def is_playing(self, url):
+        with self._lock:
+            return video_id(url) in self._on_screen
+
+    def playing(self):
+        with self._lock:
+            return dict(self._playing)
+
+    def clear_playing(self):
+        with self._lock:
+            self._playing.clear()
+            self._claimed.clear()
+            self._on_screen.clear()
+            self._reserved.clear()
+
+    def snapshot(self):
+        """The queue and the cooldowns as plain data, for a warm restart; cooldowns as seconds ago."""
+        now = time.monotonic()
+        with self._lock:
+            queued = sorted(self._entries.values())  # Priority, then insertion order
+            return {
+                'queued': [[entry[3], entry[0]] for entry in queued],
+                'deferred': [[url, priority] for url, priority in self._deferred.values()],
+                'recent': [[vid, round(now - stopped_at, 1)] for vid, stopped_at in self._recent.items()],
+            }
+
+    def restore(self, state, downtime=0.0):
+        """Load a snapshot() back; the downtime since it was taken counts towards the cooldowns."""
+        now = time.monotonic()
+        with self._lock:
+            for vid, ago in state.get('recent', []):
+                self._recent[vid] = now - ago - downtime
+            for url, priority in state.get('queued', []):
+                self._add(video_id(url), url, priority)
+            for url, priority in state.get('deferred', []):
+                if video_id(url) in self._recent:
+                    self._deferred[video_id(url)] = (url, priority)
+                else:
+                    self._add(video_id(url), url, priority)
+            self._expire_cooldowns(now)
@@ -0,0 +1,320 @@
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+from collections import deque
+
+from logger import logger
+from metrics import registry
+from monitor_manager import ScreenSupervisor, apply_live_settings, close_monitor
+from utility_helpers import config
+
+WORKER_HEARTBEAT_TIMEOUT = config.get('WORKER_HEARTBEAT_TIMEOUT', 30)  # Silence after which a worker counts as hung
+WORKER_START_TIMEOUT = config.get('WORKER_START_TIMEOUT', 60)  # Time a new worker gets to bring its browser up
+WORKER_STOP_TIMEOUT = 10
+WORKER_EXIT_GRACE = 2
+WATCHDOG_INTERVAL = 1
+MAX_RESPAWN_DELAY = 60
+BROWSER_GONE_EXIT = 3  # Exit code of a worker whose browser died under it
+
+WORKER_RESPAWNS = registry.counter('screen_worker_respawns_total', 'Screen worker processes restarted, by cause',
+                                   ('reason',))
+SCREEN_RECOVERY_SECONDS = registry.histogram('screen_recovery_seconds',
+                                             'Time from a screen worker going silent to its replacement playing')
+
+# Spawned rather than forked: the manager process runs an event loop and threads a fork would copy mid-flight
+_context = multiprocessing.get_context('spawn')
+
+
+class BrowserGone(Exception):
+    pass
+
+
+class ScreenWorker(ScreenSupervisor):
+    """Worker-process side of a screen: runs the usual playback loop, but asks the manager for its videos.
+
+    Every message other than a log record carries the screen's current state and doubles as a heartbeat;
+    the manager answers a heartbeat with the commands queued for this screen, such as reloaded config
+    values. Log records go to the manager too, so they end up in its log file. When a browser command
+    fails the session is checked, and a dead browser ends the worker so the manager starts a fresh one.
+    """
+
+    def __init__(self, monitor, conn, stop_event, send_lock=None):
+        self.monitor = monitor
+        self.conn = conn
+        self.stop_event = stop_event
+        self.send_lock = send_lock or threading.Lock()  # Shared with the PipeLogHandler writing to conn
+        self.errors_checked = 0
+
+    def send(self, kind, *args):
+        state = {'current_url': self.monitor.current_url, 'preloaded_url': self.monitor.preloaded_url,
+                 'probe_stats': self.monitor.probe_stats, 'position': self.monitor.playback_position()}
+        with self.send_lock:
+            self.conn.send((kind, state) + args)
+
+    def request(self, kind, *args):
+        self.send(kind, *args)
+        return self.conn.recv()
+
+    def is_stopped(self):
+        if self.stop_event.is_set():
+            return True  # The browser is being closed on purpose
+        if self.monitor.browser_errors > self.errors_checked:
+            self.errors_checked = self.monitor.browser_errors
+            if not self.monitor.is_responsive():
+                raise BrowserGone(f"{self.monitor.name} browser stopped responding")
+        for command, argument in self.request('heartbeat'):
+            if command == 'config':
+                apply_live_settings(argument)
+                if 'BROWSER_WINDOW_SIZE' in argument:
+                    self.monitor.place_window()
+        return self.stop_event.is_set()
+
+    def claim_next_video(self, monitor):
+        return self.request('claim')
+
+    def give_back_video(self, monitor):
+        self.send('give_back')
+
+    def peek_next_video(self, monitor):
+        return self.request('peek')
+
+    def record_attempt(self, video_url, failure, first_frame=None):
+        return self.request('attempt', video_url, failure, first_frame)
+
+    def record_rotation(self, monitor, reason):
+        self.send('rotation', reason)
+
+
+class PipeLogHandler(logging.Handler):
+    """Send a worker's log records to the manager, which hands them to its own logging pipeline."""
+
+    def __init__(self, conn, send_lock):
+        super().__init__()
+        self.conn = conn
+        self.send_lock = send_lock
+
+    def emit(self, record):
+        try:
+            # Formatted here, like QueueHandler.prepare, so arguments and tracebacks need not be picklable
+            message = dict(record.__dict__, msg=self.format(record), args=None, exc_info=None, exc_text=None)
+            with self.send_lock:
+                self.conn.send(('log', None, message))
+        except OSError:
+            pass  # The manager is gone, and its log with it
+        except Exception:
+            self.handleError(record)
+
+
+def watch_stop(stop_reader, stop_event, monitor):
+    """Turn the manager closing its end of the stop pipe into stop_event, and quit the browser right away.
+
+    A pipe rather than a multiprocessing.Event: setting one of those blocks on waiters that were killed.
+    The pipe also reports EOF when the manager dies, so an orphaned worker stops as well.
+    """
+    try:
+        stop_reader.recv()
+    except EOFError:
+        pass
+    stop_event.set()
+    close_monitor(monitor)
+
+
+def run_screen_worker(driver_name, screen, name, conn, stop_reader, log_level, driver_factory=None):
+    """Entry point of a screen's worker process: open the browser on screen and play until told to stop."""
+    if hasattr(os, 'setsid'):
+        os.setsid()  # Own process group, so the manager can take the browser down along with a hung worker
+    send_lock = threading.Lock()
+    root = logging.getLogger()
+    root.addHandler(PipeLogHandler(conn, send_lock))
+    root.setLevel(log_level)
+
+    import monitor_manager
+    if driver_factory is not None:
+        monitor_manager.create_driver = driver_factory
+    monitor = monitor_manager.init_monitor(driver_name, screen, name)
+    stop_event = threading.Event()
+    worker = ScreenWorker(monitor, conn, stop_event, send_lock)
+    # Quitting the browser as soon as stop is requested also ends any command the playback loop is waiting on
+    threading.Thread(target=watch_stop, args=(stop_reader, stop_event, monitor), daemon=True).start()
+    try:
+        worker.send('ready')
+        worker.play_video_in_monitor(monitor)
+    except BrowserGone as e:
+        logger.error(f"{e}; exiting for a respawn")
+        sys.exit(BROWSER_GONE_EXIT)
+    except (EOFError, OSError):
+        pass  # The manager went away
+    finally:
+        if not stop_event.is_set():
+            close_monitor(monitor)
+
+
+class ScreenProcess:
+    """Manager-side handle of one screen's worker process.
+
+    Stands in for a Monitor in MonitorManager.monitors: the scheduler claims videos for it, and it mirrors
+    the worker's current and preloaded video. supervise() answers the worker's requests and acts as its
+    watchdog, replacing a worker that exits or stops sending heartbeats. The replacement reopens the
+    browser on the screen geometry the first one was placed on.
+    """
+
+    def __init__(self, manager, driver_name, screen, name, driver_factory=None):
+        self.manager = manager
+        self.driver_name = driver_name
+        self.screen = screen
+        self.name = name
+        self.driver_factory = driver_factory  # Picklable create_driver replacement, used by the benchmarks
+        self.stop_writer = None  # Closed to tell the worker to stop
+        self.current_url = None
+        self.preloaded_url = None
+        self.position = None  # Playback position the worker last reported, and when
+        self.position_at = time.monotonic()
+        self.probe_stats = {'probes': 0, 'failures': 0, 'latency_total': 0.0, 'latency_max': 0.0}
+        self.process = None
+        self.conn = None
+        self.ready = False
+        self.disconnected = False
+        self.last_seen = time.monotonic()
+        self.failed_at = None  # Last sign of life of a worker that is being replaced
+        self.failed_starts = 0
+        self.respawns = 0
+        self.recoveries = []  # Seconds each replacement took to get a video playing
+        self.commands = deque()  # Sent to the worker with the answer to its next heartbeat
+        self._killed = None
+        self._lock = threading.Lock()
+
+    def spawn(self):
+        with self._lock:
+            if self.manager.is_stopped():
+                return
+            parent_conn, child_conn = _context.Pipe()
+            stop_reader, stop_writer = _context.Pipe(duplex=False)
+            self.process = _context.Process(
+                target=run_screen_worker, name=f"{self.name}-worker", daemon=True,
+                args=(self.driver_name, self.screen, self.name, child_conn, stop_reader,
+                      logging.getLogger().getEffectiveLevel(), self.driver_factory))
+            self.process.start()
+            child_conn.close()
+            stop_reader.close()
+            for old in (self.conn, self.stop_writer):
+                if old is not None:
+                    old.close()
+            self.conn, self.stop_writer = parent_conn, stop_writer
+            self.ready = False
+            self.disconnected = False
+            self.last_seen = time.monotonic()
+        logger.info(f"Started worker process {self.process.pid} for {self.name}")
+
+    def kill(self):
+        with self._lock:
+            process = self.process
+            if process is None or process is self._killed:
+                return  # Its pid may already belong to someone else
+            try:
+                if hasattr(os, 'killpg'):
+                    # The whole group, so a browser left behind by a crashed worker goes too
+                    os.killpg(process.pid, signal.SIGKILL)
+                else:
+                    process.kill()
+            except ProcessLookupError:
+                pass
+            process.join(WORKER_STOP_TIMEOUT)
+            self._killed = process
+
+    def failure(self):
+        """Why the worker needs replacing ('exited' or 'hung'), or None while it is fine."""
+        if self.disconnected or not self.process.is_alive():
+            return 'exited'
+        limit = WORKER_HEARTBEAT_TIMEOUT if self.ready else WORKER_START_TIMEOUT
+        if time.monotonic() - self.last_seen > limit:
+            return 'hung'
+        return None
+
+    def respawn(self, reason):
+        if self.failed_at is None:
+            self.failed_at = self.last_seen
+        if reason == 'exited':
+            self.process.join(WORKER_EXIT_GRACE)  # Let it finish closing its browser before the group is killed
+        self.kill()
+        logger.error(f"{self.name} worker {reason} (exit code {self.process.exitcode}); respawning")
+        WORKER_RESPAWNS.inc(reason=reason)
+        self.manager.scheduler.release(self)
+        self.current_url = self.preloaded_url = self.position = None
+        self.respawns += 1
+        if not self.ready:
+            # The last replacement never came up either; back off instead of relaunching in a tight loop
+            self.failed_starts += 1
+            self.manager.stop_event.wait(min(2 ** self.failed_starts, MAX_RESPAWN_DELAY))
+        self.spawn()
+
+    def playback_position(self):
+        if self.current_url is None or self.position is None:
+            return None
+        return self.position + time.monotonic() - self.position_at
+
+    def handle(self, message):
+        kind, state, *args = message
+        if kind == 'log':
+            # Not a heartbeat: a worker's other threads may still log while its playback loop hangs
+            logging.getLogger(args[0]['name']).handle(logging.makeLogRecord(args[0]))
+            return
+        self.last_seen = time.monotonic()
+        self.current_url, self.preloaded_url = state['current_url'], state['preloaded_url']
+        self.position, self.position_at = state['position'], self.last_seen
+        self.probe_stats = state['probe_stats']
+        if kind == 'heartbeat':
+            commands = []
+            while self.commands:
+                commands.append(self.commands.popleft())
+            self.conn.send(commands)
+        elif kind == 'ready':
+            self.ready = True
+            self.failed_starts = 0
+        elif kind == 'claim':
+            self.conn.send(self.manager.claim_next_video(self))
+        elif kind == 'give_back':
+            self.manager.give_back_video(self)
+        elif kind == 'peek':
+            self.conn.send(self.manager.peek_next_video(self))
+        elif kind == 'attempt':
+            played = self.manager.record_attempt(*args)
+            if played and self.failed_at is not None:
+                recovery = time.monotonic() - self.failed_at
+                self.failed_at = None
+                self.recoveries.append(recovery)
+                SCREEN_RECOVERY_SECONDS.observe(recovery)
+                logger.info(f"{self.name} recovered in {recovery:.1f} s")
+            self.conn.send(played)
+        elif kind == 'rotation':
+            self.manager.record_rotation(self, args[0])
+
+    def supervise(self):
+        """Serve the worker and watch it until the manager stops."""
+        self.spawn()
+        while not self.manager.is_stopped():
+            try:
+                if self.conn.poll(WATCHDOG_INTERVAL):
+                    self.handle(self.conn.recv())
+                    continue
+            except (EOFError, OSError):
+                self.disconnected = True
+            reason = self.failure()
+            if reason and not self.manager.is_stopped():
+                self.respawn(reason)
+
+    def send_config(self, changes):
+        if changes:
+            self.commands.append(('config', changes))
+
+    def close(self):
+        """Ask the worker to close its browser, and kill it if it does not exit in time."""
+        for conn in (self.stop_writer, self.conn):
+            if conn is not None:
+                conn.close()  # Closing conn too wakes a worker waiting for an answer
+        if self.process is not None:
+            self.process.join(WORKER_STOP_TIMEOUT)
+        self.kill()
@@ -0,0 +1,58 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from logger import logger
+
+
+class StartupTimer:
+    """Collects wall-clock spans for startup phases.
+
+    A phase entered several times (e.g. once per browser, from several threads) is reported as one span
+    from its earliest start to its latest end, so overlapping phases show up as overlapping.
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.spans = {}  # phase -> [start, end]
+        self._lock = threading.Lock()
+
+    def start(self, phase):
+        now = time.perf_counter()
+        with self._lock:
+            span = self.spans.setdefault(phase, [now, None])
+            span[0] = min(span[0], now)
+
+    def stop(self, phase):
+        now = time.perf_counter()
+        with self._lock:
+            span = self.spans.setdefault(phase, [now, now])
+            span[1] = now if span[1] is None else max(span[1], now)
+
+    @contextmanager
+    def phase(self, name):
+        self.start(name)
+        try:
+            yield
+        finally:
+            self.stop(name)
+
+    def mark(self, phase):
+        """Record a phase that ends now and started when the process did, e.g. the first frame on screen."""
+        with self._lock:
+            if phase in self.spans:
+                return False
+            self.spans[phase] = [self.origin, time.perf_counter()]
+            return True
+
+    def report(self):
+        lines = ["Startup timing (seconds from process start):", f"{'phase':<18}{'start':>8}{'end':>8}{'took':>8}"]
+        with self._lock:
+            spans = sorted(self.spans.items(), key=lambda item: item[1][0])
+        for name, (start, end) in spans:
+            end = end if end is not None else start
+            lines.append(f"{name:<18}{start - self.origin:>8.2f}{end - self.origin:>8.2f}{end - start:>8.2f}")
+        return "\n".join(lines)
+
+
+startup_timer = StartupTimer()
@@ -1,7 +1,7 @@
 import json
 import logging
 import os
-import sys
+import tempfile
 
 # Default config initialization
 DEFAULT_CONFIG = {
@@ -16,30 +16,78 @@ DEFAULT_CONFIG = {
 }
 
 CONFIG_FILE = "config.json"
+logger = logging.getLogger(__name__)
+_config = None
+_config_file = CONFIG_FILE
+
+
+def load_config(filename=CONFIG_FILE, create_missing=False):
+    """Read the config file once and return the shared dict.
+
+    Nothing is read at import time; the first caller (normally bootstrap) loads the file and every later
+    caller gets the same object. With create_missing the file is written with default values if absent.
+    """
+    global _config, _config_file
+    if _config is None:
+        _config_file = filename
+        if not os.path.exists(filename):
+            if not create_missing:
+                return dict(DEFAULT_CONFIG)
+            with open(filename, "w") as file:
+                json.dump(DEFAULT_CONFIG, file)
+            logging.warning(f"{filename} not found. A new file has been created with default values.")
+        with open(filename, "r") as file:
+            _config = json.load(file)
+    return _config
+
+
+def config_mtime(filename=None):
+    try:
+        return os.stat(filename or _config_file).st_mtime_ns
+    except OSError:
+        return None
 
-# Check if the config file exists, if not create it with default values
-if not os.path.exists(CONFIG_FILE):
-    with open(CONFIG_FILE, "w") as file:
-        json.dump(DEFAULT_CONFIG, file)
-    logging.warning(f"{CONFIG_FILE} not found. A new file has been created with default values.")
 
-# Load the config file
-with open(CONFIG_FILE, "r") as file:
-    config = json.load(file)
+def reload_config(filename=None):
+    """Re-read the config file into the shared dict, in place so every holder sees the new values.
+
+    Returns {key: new value} for each key that changed, with None for removed keys. A file that cannot be
+    read (e.g. caught half written) leaves the config as it was.
+    """
+    global _config
+    filename = filename or _config_file
+    try:
+        with open(filename, "r") as file:
+            data = json.load(file)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Could not reload {filename}: {e}")
+        return {}
+    if _config is None:
+        _config = data
+        return {}
+    changes = {key: data.get(key) for key in set(_config) | set(data) if _config.get(key) != data.get(key)}
+    _config.clear()
+    _config.update(data)
+    return changes
 
-JSON_FILE = config['JSON_FILE']
-logger = logging.getLogger(__name__)
 
-# Check if the JSON file exists, if not create it with an empty object
-if not os.path.exists(JSON_FILE):
-    with open(JSON_FILE, "w") as file:
-        json.dump({}, file)
-    logger.debug(f"{JSON_FILE} not found. A new file has been created.")
+def get_json_file():
+    return load_config().get('JSON_FILE', DEFAULT_CONFIG['JSON_FILE'])
+
+
+def __getattr__(name):
+    # `config` and `JSON_FILE` resolve lazily so importing this module has no side effects
+    if name == 'config':
+        return load_config()
+    if name == 'JSON_FILE':
+        return get_json_file()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # ----------- UTILITY FUNCTIONS -------------
-def save_to_json(data, key=None, filename=JSON_FILE):
+def save_to_json(data, key=None, filename=None):
     """Save data to a JSON file under a specific key or replace the entire content if no key is provided."""
+    filename = filename or get_json_file()
     existing_data = load_from_json(filename) or {}
 
     if key:
@@ -47,13 +95,13 @@ def save_to_json(data, key=None, filename=JSON_FILE):
     else:
         existing_data = data
 
-    with open(filename, 'w') as f:
-        json.dump(existing_data, f)
+    write_json_atomic(existing_data, filename)
     logger.debug(f"Saved data to {filename}")
 
 
-def append_or_save_to_json(data, key, filename=JSON_FILE, append=False):
+def append_or_save_to_json(data, key, filename=None, append=False):
     """Append or save data to a JSON file under a specific key."""
+    filename = filename or get_json_file()
     existing_data = load_from_json(filename) or {}
 
     if append and key in existing_data:
@@ -61,24 +109,36 @@ def append_or_save_to_json(data, key, filename=JSON_FILE, append=False):
     else:
         existing_data[key] = data
 
-    with open(filename, 'w') as f:
-        json.dump(existing_data, f)
+    write_json_atomic(existing_data, filename)
     logger.debug(f"Appended data to {filename}" if append else f"Saved data to {filename}")
 
 
-def load_from_json(filename=JSON_FILE):
+def write_json_atomic(data, filename=None):
+    """Write data to a JSON file through a temp file and an atomic rename, so a crash never leaves it half written."""
+    filename = filename or get_json_file()
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(filename)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, filename)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def load_from_json(filename=None):
     """Load data from a JSON file."""
+    filename = filename or get_json_file()
     try:
         with open(filename, 'r') as f:
             return json.load(f)
+    except FileNotFoundError:
+        logger.debug(f"{filename} not found, starting with an empty cache.")
+        return {}
     except json.JSONDecodeError:
         # Return an empty dictionary if there's a JSON decode error
         return {}
-
-
-def load_config():
-    with open("config.json", "r") as file:
-        c = json.load(file)
-
-    debug_mode = "--debug" in sys.argv or "-d" in sys.argv
-    return c, debug_mode
@@ -0,0 +1,128 @@
+import re
+import time
+
+from cacher import get_cache_manager, CacheManager
+from logger import logger
+from metrics import registry
+from scheduler import video_id
+from utility_helpers import config
+
+METADATA_CACHE_KEY = 'video_metadata'
+LIVE_METADATA_TTL = config.get('LIVE_METADATA_TTL', 300)  # A live stream can end at any moment
+REGION_CODE = config.get('REGION_CODE')  # Region restrictions are only checked when this is set
+DEFAULT_PLANNING_SECONDS = 600  # Assumed length of live streams and videos whose duration is unknown
+DURATION_PATTERN = re.compile(r'P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$')
+
+METADATA_LOOKUPS = registry.counter('video_metadata_lookups_total', 'Metadata cache lookups by result', ('result',))
+UNPLAYABLE = registry.counter('videos_unplayable_total', 'Videos dropped before playback, by reason', ('reason',))
+
+
+def parse_duration(value):
+    """Seconds in an ISO 8601 duration such as 'PT1H2M3S'; None if it cannot be parsed."""
+    match = DURATION_PATTERN.match(value or '')
+    if not match:
+        return None
+    days, hours, minutes, seconds = (int(part or 0) for part in match.groups())
+    return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+
+def summarize(item, now=None):
+    """The fields of a videos.list item that decide whether and how long a video plays."""
+    details = item.get('contentDetails', {})
+    status = item.get('status', {})
+    restriction = details.get('regionRestriction', {})
+    return {
+        'duration': parse_duration(details.get('duration')),
+        'live': item.get('snippet', {}).get('liveBroadcastContent', 'none'),
+        'embeddable': status.get('embeddable', True),
+        'privacy': status.get('privacyStatus', 'public'),
+        'upload_status': status.get('uploadStatus', 'processed'),
+        'allowed_regions': restriction.get('allowed'),
+        'blocked_regions': restriction.get('blocked', []),
+        'fetched_at': now or time.time(),
+    }
+
+
+def unplayable_reason(info, region=REGION_CODE):
+    """Why a video cannot play in an embed, or None if it can."""
+    if info.get('missing'):
+        return 'missing'
+    if not info['embeddable']:
+        return 'not_embeddable'
+    if info['privacy'] == 'private':
+        return 'private'
+    if info['upload_status'] not in ('processed', 'uploaded'):
+        return 'not_processed'
+    if info['live'] == 'upcoming':
+        return 'upcoming'
+    if region and (region in info['blocked_regions']
+                   or (info['allowed_regions'] is not None and region not in info['allowed_regions'])):
+        return 'region_blocked'
+    return None
+
+
+def planned_seconds(info):
+    """How long a video is expected to hold a screen."""
+    if info is None or info.get('live') == 'live' or not info.get('duration'):
+        return DEFAULT_PLANNING_SECONDS
+    return info['duration']
+
+
+class MetadataCache:
+    """Per-video metadata kept in the shared cache under 'video_metadata', with its own TTL.
+
+    Entries of live broadcasts expire after LIVE_METADATA_TTL so a stream that ended is noticed quickly.
+    Videos the API did not return (deleted or private) are cached as missing.
+    """
+
+    def __init__(self, cache_manager=None, ttl=None):
+        self.cache_manager = cache_manager or get_cache_manager()
+        self.ttl = ttl or CacheManager.ttl_for(METADATA_CACHE_KEY)
+
+    def _videos(self):
+        return (self.cache_manager.load_from_cache(METADATA_CACHE_KEY) or {}).get('videos', {})
+
+    def _expired(self, info, now):
+        ttl = min(self.ttl, LIVE_METADATA_TTL) if info.get('live') == 'live' else self.ttl
+        return now - info['fetched_at'] >= ttl
+
+    def get(self, url):
+        """Cached metadata of the video at url, or None if unknown or expired."""
+        info = self._videos().get(video_id(url))
+        if info is None or self._expired(info, time.time()):
+            return None
+        return info
+
+    def missing(self, urls):
+        """Video IDs among urls that need a (re)fetch."""
+        videos = self._videos()
+        now = time.time()
+        ids = dict.fromkeys(video_id(url) for url in urls)
+        missing = [vid for vid in ids if vid not in videos or self._expired(videos[vid], now)]
+        METADATA_LOOKUPS.inc(len(ids) - len(missing), result='hit')
+        METADATA_LOOKUPS.inc(len(missing), result='miss')
+        return missing
+
+    def update(self, entries):
+        # Save a new dict rather than mutating the cached one, which a flush may be serialising
+        now = time.time()
+        videos = {vid: info for vid, info in self._videos().items() if not self._expired(info, now)}
+        videos.update(entries)
+        self.cache_manager.save_to_cache({'videos': videos, 'updated_at': now}, key=METADATA_CACHE_KEY)
+        self.cache_manager.expiry[METADATA_CACHE_KEY] = now + self.ttl
+
+
+async def enrich_videos(urls, metadata=None):
+    """Look up metadata for every url the cache does not cover, at 50 IDs per videos.list call."""
+    from youtube_api import fetch_video_details
+
+    metadata = metadata or MetadataCache()
+    ids = metadata.missing(urls)
+    if not ids:
+        return metadata
+    details = await fetch_video_details(ids)
+    now = time.time()
+    metadata.update({vid: summarize(item, now) if item is not None else {'missing': True, 'fetched_at': now}
+                     for vid, item in details.items()})
+    logger.info(f"Fetched metadata for {len(details)} of {len(ids)} videos.")
+    return metadata
@@ -0,0 +1,63 @@
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from logger import logger
+from metrics import registry
+from utility_helpers import config, load_from_json, write_json_atomic
+
+SNAPSHOT_FILE = config.get('SNAPSHOT_FILE', 'playback_snapshot.json')  # Empty disables warm restarts
+SNAPSHOT_INTERVAL = config.get('SNAPSHOT_INTERVAL', 10)  # Seconds between snapshots while the wall plays
+SNAPSHOT_MAX_AGE = config.get('SNAPSHOT_MAX_AGE', 3600)  # Older snapshots are ignored and the wall starts afresh
+SNAPSHOT_VERSION = 1
+
+SNAPSHOT_WRITE_SECONDS = registry.histogram('playback_snapshot_write_seconds', 'Time to write a playback snapshot')
+
+
+def with_start(url, seconds):
+    """url with the embed start parameter set to whole seconds, or without one when seconds is falsy."""
+    parts = urlsplit(url)
+    query = [(key, value) for key, value in parse_qsl(parts.query) if key != 'start']
+    if seconds and seconds >= 1:
+        query.append(('start', str(int(seconds))))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def start_offset(url):
+    """The start parameter of an embed URL in seconds, 0 if it has none."""
+    for key, value in parse_qsl(urlsplit(url).query):
+        if key == 'start' and value.isdigit():
+            return int(value)
+    return 0
+
+
+def write_snapshot(state, filename=None):
+    filename = filename or SNAPSHOT_FILE
+    if not filename:
+        return
+    started = time.perf_counter()
+    write_json_atomic({**state, 'version': SNAPSHOT_VERSION, 'saved_at': time.time()}, filename)
+    SNAPSHOT_WRITE_SECONDS.observe(time.perf_counter() - started)
+
+
+def read_snapshot(channel_ids=None, filename=None, max_age=None):
+    """The last snapshot written, or None if there is none, it is unreadable, older than max_age seconds
+    or, when channel_ids is given, taken while other channels were playing."""
+    filename = filename or SNAPSHOT_FILE
+    max_age = SNAPSHOT_MAX_AGE if max_age is None else max_age
+    if not filename:
+        return None
+    try:
+        snapshot = load_from_json(filename)
+    except (OSError, ValueError) as e:
+        logger.error(f"Error reading playback snapshot {filename}: {e}")
+        return None
+    if not snapshot or snapshot.get('version') != SNAPSHOT_VERSION:
+        return None
+    age = time.time() - snapshot.get('saved_at', 0)
+    if age > max_age:
+        logger.info(f"Playback snapshot is {age / 60:.0f} min old; starting afresh")
+        return None
+    if channel_ids is not None and snapshot.get('channels') != list(channel_ids):
+        logger.info("Playback snapshot is for other channels; starting afresh")
+        return None
+    return snapshot
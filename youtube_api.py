@@ -1,55 +1,231 @@
 import asyncio
 import json
-import logging
 import os
 import random
-import sys
 import time
+from collections import namedtuple
 
 import aiohttp
 
-from cacher import CacheManager
+from cacher import get_cache_manager, FRESH, STALE
 from logger import logger
-from utility_helpers import load_from_json, load_config
-
-config, DEBUG_MODE = load_config()
-
-if sys.platform == 'win32':
-    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
-
-API_KEY = os.environ.get('API_KEY') or config['API_KEY']  # <-- Modify this line
-if not API_KEY:
-    logging.error("API key not provided in config or environment variable.")
-    sys.exit(1)
+from metrics import registry
+from negative_cache import get_negative_cache
+from refresh_scheduler import get_quota_budget
+from utility_helpers import config
 
+# Checked by bootstrap, which refuses to start without it
+API_KEY = os.environ.get('API_KEY') or config.get('API_KEY')
 BASE_URL = config['BASE_URL']
 CHANNEL_ID = config['CHANNEL_ID']
-CHANNEL = config['CHANNEL']
+CHANNEL = config.get('CHANNEL', '')
 BROWSER_WINDOW_SIZE = tuple(config['BROWSER_WINDOW_SIZE'])
 LIVE_VIDEOS_LIMIT = config.get('LIVE_VIDEOS_LIMIT', 10)
-VIDEO_CACHE = load_from_json() or {}
 POPULAR_VIDEOS_LIMIT = config.get('POPULAR_VIDEOS_LIMIT', 100)
-cache_manager = CacheManager(load_from_json())
+API_MAX_CONCURRENCY = config.get('API_MAX_CONCURRENCY', 4)
+API_TIMEOUT = config.get('API_TIMEOUT', 10)
+API_RETRIES = config.get('API_RETRIES', 3)
+API_BACKOFF = config.get('API_BACKOFF', 0.5)
+POPULAR_STARTUP_PAGES = config.get('POPULAR_STARTUP_PAGES', 1)
+PAGE_RETRY_BACKOFF = config.get('PAGE_RETRY_BACKOFF', 60)  # Seconds before a failed page is requested again
+PAGE_RETRY_MAX_BACKOFF = config.get('PAGE_RETRY_MAX_BACKOFF', 3600)
+PAGE_MAX_FAILURES = config.get('PAGE_MAX_FAILURES', 8)  # Failures in a row after which a paginator gives up
 random.seed(int(time.time()))
+SEARCH_QUOTA_COST = 100  # Quota units charged per search.list call
+VIDEOS_QUOTA_COST = 1  # Quota units charged per videos.list call, however many IDs it carries
+VIDEOS_BATCH_SIZE = 50  # Most IDs videos.list accepts in one call
+VIDEO_DETAIL_FIELDS = ('items(id,snippet/liveBroadcastContent,contentDetails(duration,regionRestriction),'
+                       'status(embeddable,privacyStatus,uploadStatus))')
+
+# A channel to pull videos from; weight sets its share of the popular rotation relative to the others
+Channel = namedtuple('Channel', ['id', 'name', 'weight'])
+
+
+def load_channels(channels_config=None):
+    """Channels from the CHANNELS config list, or just CHANNEL_ID/CHANNEL when it is not set."""
+    channels_config = channels_config or config.get('CHANNELS')
+    if not channels_config:
+        # Read again rather than taken from CHANNEL_ID, which keeps the bare cache keys for this run
+        return [Channel(config.get('CHANNEL_ID', CHANNEL_ID), config.get('CHANNEL', CHANNEL), 1.0)]
+    return [Channel(entry['id'], entry.get('name', ''), float(entry.get('weight', 1.0))) for entry in channels_config]
+
+
+CHANNELS = load_channels()
+
+API_LATENCY = registry.histogram('youtube_api_request_seconds', 'Latency of YouTube API request attempts',
+                                 ('outcome',))
+QUOTA_UNITS = registry.counter('youtube_quota_units_total', 'Estimated YouTube API quota units spent', ('method',))
+NOT_MODIFIED = registry.counter('youtube_api_not_modified_total', 'API requests answered 304 Not Modified')
+BYTES_SAVED = registry.counter('youtube_api_bytes_saved_total',
+                               'Response bytes 304 Not Modified answers saved over fetching the list again')
+
+
+class YouTubeApiError(Exception):
+    pass
+
+
+class TransientApiError(YouTubeApiError):
+    pass
+
+
+class MalformedResponseError(TransientApiError):
+    pass
+
+
+ApiResponse = namedtuple('ApiResponse', ['status', 'data', 'etag', 'size'])
+
+
+def cache_key_for(kind, channel_id=None):
+    """Cache key of a channel's 'live'/'viewCount' list; CHANNEL_ID keeps the bare keys of older caches."""
+    if channel_id is None or channel_id == CHANNEL_ID:
+        return kind
+    return f"{kind}:{channel_id}"
+
+
+class YouTubeClient:
+    """Long-lived, pooled HTTP client shared by every YouTube API call."""
+
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, base_url=BASE_URL, max_concurrency=API_MAX_CONCURRENCY, timeout=API_TIMEOUT,
+                 retries=API_RETRIES, backoff=API_BACKOFF):
+        self.base_url = base_url
+        self.max_concurrency = max_concurrency
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self._session = None
+        self._semaphore = None
+        self._loop = None
+        self.stats = {
+            'requests': 0,
+            'errors': 0,
+            'retries': 0,
+            'latency_total': 0.0,
+            'latency_max': 0.0,
+            'not_modified': 0,
+            'bytes_saved': 0,
+        }
+
+    def get_session(self):
+        # A session is bound to the loop that created it, so rebuild it if we are called from a new one
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            if self._session is not None and not self._session.closed:
+                self._discard_session()
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency, ttl_dns_cache=300, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._session
+
+    def _discard_session(self):
+        """Close the session of the previous loop there, or detach it if that loop is no longer running."""
+        if self._loop is not None and self._loop.is_running():
+            asyncio.run_coroutine_threadsafe(self._session.close(), self._loop)
+        else:
+            logger.warning("API session outlived its event loop; detaching it, its open connections are dropped.")
+            self._session.detach()
+
+    @staticmethod
+    def _check_shape(data):
+        """Raise MalformedResponseError unless data is an object whose items, if any, are objects."""
+        if not isinstance(data, dict):
+            raise MalformedResponseError(f"Malformed API response: expected an object, got {type(data).__name__}")
+        items = data.get('items', [])
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            raise MalformedResponseError("Malformed API response: items is not a list of objects")
+
+    def _record(self, started, failed=False, outcome='ok'):
+        latency = time.perf_counter() - started
+        API_LATENCY.observe(latency, outcome='error' if failed else outcome)
+        self.stats['requests'] += 1
+        self.stats['latency_total'] += latency
+        self.stats['latency_max'] = max(self.stats['latency_max'], latency)
+        if failed:
+            self.stats['errors'] += 1
+
+    async def request(self, params, headers=None, url=None):
+        """GET a YouTube API endpoint and return an ApiResponse; data is None on a 304 Not Modified."""
+        session = self.get_session()
+        last_error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.stats['retries'] += 1
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+            started = time.perf_counter()
+            try:
+                async with self._semaphore:
+                    async with session.get(url or self.base_url, params=params, headers=headers) as response:
+                        if response.status in self.RETRY_STATUSES:
+                            raise TransientApiError(f"Transient API error: HTTP {response.status}")
+                        if response.status >= 400:
+                            self._record(started, failed=True)
+                            raise YouTubeApiError(f"API request failed: HTTP {response.status}")
+                        etag = response.headers.get('ETag')
+                        if response.status == 304:
+                            self._record(started, outcome='not_modified')
+                            self.stats['not_modified'] += 1
+                            NOT_MODIFIED.inc()
+                            return ApiResponse(304, None, etag, 0)
+                        body = await response.text()
+                        data = json.loads(body)
+                        self._check_shape(data)
+                self._record(started)
+                return ApiResponse(response.status, data, etag or data.get('etag'), len(body))
+            except (TransientApiError, aiohttp.ClientError, asyncio.TimeoutError, json.JSONDecodeError) as e:
+                self._record(started, failed=True)
+                last_error = e
+            logger.warning(f"API request attempt {attempt + 1} failed: {last_error}")
+        raise YouTubeApiError(f"API request failed after {self.retries + 1} attempts: {last_error}")
+
+    def endpoint(self, name):
+        """URL of another Data API resource next to the search endpoint, e.g. 'videos'."""
+        return self.base_url.rsplit('/', 1)[0] + '/' + name
+
+    async def get_json(self, params, url=None):
+        return (await self.request(params, url=url)).data
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+api_client = YouTubeClient()
 
 
 # -------- YOUTUBE API HANDLING -----------
 
-async def fetch_videos(event_type=None, order=None, max_results=None, page_token=None, bypass_cache=False):
-    logger.info(f"Fetching videos with event_type: {event_type}, order: {order}")
-    cache_key = event_type or order
+async def fetch_videos(event_type=None, order=None, max_results=None, page_token=None, bypass_cache=False,
+                       channel_id=None):
+    urls, page_token = await _fetch_videos(event_type, order, max_results, page_token, bypass_cache, channel_id)
+    # Videos that failed to play stay in the cache but are left out until their retry time comes
+    return get_negative_cache().filter(urls), page_token
+
 
-    # Check cache
-    if not bypass_cache and cache_manager.is_cache_valid(cache_key):
+async def _fetch_videos(event_type, order, max_results, page_token, bypass_cache, channel_id):
+    logger.info(f"Fetching videos with event_type: {event_type}, order: {order}, channel: {channel_id or CHANNEL_ID}")
+    kind = event_type or order
+    cache_key = cache_key_for(kind, channel_id)
+    cache_manager = get_cache_manager()
+
+    # Check cache; stale entries are served immediately while a background refresh runs
+    cache_state = cache_manager.cache_state(cache_key)
+    if not bypass_cache and cache_state in (FRESH, STALE):
+        cached = cache_manager.load_from_cache(cache_key)
         logger.info(
-            f"Using cached {'popular' if cache_key == 'viewCount' else cache_key} videos. "
-            f"Last updated on {cache_manager.load_from_cache(cache_key)['last_updated']}")
-        return cache_manager.load_from_cache(cache_key)['urls'], page_token
+            f"Using {cache_state} cached {'popular' if kind == 'viewCount' else kind} videos ({cache_key}). "
+            f"Last updated on {cached['last_updated']}")
+        if cache_state == STALE:
+            revalidate_in_background(cache_key, event_type=event_type, order=order, max_results=max_results,
+                                     channel_id=channel_id)
+        return cached['urls'], cached.get('last_page_token', page_token)
 
     # Cache is invalid/inaccurate/bypassed
     params = {
         'part': 'id',
-        'channelId': CHANNEL_ID,
+        'channelId': channel_id or CHANNEL_ID,
         'type': 'video',
         'key': API_KEY
     }
@@ -65,27 +241,200 @@ async def fetch_videos(event_type=None, order=None, max_results=None, page_token
     params.update({key: value for key, value in [('maxResults', max_results), ('pageToken', page_token)] if value})
 
     # Logging statement
-    logger_msg = f"Making API call to fetch {'popular' if cache_key == 'viewCount' else event_type} videos."
+    logger_msg = f"Making API call to fetch {'popular' if kind == 'viewCount' else event_type} videos ({cache_key})."
     logger.info(logger_msg)
 
-    async with aiohttp.ClientSession() as session:
-        async with session.get(BASE_URL, params=params) as response:
-            data = await response.text()
-            json_data = json.loads(data)
-            next_page_token = json_data.get('nextPageToken', -1)
-            page_token = next_page_token
-            urls = ["https://www.youtube.com/embed/" + item['id']['videoId'] for item in json_data['items']]
+    # Only first-page lookups are revalidated; the stored ETag validates the first page kept next to it
+    first_page = not page_token
+    cached = cache_manager.load_from_cache(cache_key)
+    cached_first_page = cached.get('first_page') if cached and first_page else None
+    etag = cached.get('etag') if cached_first_page else None
+    headers = {'If-None-Match': etag} if etag else None
+
+    try:
+        # Every API call draws from the shared daily budget; when it is empty we keep serving the cache
+        if not get_quota_budget().try_consume(SEARCH_QUOTA_COST):
+            raise YouTubeApiError("Daily quota budget exhausted")
+        response = await api_client.request(params, headers=headers)
+        QUOTA_UNITS.inc(SEARCH_QUOTA_COST, method='search.list')
+    except YouTubeApiError as e:
+        logger.error(f"Error fetching videos: {e}")
+        if not bypass_cache and cached:
+            return cached.get('urls', []), page_token
+        return [], page_token
 
-    cache_manager.update_and_save_cache(urls, page_token, cache_key)
+    if response.status == 304:
+        logger.info(f"{cache_key} videos not modified, keeping cached list.")
+        api_client.stats['bytes_saved'] += cached.get('response_bytes', 0)
+        BYTES_SAVED.inc(cached.get('response_bytes', 0))
+        cache_manager.mark_fresh(cache_key)
+        return cached_first_page['urls'], cached_first_page['next_page_token']
+
+    json_data = response.data
+    page_token = json_data.get('nextPageToken', -1)
+    # Skip items without a videoId rather than dropping the whole page
+    video_ids = [item['id'].get('videoId') for item in json_data.get('items', []) if isinstance(item.get('id'), dict)]
+    urls = ["https://www.youtube.com/embed/" + video_id for video_id in video_ids if video_id]
+
+    if first_page:
+        cache_manager.update_and_save_cache(urls, page_token, cache_key, etag=response.etag,
+                                            response_bytes=response.size, first_page=True)
+    else:
+        cache_manager.update_and_save_cache(urls, page_token, cache_key)
 
     return urls, page_token
 
 
-async def fetch_live_videos():
-    urls, _ = await fetch_videos(event_type='live', max_results=LIVE_VIDEOS_LIMIT)
-    return urls
+_revalidations = {}
+
+
+def revalidate_in_background(cache_key, **fetch_kwargs):
+    """Refresh a stale cache key without blocking the caller; at most one refresh per key runs at a time."""
+    task = _revalidations.get(cache_key)
+    if task is not None and not task.done():
+        return task
+    logger.info(f"Refreshing stale {cache_key} cache in the background.")
+    task = asyncio.ensure_future(fetch_videos(bypass_cache=True, **fetch_kwargs))
+    _revalidations[cache_key] = task
+    return task
+
+
+async def paginate_videos(order='viewCount', max_results=POPULAR_VIDEOS_LIMIT, page_token=None, max_pages=None,
+                          prefetch=False, channel_id=None):
+    """Yield (urls, next_page_token) for successive pages, following nextPageToken until it runs out.
+
+    With prefetch enabled the request for the following page is started before the current one is yielded,
+    so a consumer that drains several pages back to back never waits on more than one round trip.
+
+    A failed page comes back with its own token, which a real page never does; for the first page that is
+    None, where a real first page brings a next token or -1. It is yielded empty and only requested again after PAGE_RETRY_BACKOFF seconds, doubling with every failure in a row; until then the
+    paginator yields empty pages without calling the API, and after PAGE_MAX_FAILURES it stops.
+    """
+    def request(token):
+        return asyncio.ensure_future(fetch_videos(order=order, max_results=max_results, page_token=token,
+                                                  bypass_cache=token is not None, channel_id=channel_id))
+
+    pages = failures = 0
+    retry_at = 0.0
+    token = page_token
+    pending = request(token)
+    try:
+        while True:
+            if pending is None:
+                if time.monotonic() < retry_at:
+                    yield [], token  # Backing off: nothing to hand out, and no quota spent on it
+                    continue
+                pending = request(token)
+
+            urls, next_page_token = await pending
+            pending = None
+            if next_page_token == token:
+                failures += 1
+                if failures >= PAGE_MAX_FAILURES:
+                    logger.error(f"Giving up on popular page {token} of {channel_id or CHANNEL_ID} "
+                                 f"after {failures} failures")
+                    return
+                backoff = min(PAGE_RETRY_BACKOFF * 2 ** (failures - 1), PAGE_RETRY_MAX_BACKOFF)
+                logger.warning(f"Popular page {token} of {channel_id or CHANNEL_ID} failed, retrying in {backoff}s")
+                retry_at = time.monotonic() + backoff
+                yield urls, token
+                continue
+
+            failures = 0
+            token = next_page_token
+            pages += 1
+            has_more = token not in (None, -1) and (max_pages is None or pages < max_pages)
+            if has_more and prefetch:
+                pending = request(token)
+            yield urls, token
+            if not has_more:
+                return
+            if pending is None:
+                pending = request(token)
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
 
 
-async def fetch_top_100_videos():
-    urls, _ = await fetch_videos(order='viewCount', max_results=POPULAR_VIDEOS_LIMIT)
+async def fetch_live_videos(channel_id=None):
+    urls, _ = await fetch_videos(event_type='live', max_results=LIVE_VIDEOS_LIMIT, channel_id=channel_id)
     return urls
+
+
+async def fetch_top_100_videos(pages=POPULAR_STARTUP_PAGES, channel_id=None):
+    urls = []
+    token = None
+    # The limit is passed rather than left to the default, which a config reload does not update
+    async for page_urls, next_token in paginate_videos(order='viewCount', max_results=POPULAR_VIDEOS_LIMIT,
+                                                       max_pages=pages, prefetch=True, channel_id=channel_id):
+        urls.extend(page_urls)
+        if next_token == token:
+            break  # The page failed; rather than wait out its backoff here, leave it to the next popular fetch
+        token = next_token
+    return list(dict.fromkeys(urls))
+
+
+async def fetch_channel_videos(channels=None):
+    """Fetch live and popular lists of every channel at once; returns {channel id: (live urls, popular urls)}.
+
+    All lookups run concurrently through api_client, whose semaphore allows API_MAX_CONCURRENCY requests in
+    flight. search.list takes a single channelId, so every channel costs its own requests: up to
+    API_MAX_CONCURRENCY of them share a round trip, and beyond that the time grows with the channel count.
+    """
+    channels = channels or CHANNELS
+    results = await asyncio.gather(*(asyncio.gather(fetch_live_videos(channel.id), fetch_top_100_videos(
+        channel_id=channel.id)) for channel in channels))
+    return {channel.id: tuple(result) for channel, result in zip(channels, results)}
+
+
+def rank_channel_videos(videos, channels=None, live=False):
+    """Merge per-channel video lists into (url, priority) pairs for the scheduler.
+
+    Live videos get priorities in [0, 1) and popular ones [1, 2), so any live stream plays first. Within a
+    band a channel's videos are spread evenly by position, compressed by its weight: a weight 2 channel
+    finishes its list in the first half of the band. Lists are shuffled first, like enqueue_videos does.
+    """
+    weights = {channel.id: channel.weight for channel in channels or CHANNELS}
+    ranked = []
+    for channel_id, urls in videos.items():
+        urls = list(urls)
+        if not live:
+            random.shuffle(urls)
+        weight = max(weights.get(channel_id, 1.0), 1e-6)
+        for position, url in enumerate(urls):
+            ranked.append((url, (0 if live else 1) + min(position / len(urls) / weight, 0.999)))
+    ranked.sort(key=lambda pair: pair[1])
+    return ranked
+
+
+async def fetch_video_details(video_ids):
+    """Look video_ids up with videos.list, VIDEOS_BATCH_SIZE IDs per call, all batches at once.
+
+    Returns {video id: item}; an ID the API did not return (deleted or private) maps to None. IDs of
+    batches that failed are left out, so they are retried on the next lookup instead of cached as missing.
+    """
+    batches = [video_ids[i:i + VIDEOS_BATCH_SIZE] for i in range(0, len(video_ids), VIDEOS_BATCH_SIZE)]
+    results = await asyncio.gather(*(_fetch_video_batch(batch) for batch in batches), return_exceptions=True)
+    details = {}
+    for batch, result in zip(batches, results):
+        if isinstance(result, Exception):
+            logger.error(f"Error fetching video details: {result}")
+            continue
+        items = {item.get('id'): item for item in result}
+        details.update({vid: items.get(vid) for vid in batch})
+    return details
+
+
+async def _fetch_video_batch(batch):
+    params = {
+        'part': 'snippet,contentDetails,status',
+        'id': ','.join(batch),
+        'maxResults': len(batch),
+        'fields': VIDEO_DETAIL_FIELDS,
+        'key': API_KEY
+    }
+    if not get_quota_budget().try_consume(VIDEOS_QUOTA_COST):
+        raise YouTubeApiError("Daily quota budget exhausted")
+    response = await api_client.request(params, url=api_client.endpoint('videos'))
+    QUOTA_UNITS.inc(VIDEOS_QUOTA_COST, method='videos.list')
+    return response.data.get('items', [])
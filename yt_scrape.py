@@ -1,44 +1,180 @@
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options as ChromeOptions
-from selenium.webdriver.firefox.options import Options as FirefoxOptions
-from selenium.webdriver.edge.options import Options as EdgeOptions
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as ec
+import asyncio
+import json
+import logging
+import re
+import threading
+import time
 
+from metrics import registry
 
-def monitor_youtube_streams(channel_name, driver_name='chrome', wait_time=10):
-    # Define the URL using the channel name
-    url = f'https://www.youtube.com/@{channel_name}/streams'
-
-    if driver_name == 'chrome':
-        options = ChromeOptions()
-        options.add_argument("--headless")
-        driver = webdriver.Chrome(options=options)
-    elif driver_name == 'firefox':
-        options = FirefoxOptions()
-        options.add_argument("--headless")
-        driver = webdriver.Firefox(options=options)
-    elif driver_name == 'edge':
-        options = EdgeOptions()
-        options.use_chromium = True
-        options.add_argument("--headless")
-        driver = webdriver.Edge(options=options)
+logger = logging.getLogger(__name__)
+
+YOUTUBE_URL = 'https://www.youtube.com'
+INITIAL_DATA_PATTERN = re.compile(r'(?:var ytInitialData|window\["ytInitialData"\])\s*=\s*')
+# Skip YouTube's cookie consent interstitial so the plain HTTP fetch gets the real page
+CONSENT_COOKIES = {'CONSENT': 'YES+', 'SOCS': 'CAI'}
+
+SCRAPE_SECONDS = registry.histogram('live_detection_seconds', 'Duration of live-stream count checks', ('backend',))
+
+
+def streams_url(channel_name):
+    return f'{YOUTUBE_URL}/@{channel_name}/streams'
+
+
+def count_grid_videos(initial_data):
+    """Count the videos in the rich grid of a ytInitialData blob, like counting ytd-rich-grid-media elements."""
+    count = 0
+    stack = [initial_data]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            item = node.get('richItemRenderer')
+            if isinstance(item, dict) and 'videoRenderer' in item.get('content', {}):
+                count += 1
+                continue
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(node)
+    return count
+
+
+def parse_initial_data(html):
+    match = INITIAL_DATA_PATTERN.search(html)
+    if not match:
+        raise ValueError("ytInitialData not found in page")
+    data, _ = json.JSONDecoder().raw_decode(html, match.end())
+    return data
+
+
+class BrowserLiveDetector:
+    """Counts streams by rendering the channel page in one persistent headless browser."""
+
+    def __init__(self, driver_name='chrome', wait_time=10):
+        self.driver_name = driver_name
+        self.wait_time = wait_time
+        self.driver = None
+        self._lock = threading.Lock()  # Channels are checked concurrently but share the one browser
+
+    def _create_driver(self):
+        # Selenium is imported only when the browser fallback is actually used
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options as ChromeOptions
+        from selenium.webdriver.edge.options import Options as EdgeOptions
+        from selenium.webdriver.firefox.options import Options as FirefoxOptions
+
+        if self.driver_name == 'chrome':
+            options = ChromeOptions()
+            options.add_argument("--headless")
+            return webdriver.Chrome(options=options)
+        elif self.driver_name == 'firefox':
+            options = FirefoxOptions()
+            options.add_argument("--headless")
+            return webdriver.Firefox(options=options)
+        elif self.driver_name == 'edge':
+            options = EdgeOptions()
+            options.use_chromium = True
+            options.add_argument("--headless")
+            return webdriver.Edge(options=options)
+        raise ValueError(f"Unsupported driver: {self.driver_name}")
+
+    def count_streams(self, channel_name):
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as ec
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        with self._lock:
+            if self.driver is None:
+                self.driver = self._create_driver()
+            try:
+                self.driver.get(streams_url(channel_name))
+
+                # Wait for the element 'ytd-rich-grid-media' to be present
+                WebDriverWait(self.driver, self.wait_time).until(
+                    ec.presence_of_element_located((By.CSS_SELECTOR, 'ytd-rich-grid-media'))
+                )
+
+                return self.driver.execute_script("return document.querySelectorAll('ytd-rich-grid-media').length")
+            except Exception:
+                # Throw the driver away so the next poll starts from a clean session
+                self.close()
+                raise
+
+    async def count_live(self, channel_name):
+        return await asyncio.get_running_loop().run_in_executor(None, self.count_streams, channel_name)
+
+    def close(self):
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            finally:
+                self.driver = None
+
+
+class HttpLiveDetector:
+    """Counts streams from the ytInitialData JSON embedded in the channel page, without a browser.
+
+    session_provider returns the app's shared aiohttp session. If the page cannot be fetched or parsed
+    the optional fallback detector is used instead.
+    """
+
+    def __init__(self, session_provider, fallback=None):
+        self.session_provider = session_provider
+        self.fallback = fallback
+
+    async def count_live(self, channel_name):
+        try:
+            session = self.session_provider()
+            async with session.get(streams_url(channel_name), cookies=CONSENT_COOKIES) as response:
+                response.raise_for_status()
+                html = await response.text()
+            return count_grid_videos(parse_initial_data(html))
+        except Exception as e:
+            if self.fallback is None:
+                raise
+            logger.warning(f"HTTP live detection failed ({e}), falling back to {type(self.fallback).__name__}")
+            return await self.fallback.count_live(channel_name)
+
+    def close(self):
+        if self.fallback is not None:
+            self.fallback.close()
+
+
+class LiveCounter:
+    """Applies per-channel count adjustments on top of a detection backend."""
+
+    def __init__(self, detector, adjustments=None):
+        self.detector = detector
+        self.adjustments = adjustments or {}
+
+    async def count_live(self, channel_name):
+        started = time.perf_counter()
+        try:
+            result = await self.detector.count_live(channel_name)
+        finally:
+            SCRAPE_SECONDS.observe(time.perf_counter() - started, backend=type(self.detector).__name__)
+        return result + self.adjustments.get(channel_name, 0)
+
+    def close(self):
+        self.detector.close()
+
+
+def create_live_detector(backend, driver_name, session_provider=None, adjustments=None):
+    if backend == 'http':
+        detector = HttpLiveDetector(session_provider, fallback=BrowserLiveDetector(driver_name))
+    elif backend == 'browser':
+        detector = BrowserLiveDetector(driver_name)
     else:
-        raise ValueError(f"Unsupported driver: {driver_name}")
+        raise ValueError(f"Unsupported live detector: {backend}")
+    return LiveCounter(detector, adjustments)
 
-    try:
-        # Navigate to the URL
-        driver.get(url)
 
-        # Wait for the element 'ytd-rich-grid-media' to be present
-        WebDriverWait(driver, wait_time).until(
-            ec.presence_of_element_located((By.CSS_SELECTOR, 'ytd-rich-grid-media'))
-        )
+_browser_detectors = {}
 
-        # Execute the JavaScript command and get the result
-        result = driver.execute_script("return document.querySelectorAll('ytd-rich-grid-media').length")
-    finally:
-        driver.quit()
 
-    return result - 1  # oceanexplorergov has a 'live' stream that's not actually live and this is fixing the inaccuracy
+def monitor_youtube_streams(channel_name, driver_name='chrome', wait_time=10):
+    # Kept for callers that want a blocking count; reuses one headless browser per driver type
+    detector = _browser_detectors.get(driver_name)
+    if detector is None:
+        detector = _browser_detectors[driver_name] = BrowserLiveDetector(driver_name, wait_time)
+    with SCRAPE_SECONDS.time(backend='monitor_youtube_streams'):
+        return detector.count_streams(channel_name)